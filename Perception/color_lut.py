@@ -0,0 +1,189 @@
+import json
+import os
+
+import cv2
+import numpy as np
+
+from Perception.frame_buffers import FrameBuffers
+
+
+# Bins per channel of a new table (64 bins = 4 BGR values per bin)
+DEFAULT_BINS = 64
+
+
+class ColorLUT:
+
+    def __init__(self, table, names):
+        """
+        Calibrated BGR -> class label table.
+        table = uint8 array (bins, bins, bins) indexed by the B, G, R
+                bins of a pixel, 0 = background, i + 1 = names[i]
+        names = object names the labels refer to
+        One lookup per pixel replaces the lighting normalization,
+        blur, HSV conversion and HSV thresholds.
+        """
+
+        bins = table.shape[0]
+
+        if table.shape != (bins, bins, bins) or bins & (bins - 1) or bins > 256:
+            raise ValueError(f"Color LUT must be a cube of 2^k bins, got {table.shape}")
+
+        if int(np.max(table)) > len(names):
+            raise ValueError("Color LUT has labels without an object name")
+
+        self.table = table
+        self.names = list(names)
+        self.bins = bins
+
+        # Flat view, stays backed by the memory map when loaded from disk
+        self.flat = np.asarray(table).reshape(-1)
+
+        # Per-channel contribution to the flat index
+        shift = 8 - (bins.bit_length() - 1)
+        values = np.arange(256, dtype=np.int32) >> shift
+        self.channel_luts = [
+            (values * bins * bins).reshape(1, 256),
+            (values * bins).reshape(1, 256),
+            values.reshape(1, 256)
+        ]
+
+    def bin_index(self, bgr, buffers=None):
+
+        # Flat table index of every pixel (int32)
+        if buffers is None:
+            buffers = FrameBuffers()
+
+        shape = bgr.shape[:2]
+        channel = buffers.get("lut.channel", shape)
+        index = buffers.get("lut.index", shape, np.int32)
+        part = buffers.get("lut.part", shape, np.int32)
+
+        for c, channel_lut in enumerate(self.channel_luts):
+            cv2.extractChannel(bgr, c, dst=channel)
+
+            if c == 0:
+                cv2.LUT(channel, channel_lut, dst=index)
+            else:
+                cv2.add(index, cv2.LUT(channel, channel_lut, dst=part), dst=index)
+
+        return index
+
+    # BGR image -> label map (uint8, 0 = background)
+    def classify(self, bgr, buffers=None):
+
+        if buffers is None:
+            buffers = FrameBuffers()
+
+        labels = buffers.get("labels", bgr.shape[:2])
+
+        # mode="clip" writes straight into labels (indices are in range)
+        return self.flat.take(self.bin_index(bgr, buffers), out=labels, mode="clip")
+
+    def save(self, path):
+
+        np.save(path, np.ascontiguousarray(self.table))
+
+        with open(names_path(path), "w") as f:
+            json.dump({"names": self.names, "bins": self.bins}, f, indent=4)
+
+
+def names_path(path):
+
+    # Object names are stored next to the table: color_lut.npy -> color_lut.json
+    return os.path.splitext(path)[0] + ".json"
+
+
+def load_color_lut(path):
+
+    # Memory-mapped, so startup does not read the whole table
+    table = np.load(path, mmap_mode="r")
+
+    with open(names_path(path)) as f:
+        names = json.load(f)["names"]
+
+    return ColorLUT(table, names)
+
+
+class ColorLUTBuilder:
+
+    def __init__(self, names, bins=DEFAULT_BINS, smoothing=1, min_samples=3):
+        """
+        Builds a ColorLUT from labelled sample frames.
+        names = object names, label i + 1 = names[i]
+        smoothing = radius (in bins) over which sample counts are pooled,
+                    fills bins that no sample happened to hit
+        min_samples = pooled samples a bin needs before it can be
+                      assigned to an object
+        """
+
+        self.names = list(names)
+        self.bins = bins
+        self.smoothing = smoothing
+        self.min_samples = min_samples
+
+        # Index helper only, the table itself is built in build()
+        self.indexer = ColorLUT(np.zeros((bins, bins, bins), np.uint8), [])
+
+        # Sample count of every (bin, label), label 0 = background
+        self.counts = np.zeros((bins ** 3, len(self.names) + 1), np.int64)
+        self.frames = 0
+
+    def add(self, bgr, labels, valid=None):
+        """
+        bgr = sample frame
+        labels = uint8 label map of the frame (0 = background)
+        valid = optional uint8 mask, only pixels where it is non-zero
+                are counted (e.g. the table area without uncertain edges)
+        """
+
+        index = self.indexer.bin_index(bgr)
+
+        if valid is not None:
+            selected = valid > 0
+            index = index[selected]
+            labels = labels[selected]
+
+        pairs = index.astype(np.int64).ravel() * self.counts.shape[1] + labels.ravel()
+        self.counts += np.bincount(
+            pairs, minlength=self.counts.size).reshape(self.counts.shape)
+
+        self.frames += 1
+
+    def samples_per_label(self):
+        return self.counts.sum(axis=0)
+
+    def build(self):
+
+        counts = self.counts.reshape(self.bins, self.bins, self.bins, -1)
+        counts = pool_bins(counts, self.smoothing)
+
+        # Most frequent label of every bin, objects need min_samples
+        table = np.argmax(counts, axis=3).astype(np.uint8)
+        best = np.take_along_axis(counts, table[..., None].astype(np.int64), axis=3)[..., 0]
+        table[best < self.min_samples] = 0
+
+        return ColorLUT(table, self.names)
+
+
+def pool_bins(counts, radius):
+
+    # Sum of every bin's (2 * radius + 1)^3 neighbourhood,
+    # one running sum per color axis
+    if radius <= 0:
+        return counts
+
+    for axis in range(3):
+        padded = np.pad(
+            counts,
+            [(radius, radius) if a == axis else (0, 0) for a in range(counts.ndim)])
+
+        cumulative = np.cumsum(padded, axis=axis)
+        zero = np.zeros_like(np.take(cumulative, [0], axis=axis))
+        cumulative = np.concatenate([zero, cumulative], axis=axis)
+
+        size = counts.shape[axis]
+        window = 2 * radius + 1
+        counts = (np.take(cumulative, np.arange(window, window + size), axis=axis)
+                  - np.take(cumulative, np.arange(0, size), axis=axis))
+
+    return counts
@@ -0,0 +1,35 @@
+import numpy as np
+
+
+class FrameBuffers:
+
+    def __init__(self):
+        """
+        Named working images reused from frame to frame.
+        get() returns a contiguous array of the requested shape backed
+        by the named buffer, which is only reallocated when a larger
+        image (or another dtype) is requested. Pass the arrays to
+        OpenCV as dst= so no per-frame image is allocated.
+        """
+
+        self.buffers = {}
+        self.allocations = 0
+
+    def get(self, name, shape, dtype=np.uint8):
+
+        dtype = np.dtype(dtype)
+        size = 1
+        for n in shape:
+            size *= int(n)
+
+        buffer = self.buffers.get(name)
+
+        if buffer is None or buffer.dtype != dtype or buffer.size < size:
+            buffer = np.empty(size, dtype)
+            self.buffers[name] = buffer
+            self.allocations += 1
+
+        return buffer[:size].reshape(shape)
+
+    def nbytes(self):
+        return sum(buffer.nbytes for buffer in self.buffers.values())
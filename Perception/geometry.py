@@ -0,0 +1,132 @@
+import cv2
+import numpy as np
+
+
+class TableGeometry:
+
+    def __init__(self, H, image_pts):
+        """
+        Everything derived from one homography, computed once.
+        H maps table coordinates (0 to 1) to image pixels,
+        H_inv maps image pixels back to table coordinates.
+        image_pts = 4 table corners in image space (TL, TR, BR, BL)
+        """
+
+        self.H = np.asarray(H, dtype=np.float64)
+        self.H_inv = np.linalg.inv(self.H)
+
+        self.image_pts = np.asarray(image_pts, dtype=np.float32)
+
+        # Table polygon (image space) in the layout cv2 expects
+        self.table_polygon = self.image_pts.reshape((-1, 1, 2)).astype(np.int32)
+
+        # Target centers in image space, keyed on the targets
+        self.target_cache_key = None
+        self.target_cache = None
+
+    def matches(self, H, image_pts):
+        return np.array_equal(self.H, H) and np.array_equal(self.image_pts, image_pts)
+
+    # Batched projections: points is any array-like of shape (N, 2).
+    # Returns a float32 array of shape (N, 2), one native call per batch.
+    def to_table(self, points):
+        return project(points, self.H_inv)
+
+    def to_image(self, points):
+        return project(points, self.H)
+
+    def target_image_points(self, targets):
+        """
+        targets = {name: (tx, ty)} in table coordinates
+        Returns {name: (x, y)} integer image points, cached until
+        the targets change.
+        """
+
+        key = tuple(targets.items())
+
+        if key != self.target_cache_key:
+            projected = self.to_image(list(targets.values()))
+            self.target_cache = {
+                name: (int(x), int(y))
+                for name, (x, y) in zip(targets.keys(), projected)
+            }
+            self.target_cache_key = key
+
+        return self.target_cache
+
+
+def project(points, M):
+
+    points = np.asarray(points, dtype=np.float32).reshape(-1, 1, 2)
+
+    if len(points) == 0:
+        return np.zeros((0, 2), np.float32)
+
+    return cv2.perspectiveTransform(points, M).reshape(-1, 2)
+
+
+def points_in_polygon(points, polygon):
+
+    # cv2.pointPolygonTest(polygon, point, False) >= 0 for N points at
+    # once: (N, 2) points -> (N,) bool, points on an edge are inside
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    polygon = np.asarray(polygon, dtype=np.float64).reshape(-1, 2)
+
+    px = points[:, 0:1]
+    py = points[:, 1:2]
+
+    x1, y1 = polygon[:, 0], polygon[:, 1]
+    x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
+
+    # Even-odd rule: count the edges crossed by a ray to the right
+    crosses = (y1 > py) != (y2 > py)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crossing_x = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+    inside = np.count_nonzero(crosses & (px < crossing_x), axis=1) % 2 == 1
+
+    on_edge = (
+        ((x2 - x1) * (py - y1) == (y2 - y1) * (px - x1))
+        & (px >= np.minimum(x1, x2)) & (px <= np.maximum(x1, x2))
+        & (py >= np.minimum(y1, y2)) & (py <= np.maximum(y1, y2))
+    )
+
+    return inside | on_edge.any(axis=1)
+
+
+def scale_homography(H, scale):
+
+    # Same table mapping for a frame resized by scale
+    # (image pixels are multiplied by scale)
+    S = np.diag([scale, scale, 1.0])
+    return S @ np.asarray(H, dtype=np.float64)
+
+
+class GeometryCache:
+
+    def __init__(self):
+        """
+        Keeps the TableGeometry of the current homography.
+        get() rebuilds it only when H or the table corners change.
+        """
+
+        self.geometry = None
+        self.version = None
+        self.builds = 0
+
+    # version: optional key of H (e.g. HomographyStabilizer.version),
+    # an unchanged version skips comparing the matrices
+    def get(self, H, image_pts, version=None):
+
+        if H is None or image_pts is None:
+            return None
+
+        if version is not None and version == self.version and self.geometry is not None:
+            return self.geometry
+
+        if self.geometry is None or not self.geometry.matches(H, image_pts):
+            self.geometry = TableGeometry(H, image_pts)
+            self.builds += 1
+
+        self.version = version
+
+        return self.geometry
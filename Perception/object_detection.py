@@ -1,94 +1,480 @@
 import cv2
 import numpy as np
 
+from Perception.frame_buffers import FrameBuffers
+from Perception.geometry import TableGeometry
+from Perception.segmentation import CANDIDATE_DTYPE, build_engine, mask_candidates
+from State.object_registry import load_registry
+from Runtime.profiler import profiler
 
-def detect_objects(frame, H, image_pts):
 
-    results = {
-        "bottle": None,
-        "cup": None,
-        "pencil": None
-    }
+# Segmentation engine is built once from the procedure config
+_engine = None
+
+
+def get_segmentation_engine():
+    global _engine
+
+    if _engine is None:
+        _engine = build_engine(load_registry())
+
+    return _engine
+
+
+# Default detector of every engine passed to detect_objects
+_detectors = {}
+
+
+def get_object_detector(engine=None):
+
+    if engine is None:
+        engine = get_segmentation_engine()
+
+    if engine not in _detectors:
+        _detectors[engine] = ObjectDetector(engine)
+
+    return _detectors[engine]
+
+
+class ObjectDetector:
+
+    def __init__(self, engine=None):
+        """
+        Detection state that lives as long as the station: the
+        segmentation engine (LUTs, kernel), one CLAHE instance and the
+        working images. Buffers grow to the largest window searched and
+        are reused afterwards, so steady-state frames allocate no
+        frame-sized images.
+        """
+
+        if engine is None:
+            engine = get_segmentation_engine()
+
+        self.engine = engine
+        self.clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
+        self.buffers = FrameBuffers()
+
+        # Table polygon mask, rebuilt only when the table corners move
+        self.table_mask = {
+            "key": None,
+            "mask": None
+        }
+
+    def detect(self, frame, H, image_pts, **options):
+
+        # Same options as detect_objects()
+        return detect_objects(frame, H, image_pts, detector=self, **options)
+
+    def detect_instances(self, frame, H, image_pts, **options):
+        return detect_object_instances(frame, H, image_pts, detector=self, **options)
+
+
+def detect_objects(frame, H, image_pts, crop_to_table=True, engine=None,
+                   search_windows=None, geometry=None, area_scale=1.0,
+                   request=None, detector=None, pyramid_level=0):
+
+    # crop_to_table: run all color work only inside the table's
+    # bounding rectangle, with off-table pixels masked out.
+    # Returned bboxes are always in full-frame coordinates.
+    # engine: SegmentationEngine to use (default: built from procedure_config.json)
+    # search_windows: {name: (x, y, w, h)} to search an object only inside
+    #     a window (e.g. around its predicted position). Objects without a
+    #     window are searched in the whole table region.
+    # geometry: TableGeometry of (H, image_pts), reused across frames
+    #     while the homography does not change
+    # area_scale: multiplies every min_area, scale**2 when frame,
+    #     H and image_pts describe a resized camera frame
+    # request: names of the objects to look for (e.g. from
+    #     TaskStateManager.detection_request()). Only those classes are
+    #     segmented and only they appear in the results. None = all.
+    # detector: ObjectDetector whose buffers are reused
+    #     (default: one shared detector per engine)
+    # pyramid_level: 0 = segment at full resolution, 1 / 2 = find
+    #     candidates at 1/2 / 1/4 size and refine the chosen blob of
+    #     each object at full resolution (for high-resolution cameras)
+
+    if detector is None:
+        detector = get_object_detector(engine)
+
+    engine = detector.engine
+
+    if request is None:
+        names = engine.names
+    else:
+        names = [name for name in engine.names if name in request]
+
+    # One entry per requested object class
+    results = {name: None for name in names}
+
+    if not names:
+        return results
 
     # If homography or markers are not detected, return empty results
     if H is None or image_pts is None:
         return results
 
-    # Inverse homography maps image space → table space
-    H_inv = np.linalg.inv(H)
+    # Inverse homography (image space → table space) and table polygon
+    if geometry is None:
+        geometry = TableGeometry(H, image_pts)
+
+    frame_h, frame_w = frame.shape[:2]
+    region = (0, 0, frame_w, frame_h)
+    table_mask = None
+
+    if crop_to_table:
+        region = table_roi(image_pts, frame.shape)
+
+        # Table is completely outside the frame
+        if region is None:
+            return results
+
+        table_mask = get_table_mask(image_pts, region, detector.table_mask)
+
+    # (window, object names to take from it)
+    if search_windows is None:
+        search_windows = {}
+
+    searches = []
+
+    full_search = [
+        name for name in names
+        if search_windows.get(name) is None
+    ]
+    if full_search:
+        searches.append((region, full_search))
+
+    for name in names:
+        window = search_windows.get(name)
+        if window is None:
+            continue
+
+        window = intersect_rects(window, region)
+        if window is not None:
+            searches.append((window, [name]))
+
+    found = {}
+
+    # Blobs centered outside the table are never candidates, so
+    # the largest blob on the table wins
+    for window, window_names in searches:
+        if pyramid_level > 0:
+            bboxes = find_bboxes_coarse_to_fine(
+                frame, window, region, table_mask, engine.subset(window_names),
+                area_scale, detector.buffers, detector.clahe, pyramid_level,
+                geometry.table_polygon)
+        else:
+            bboxes = find_bboxes_in_window(
+                frame, window, region, table_mask, engine.subset(window_names),
+                area_scale, detector.buffers, detector.clahe, geometry.table_polygon)
+
+        for name in window_names:
+            if bboxes[name] is not None:
+                found[name] = bboxes[name]
+
+    # Project every object's contact point into table space at once
+    with profiler.timer("object_detection.projection"):
+        results.update(build_objects_data(found, geometry))
+
+    return results
+
+
+def detect_object_instances(frame, H, image_pts, engine=None, geometry=None,
+                            area_scale=1.0, request=None, detector=None):
+
+    # Every blob on the table that passes its object's filters, not
+    # only the largest one (e.g. a second cup).
+    # Arguments as in detect_objects, the whole table region is searched.
+    # Returns a CANDIDATE_DTYPE array (see Perception/segmentation.py):
+    #     sorted by class (engine.names order), then by decreasing area,
+    #     rank 0 = the blob detect_objects reports, boxes in full-frame
+    #     pixels, table_x / table_y = contact point in table coordinates
+    if detector is None:
+        detector = get_object_detector(engine)
+
+    engine = detector.engine
+
+    if request is None:
+        names = engine.names
+    else:
+        names = [name for name in engine.names if name in request]
+
+    if not names or H is None or image_pts is None:
+        return np.zeros(0, CANDIDATE_DTYPE)
+
+    if geometry is None:
+        geometry = TableGeometry(H, image_pts)
+
+    region = table_roi(image_pts, frame.shape)
+
+    if region is None:
+        return np.zeros(0, CANDIDATE_DTYPE)
+
+    table_mask = get_table_mask(image_pts, region, detector.table_mask)
+    subset = engine.subset(names)
+
+    candidates = find_candidates_in_window(
+        frame, region, region, table_mask, subset,
+        area_scale, detector.buffers, detector.clahe, geometry.table_polygon)
+
+    # Labels of the subset -> labels of the engine (same order)
+    relabel = np.array([0] + [engine.names.index(name) + 1 for name in subset.names], np.uint8)
+    candidates["label"] = relabel[candidates["label"]]
+
+    # Bottom-center of every bbox estimates its table contact point
+    contact_points = np.stack([
+        candidates["x"] + candidates["w"] / 2,
+        candidates["y"] + candidates["h"] + 5
+    ], axis=1)
+
+    table_points = geometry.to_table(contact_points)
+    candidates["table_x"] = table_points[:, 0]
+    candidates["table_y"] = table_points[:, 1]
+
+    return candidates
+
+
+def find_candidates_in_window(frame, window, region, region_mask, engine,
+                              area_scale=1.0, buffers=None, clahe=None, polygon=None):
+
+    # Segments one window of the frame.
+    # window, region: (x, y, w, h) in full-frame coordinates,
+    #     window must lie inside region (window None = nothing to search)
+    # region_mask: table mask covering region (or None)
+    # area_scale: multiplies every class's min_area
+    # buffers, clahe: reused FrameBuffers and CLAHE (see ObjectDetector)
+    # polygon: optional full-frame polygon blob centers must lie in
+    # Returns the ranked candidates of the engine's classes
+    # (CANDIDATE_DTYPE) with boxes in full-frame coordinates
+    if window is None or not engine.names:
+        return np.zeros(0, CANDIDATE_DTYPE)
+
+    offset_x, offset_y, width, height = window
+    frame = frame[offset_y:offset_y + height, offset_x:offset_x + width]
+
+    mask = None
+    if region_mask is not None:
+        mask_x = offset_x - region[0]
+        mask_y = offset_y - region[1]
+        mask = region_mask[mask_y:mask_y + height, mask_x:mask_x + width]
+
+    if engine.color_lut is not None:
+        # The calibrated table already covers lighting and color
+        # conversion, raw BGR pixels are classified directly
+        image = frame
+    else:
+        image = preprocess_hsv(frame, buffers, clahe)
+
+    # Classify every pixel into one label map and
+    # rank the blobs of every object class in one pass
+    with profiler.timer("object_detection.segmentation"):
+        return engine.candidates(image, mask, area_scale, polygon, (offset_x, offset_y), buffers)
+
+
+def find_bboxes_in_window(frame, window, region, region_mask, engine,
+                          area_scale=1.0, buffers=None, clahe=None, polygon=None):
+
+    # Largest candidate of every class in one window (arguments as in
+    # find_candidates_in_window).
+    # Returns {name: bbox or None} with bboxes in full-frame coordinates
+    candidates = find_candidates_in_window(
+        frame, window, region, region_mask, engine, area_scale, buffers, clahe, polygon)
+
+    bboxes = {name: None for name in engine.names}
+
+    for best in candidates[candidates["rank"] == 0]:
+        bboxes[engine.names[best["label"] - 1]] = (
+            int(best["x"]),
+            int(best["y"]),
+            int(best["w"]),
+            int(best["h"])
+        )
+
+    return bboxes
+
+
+def find_bboxes_coarse_to_fine(frame, window, region, region_mask, engine,
+                               area_scale=1.0, buffers=None, clahe=None, level=1,
+                               polygon=None):
+
+    # Pyramid search of one window (same arguments and results as
+    # find_bboxes_in_window). All classes are segmented on the window
+    # downscaled by 2**level, with min areas and the opening kernel
+    # scaled to match. Each class's chosen blob is then segmented
+    # again at full resolution inside a small window around it.
+    if buffers is None:
+        buffers = FrameBuffers()
+
+    factor = 2 ** level
+    offset_x, offset_y, width, height = window
+    coarse_w, coarse_h = width // factor, height // factor
+
+    # Too small to be worth downscaling
+    if min(coarse_w, coarse_h) < 4 * engine.kernel_size:
+        return find_bboxes_in_window(
+            frame, window, region, region_mask, engine, area_scale, buffers, clahe, polygon)
+
+    with profiler.timer("object_detection.pyramid"):
+        coarse = cv2.resize(
+            frame[offset_y:offset_y + height, offset_x:offset_x + width],
+            (coarse_w, coarse_h),
+            dst=buffers.get("pyramid.frame", (coarse_h, coarse_w) + frame.shape[2:]),
+            interpolation=cv2.INTER_AREA)
+
+        coarse_mask = None
+        if region_mask is not None:
+            mask_x = offset_x - region[0]
+            mask_y = offset_y - region[1]
+            coarse_mask = cv2.resize(
+                region_mask[mask_y:mask_y + height, mask_x:mask_x + width],
+                (coarse_w, coarse_h),
+                dst=buffers.get("pyramid.mask", (coarse_h, coarse_w)),
+                interpolation=cv2.INTER_NEAREST)
+
+    # Odd kernel, 1 (no opening) at the coarsest levels
+    coarse_engine = engine.subset(
+        engine.names, kernel_size=max(1, engine.kernel_size // factor) | 1)
+
+    # Polygon in the coordinates of the downscaled window
+    coarse_polygon = None
+    if polygon is not None:
+        coarse_polygon = (np.reshape(polygon, (-1, 2)) - (offset_x, offset_y)) / factor
+
+    coarse_window = (0, 0, coarse_w, coarse_h)
+    candidates = find_bboxes_in_window(
+        coarse, coarse_window, coarse_window, coarse_mask, coarse_engine,
+        area_scale / (factor * factor), buffers, clahe, coarse_polygon)
+
+    # Refinement window margin (full-resolution pixels)
+    margin = factor + engine.kernel_size
+    bboxes = {}
+
+    for name, bbox in candidates.items():
+        if bbox is None:
+            bboxes[name] = None
+            continue
+
+        x, y, w, h = bbox
+        coarse_bbox = (
+            offset_x + x * factor,
+            offset_y + y * factor,
+            w * factor,
+            h * factor
+        )
+
+        refine_window = intersect_rects(
+            (coarse_bbox[0] - margin, coarse_bbox[1] - margin,
+             coarse_bbox[2] + 2 * margin, coarse_bbox[3] + 2 * margin),
+            window)
+
+        refined = None
+        if refine_window is not None:
+            with profiler.timer("object_detection.refine"):
+                refined = find_bboxes_in_window(
+                    frame, refine_window, region, region_mask,
+                    engine.subset([name]), area_scale, buffers, clahe, polygon)[name]
+
+        # Keep the upscaled coarse blob if the full-resolution
+        # pass does not pick it up (e.g. CLAHE of the small window)
+        bboxes[name] = refined if refined is not None else coarse_bbox
+
+    return bboxes
+
+
+def preprocess_hsv(frame, buffers=None, clahe=None):
+
+    # Lighting-normalized, slightly blurred HSV image of a BGR frame.
+    # Every step writes into a reused buffer.
+    if buffers is None:
+        buffers = FrameBuffers()
+
+    if clahe is None:
+        clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
+
+    shape = frame.shape
 
     # Convert image to LAB color space.
     # L = lightness (brightness), A/B = color information.
     # This allows us to normalize lighting while preserving object colors.
-    lab = cv2.cvtColor(frame, cv2.COLOR_BGR2LAB)
-    l, a, b = cv2.split(lab)
+    with profiler.timer("object_detection.lab"):
+        lab = cv2.cvtColor(frame, cv2.COLOR_BGR2LAB, dst=buffers.get("lab", shape))
+        l = cv2.extractChannel(lab, 0, dst=buffers.get("lightness", shape[:2]))
 
     # Apply CLAHE to brighten darker areas
-    clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
-    l = clahe.apply(l)
-
-    # Merge the modified L channel (brightness) back with the original
-    # A and B color channels to reconstruct the full LAB image.
-    lab = cv2.merge((l, a, b))
+    with profiler.timer("object_detection.clahe"):
+        l = clahe.apply(l, buffers.get("clahe", shape[:2]))
 
-    # Convert the LAB image back to BGR format
-    frame = cv2.cvtColor(lab, cv2.COLOR_LAB2BGR)
+    # Put the modified L channel (brightness) back next to the original
+    # A and B color channels and convert the LAB image back to BGR
+    with profiler.timer("object_detection.lab_to_bgr"):
+        cv2.insertChannel(l, lab, 0)
+        frame = cv2.cvtColor(lab, cv2.COLOR_LAB2BGR, dst=buffers.get("bgr", shape))
 
     # Blur slightly to smooth lighting noise
-    frame = cv2.GaussianBlur(frame, (5,5), 0)
-
-    # Create table polygon (image space)
-    table_polygon = image_pts.reshape((-1, 1, 2)).astype(np.int32)
+    with profiler.timer("object_detection.blur"):
+        frame = cv2.GaussianBlur(frame, (5,5), 0, dst=buffers.get("blur", shape))
 
     # Convert to HSV for color detection
-    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    with profiler.timer("object_detection.hsv"):
+        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV, dst=buffers.get("hsv", shape))
 
-    # Shadow-friendly color ranges
+    return hsv
 
-    # Dark blue bottle
-    lower_blue_bottle = np.array([100, 60, 30])
-    upper_blue_bottle = np.array([130, 255, 255])
 
-    # Purple cup
-    lower_purple = np.array([130, 50, 40])
-    upper_purple = np.array([170, 255, 255])
+def intersect_rects(a, b):
 
-    # Yellow pencil
-    lower_yellow = np.array([20, 60, 60])
-    upper_yellow = np.array([40, 255, 255])
+    # Intersection of two (x, y, w, h) rectangles, None if empty
+    x1 = max(a[0], b[0])
+    y1 = max(a[1], b[1])
+    x2 = min(a[0] + a[2], b[0] + b[2])
+    y2 = min(a[1] + a[3], b[1] + b[3])
 
-    # Create binary masks that isolate pixels within each color range.
-    # White pixels represent potential object regions.  
-    mask_dark_blue = cv2.inRange(hsv, lower_blue_bottle, upper_blue_bottle)
-    mask_purple = cv2.inRange(hsv, lower_purple, upper_purple)
-    mask_yellow = cv2.inRange(hsv, lower_yellow, upper_yellow)
+    if x2 <= x1 or y2 <= y1:
+        return None
 
-    # Clean masks to remove shadow noise
-    kernel = np.ones((5, 5), np.uint8)
+    return (int(x1), int(y1), int(x2 - x1), int(y2 - y1))
 
-    mask_dark_blue = cv2.morphologyEx(mask_dark_blue, cv2.MORPH_OPEN, kernel)
-    mask_purple = cv2.morphologyEx(mask_purple, cv2.MORPH_OPEN, kernel)
-    mask_yellow = cv2.morphologyEx(mask_yellow, cv2.MORPH_OPEN, kernel)
 
-    # Detect dark blue bottle
-    bottle_bbox = largest_valid_contour_bbox(mask_dark_blue, min_area=800)
-    if bottle_bbox is not None:
-        if bbox_inside_boundary_zone(bottle_bbox, table_polygon):
-            results["bottle"] = build_object_data(bottle_bbox, H_inv)
+def table_roi(image_pts, frame_shape, padding=8):
 
-    # Detect purple cup
-    cup_bbox = largest_valid_contour_bbox(mask_purple, min_area=800)
-    if cup_bbox is not None:
-        if bbox_inside_boundary_zone(cup_bbox, table_polygon):
-            results["cup"] = build_object_data(cup_bbox, H_inv)
+    # Bounding rectangle (x, y, w, h) of the 4 table corners,
+    # padded and clipped to the frame. None if nothing is visible.
+    frame_h, frame_w = frame_shape[:2]
 
-    # Detect yellow pencil
-    pencil_bbox = largest_thin_contour_bbox(mask_yellow, min_area=150)
-    if pencil_bbox is not None:
-        if bbox_inside_boundary_zone(pencil_bbox, table_polygon):
-            results["pencil"] = build_object_data(pencil_bbox, H_inv)
+    x, y, w, h = cv2.boundingRect(image_pts.astype(np.float32))
 
-    return results
+    x1 = max(0, x - padding)
+    y1 = max(0, y - padding)
+    x2 = min(frame_w, x + w + padding)
+    y2 = min(frame_h, y + h + padding)
+
+    if x2 <= x1 or y2 <= y1:
+        return None
+
+    return (x1, y1, x2 - x1, y2 - y1)
+
+
+def get_table_mask(image_pts, roi, cache=None):
+
+    # Filled table polygon inside the ROI (255 = on table)
+    # cache: optional {"key", "mask"} dict (see ObjectDetector) holding
+    #     the last mask, reused while the corners and ROI stay the same
+    if cache is None:
+        cache = {"key": None, "mask": None}
+
+    key = (roi, image_pts.tobytes())
+
+    if cache["key"] != key:
+        x, y, w, h = roi
+
+        polygon = image_pts.reshape((-1, 1, 2)) - np.array([x, y], np.float32)
+
+        mask = np.zeros((h, w), np.uint8)
+        cv2.fillPoly(mask, [np.round(polygon).astype(np.int32)], 255)
+
+        cache["key"] = key
+        cache["mask"] = mask
+
+    return cache["mask"]
 
 
 def build_object_data(bbox, H_inv):
@@ -119,6 +505,31 @@ def build_object_data(bbox, H_inv):
     }
 
 
+def build_objects_data(bboxes, geometry):
+
+    # Batched build_object_data: {name: bbox} -> {name: object data}
+    names = list(bboxes.keys())
+
+    if not names:
+        return {}
+
+    # Bottom-center of every bbox estimates its table contact point
+    contact_points = [
+        (x + w / 2, y + h + 5)
+        for x, y, w, h in (bboxes[name] for name in names)
+    ]
+
+    table_points = geometry.to_table(contact_points)
+
+    return {
+        name: {
+            "bbox": bboxes[name],
+            "table_coords": (table_x, table_y)
+        }
+        for name, (table_x, table_y) in zip(names, table_points)
+    }
+
+
 def image_to_table_coords(center, H_inv):
     
     # Format the point into shape (1, 1, 2) as required by OpenCV.
@@ -140,69 +551,34 @@ def image_to_table_coords(center, H_inv):
 def largest_valid_contour_bbox(mask, min_area=500):
 
     # mask (np.ndarray): Binary image where white pixels represent candidate regions.
-    # min_area (int): Minimum contour area to be considered valid.
+    # min_area (int): Minimum blob area (pixels) to be considered valid.
 
-    # Find external contours in the binary mask
-    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    # All blobs of the mask, filtered and ranked without a Python loop
+    candidates = mask_candidates(mask, min_area)
 
-    best_bbox = None
-    best_area = 0
-
-    # Iterate through all detected contours
-    for cnt in contours:
-        area = cv2.contourArea(cnt)
-    
-        # Ignore small contours (likely noise)
-        if area < min_area:
-            continue
-        
-        # Compute bounding rectangle around contour
-        # x = left coordinate 
-        # y = top coordinate 
-        # w = width 
-        # h = height 
-        x, y, w, h = cv2.boundingRect(cnt)
-
-        # Keep the largest valid contour
-        if area > best_area:
-            best_area = area
-            best_bbox = (x, y, w, h)
-
-    return best_bbox
+    return candidate_bbox(candidates)
 
 
 def largest_thin_contour_bbox(mask, min_area=100):
 
     # mask (np.ndarray): Binary image where white pixels represent candidate regions.
-    # min_area (int): Minimum contour area to be considered valid.
+    # min_area (int): Minimum blob area (pixels) to be considered valid.
 
     # Detect elongated objects using aspect ratio
-    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    # (long side / short side), long & thin
+    candidates = mask_candidates(mask, min_area, min_aspect_ratio=2.5)
 
-    best_bbox = None
-    best_area = 0
+    return candidate_bbox(candidates)
 
-    # Iterate through all detected contours
-    for cnt in contours:
-        area = cv2.contourArea(cnt)
-        
-        # Ignore small contours (likely noise)
-        if area < min_area:
-            continue
-    
-        # Compute aspect ratio (long side / short side)
-        x, y, w, h = cv2.boundingRect(cnt)
 
-        # Require object to be sufficiently elongated
-        aspect_ratio = max(w, h) / (min(w, h) + 1e-5)
+def candidate_bbox(candidates):
 
-        # Long & thin
-        if aspect_ratio > 2.5:
-            if area > best_area:
-                best_area = area
-                best_bbox = (x, y, w, h)
+    # Bbox of the first (largest) candidate, or None
+    if len(candidates) == 0:
+        return None
 
-    return best_bbox
+    best = candidates[0]
+    return (int(best["x"]), int(best["y"]), int(best["w"]), int(best["h"]))
 
 
 def bbox_inside_boundary_zone(bbox, polygon):
@@ -0,0 +1,220 @@
+import itertools
+
+import cv2
+import numpy as np
+
+from Perception.object_detection import build_objects_data
+
+
+class ObjectTrack:
+
+    def __init__(self, track_id, bbox):
+        """
+        Constant-velocity Kalman filter on a bounding box.
+        State: cx, cy, w, h, vx, vy (pixels, pixels per frame)
+        Measurement: cx, cy, w, h
+        """
+
+        self.track_id = track_id
+        self.misses = 0
+        self.age = 0
+
+        kf = cv2.KalmanFilter(6, 4)
+
+        # cx += vx, cy += vy every frame, size stays constant
+        kf.transitionMatrix = np.array([
+            [1, 0, 0, 0, 1, 0],
+            [0, 1, 0, 0, 0, 1],
+            [0, 0, 1, 0, 0, 0],
+            [0, 0, 0, 1, 0, 0],
+            [0, 0, 0, 0, 1, 0],
+            [0, 0, 0, 0, 0, 1]
+        ], dtype=np.float32)
+
+        kf.measurementMatrix = np.eye(4, 6, dtype=np.float32)
+
+        kf.processNoiseCov = np.diag(
+            [1.0, 1.0, 1.0, 1.0, 0.5, 0.5]).astype(np.float32)
+        kf.measurementNoiseCov = np.diag(
+            [4.0, 4.0, 16.0, 16.0]).astype(np.float32)
+        kf.errorCovPost = np.diag(
+            [10.0, 10.0, 10.0, 10.0, 100.0, 100.0]).astype(np.float32)
+
+        kf.statePost = np.array(
+            [[v] for v in bbox_to_measurement(bbox)] + [[0.0], [0.0]],
+            dtype=np.float32)
+
+        self.kf = kf
+        self.predicted = self.bbox()
+
+    def predict(self):
+
+        self.kf.predict()
+        self.age += 1
+        self.predicted = self.bbox(self.kf.statePre)
+
+        return self.predicted
+
+    def correct(self, bbox):
+
+        measurement = np.array(bbox_to_measurement(bbox), dtype=np.float32).reshape(4, 1)
+        self.kf.correct(measurement)
+        self.misses = 0
+
+    def miss(self):
+
+        # No measurement: keep the prediction as the new state
+        self.kf.statePost = self.kf.statePre.copy()
+        self.kf.errorCovPost = self.kf.errorCovPre.copy()
+        self.misses += 1
+
+    def bbox(self, state=None):
+
+        if state is None:
+            state = self.kf.statePost
+
+        cx, cy, w, h = state[:4, 0]
+        w = max(float(w), 1.0)
+        h = max(float(h), 1.0)
+
+        return (
+            int(round(cx - w / 2)),
+            int(round(cy - h / 2)),
+            int(round(w)),
+            int(round(h))
+        )
+
+    def velocity(self):
+
+        vx, vy = self.kf.statePost[4:, 0]
+        return (float(vx), float(vy))
+
+
+def bbox_to_measurement(bbox):
+
+    x, y, w, h = bbox
+    return [x + w / 2, y + h / 2, float(w), float(h)]
+
+
+class ObjectTracker:
+
+    def __init__(self, padding=0.5, min_padding=40, max_misses=15, gate=3.0):
+        """
+        One track per object class, used to predict where each object
+        will be in the next frame.
+        padding = search window margin as a fraction of the bbox size
+        min_padding = minimum search window margin in pixels
+        max_misses = frames without a detection before a track is dropped
+        gate = max jump (in bbox sizes) for a re-detection to keep its track
+        """
+
+        self.padding = padding
+        self.min_padding = min_padding
+        self.max_misses = max_misses
+        self.gate = gate
+
+        self.tracks = {}
+        self.next_id = itertools.count(1)
+
+    def search_windows(self, frame_shape, names=None):
+        """
+        Predicts the tracks of names (None = all) one frame ahead and
+        returns {name: (x, y, w, h)} windows to search. Objects whose
+        track missed the last frame get no window, so they fall back
+        to a full search.
+        Tracks of objects not searched this frame are not predicted,
+        they stay where they were last seen instead of coasting on
+        their last velocity.
+        """
+
+        frame_h, frame_w = frame_shape[:2]
+        windows = {}
+
+        for name, track in self.tracks.items():
+            if names is not None and name not in names:
+                continue
+
+            x, y, w, h = track.predict()
+
+            if track.misses > 0:
+                continue
+
+            vx, vy = track.velocity()
+            pad_x = max(self.min_padding, self.padding * w) + abs(vx)
+            pad_y = max(self.min_padding, self.padding * h) + abs(vy)
+
+            x1 = int(max(0, x - pad_x))
+            y1 = int(max(0, y - pad_y))
+            x2 = int(min(frame_w, x + w + pad_x))
+            y2 = int(min(frame_h, y + h + pad_y))
+
+            if x2 > x1 and y2 > y1:
+                windows[name] = (x1, y1, x2 - x1, y2 - y1)
+
+        return windows
+
+    def update(self, detected_objects, geometry):
+        """
+        Corrects every track with this frame's detections.
+        Detected entries get a smoothed "bbox" (raw one kept as
+        "raw_bbox"), "track_id" and "velocity" (pixels per frame).
+        geometry = TableGeometry used to re-project the smoothed bboxes
+        Must be called once per frame after search_windows().
+        """
+
+        smoothed = {}
+
+        for name, obj_data in detected_objects.items():
+            track = self.tracks.get(name)
+
+            if obj_data is None:
+                if track is not None:
+                    track.miss()
+                    if track.misses > self.max_misses:
+                        del self.tracks[name]
+                continue
+
+            bbox = obj_data["bbox"]
+
+            # A far-away re-detection starts a new track
+            if track is not None and not self.within_gate(track, bbox):
+                track = None
+
+            if track is None:
+                track = ObjectTrack(next(self.next_id), bbox)
+                self.tracks[name] = track
+            else:
+                track.correct(bbox)
+
+            smoothed[name] = track.bbox()
+
+        # Table coordinates of all smoothed bboxes in one projection
+        if geometry is not None:
+            tracked_data = build_objects_data(smoothed, geometry)
+        else:
+            tracked_data = {
+                name: dict(detected_objects[name], bbox=bbox)
+                for name, bbox in smoothed.items()
+            }
+
+        for name, data in tracked_data.items():
+            track = self.tracks[name]
+
+            data["raw_bbox"] = detected_objects[name]["bbox"]
+            data["track_id"] = track.track_id
+            data["velocity"] = track.velocity()
+
+            detected_objects[name] = data
+
+        return detected_objects
+
+    def within_gate(self, track, bbox):
+
+        px, py, pw, ph = track.predicted
+        cx, cy = bbox[0] + bbox[2] / 2, bbox[1] + bbox[3] / 2
+        pcx, pcy = px + pw / 2, py + ph / 2
+
+        size = max(pw, ph, 1)
+        distance = np.hypot(cx - pcx, cy - pcy)
+
+        return distance <= self.gate * size
@@ -0,0 +1,241 @@
+import cv2
+import numpy as np
+
+from Perception.frame_buffers import FrameBuffers
+from Perception.geometry import project
+from Perception.object_detection import get_segmentation_engine, preprocess_hsv
+from Perception.segmentation import CANDIDATE_DTYPE, SegmentationEngine
+from State.object_registry import DEFAULT_MIN_TABLE_AREA
+from Runtime.profiler import profiler
+
+
+class TableRectifier:
+
+    def __init__(self, size=(640, 400)):
+        """
+        Warps the table of a camera frame into a fixed-size top-down
+        canvas: canvas pixel (u, v) shows table point
+        ((u + 0.5) / width, (v + 0.5) / height).
+        size = (width, height) of the canvas, best matching the
+               table's width : height
+        The remap grid is built once per homography and reused for
+        every frame until H changes.
+        """
+
+        self.size = tuple(size)
+        width, height = self.size
+
+        # Canvas pixels -> table coordinates
+        self.canvas_to_table = np.array([
+            [1.0 / width, 0.0, 0.5 / width],
+            [0.0, 1.0 / height, 0.5 / height],
+            [0.0, 0.0, 1.0]
+        ])
+
+        # Canvas pixel centers, projected through H for every new grid
+        u, v = np.meshgrid(np.arange(width, dtype=np.float32), np.arange(height, dtype=np.float32))
+        self.grid = np.stack([u, v], axis=-1).reshape(-1, 1, 2)
+
+        self.key = None
+        self.canvas_to_image = None
+        self.image_to_table = None
+        self.map1 = None
+        self.map2 = None
+
+        # 255 where the canvas pixel lies inside the camera frame,
+        # None when the whole table is visible
+        self.mask = None
+
+        self.builds = 0
+
+    def update(self, H, frame_shape, version=None):
+
+        # version: optional key of H (e.g. HomographyStabilizer.version)
+        # used instead of the matrix bytes
+        key = (frame_shape[:2], version if version is not None else np.asarray(H).tobytes())
+
+        if key == self.key:
+            return
+
+        with profiler.timer("rectified.grid"):
+            self.build(H, frame_shape)
+
+        self.key = key
+
+    def build(self, H, frame_shape):
+
+        width, height = self.size
+        frame_h, frame_w = frame_shape[:2]
+
+        self.canvas_to_image = np.asarray(H, dtype=np.float64) @ self.canvas_to_table
+        self.image_to_table = np.linalg.inv(np.asarray(H, dtype=np.float64))
+
+        image_points = cv2.perspectiveTransform(self.grid, self.canvas_to_image)
+        map_x = image_points[:, 0, 0].reshape(height, width)
+        map_y = image_points[:, 0, 1].reshape(height, width)
+
+        # Fixed-point maps: remap only interpolates, no per-pixel division
+        self.map1, self.map2 = cv2.convertMaps(map_x, map_y, cv2.CV_16SC2)
+
+        inside = (map_x >= 0) & (map_x <= frame_w - 1) & (map_y >= 0) & (map_y <= frame_h - 1)
+        self.mask = None if inside.all() else inside.astype(np.uint8) * 255
+
+        self.builds += 1
+
+    def warp(self, frame, H, version=None, buffers=None):
+
+        # Top-down canvas of the table in this frame
+        if buffers is None:
+            buffers = FrameBuffers()
+
+        self.update(H, frame.shape, version)
+
+        width, height = self.size
+
+        with profiler.timer("rectified.remap"):
+            return cv2.remap(
+                frame,
+                self.map1,
+                self.map2,
+                cv2.INTER_LINEAR,
+                dst=buffers.get("rectified", (height, width) + frame.shape[2:]),
+                borderMode=cv2.BORDER_CONSTANT)
+
+    # Canvas pixels -> table coordinates / image pixels, (N, 2) arrays
+    def to_table(self, points):
+        return project(points, self.canvas_to_table)
+
+    def to_image(self, points):
+        return project(points, self.canvas_to_image)
+
+    # Image pixels -> table coordinates
+    def image_to_table_points(self, points):
+        return project(points, self.image_to_table)
+
+
+class RectifiedDetector:
+
+    def __init__(self, engine=None, size=(640, 400)):
+        """
+        Object detection on the rectified table canvas (TableRectifier).
+        Cost depends only on the canvas size, not on the camera, and
+        every object's min_table_area (share of the table area) means
+        the same physical size wherever the object is and however the
+        camera looks at the table. Table coordinates are the contact
+        point of detect_objects(): an object with height smears away
+        from the camera on the canvas, so its blob center lies behind
+        the object while the bottom of its image box is where it stands.
+        """
+
+        if engine is None:
+            engine = get_segmentation_engine()
+
+        self.rectifier = TableRectifier(size)
+
+        # Same classes with min areas in canvas pixels
+        canvas_area = size[0] * size[1]
+        self.engine = SegmentationEngine(
+            [
+                dict(c, min_area=c.get("min_table_area", DEFAULT_MIN_TABLE_AREA) * canvas_area)
+                for c in engine.classes
+            ],
+            engine.kernel_size,
+            engine.color_lut)
+
+        self.clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8,8))
+        self.buffers = FrameBuffers()
+
+    def candidates(self, frame, H, version=None, request=None):
+        """
+        Every valid blob of the requested objects (None = all).
+        Returns a CANDIDATE_DTYPE array: labels of self.engine.names,
+        boxes in canvas pixels, table_x / table_y = contact point
+        (bottom-center of the blob's image box, as in detect_objects).
+        """
+
+        if request is None:
+            names = self.engine.names
+        else:
+            names = [name for name in self.engine.names if name in request]
+
+        if not names or H is None:
+            return np.zeros(0, CANDIDATE_DTYPE)
+
+        canvas = self.rectifier.warp(frame, H, version, self.buffers)
+        subset = self.engine.subset(names)
+
+        if subset.color_lut is not None:
+            image = canvas
+        else:
+            image = preprocess_hsv(canvas, self.buffers, self.clahe)
+
+        with profiler.timer("rectified.segmentation"):
+            candidates = subset.candidates(image, self.rectifier.mask, buffers=self.buffers)
+
+        # Labels of the subset -> labels of the engine (same order)
+        relabel = np.array([0] + [self.engine.names.index(name) + 1 for name in subset.names], np.uint8)
+        candidates["label"] = relabel[candidates["label"]]
+
+        bboxes = np.array(self.image_boxes(candidates), dtype=np.float64).reshape(-1, 4)
+
+        # Bottom-center of every image box estimates its table contact point
+        contact_points = np.stack([
+            bboxes[:, 0] + bboxes[:, 2] / 2,
+            bboxes[:, 1] + bboxes[:, 3] + 5
+        ], axis=1)
+
+        table_points = self.rectifier.image_to_table_points(contact_points)
+        candidates["table_x"] = table_points[:, 0]
+        candidates["table_y"] = table_points[:, 1]
+
+        return candidates
+
+    def detect(self, frame, H, version=None, request=None):
+        """
+        Largest blob of every requested object, same results as
+        detect_objects(): {name: {"bbox", "table_coords"} or None}
+        with bbox = image bounding rectangle of the blob's canvas box.
+        """
+
+        return self.objects(self.candidates(frame, H, version, request), request)
+
+    def objects(self, candidates, request=None):
+
+        # detect() results of already segmented candidates
+        if request is None:
+            names = self.engine.names
+        else:
+            names = [name for name in self.engine.names if name in request]
+
+        results = {name: None for name in names}
+
+        best = candidates[candidates["rank"] == 0]
+
+        for candidate, bbox in zip(best, self.image_boxes(best)):
+            name = self.engine.names[candidate["label"] - 1]
+            if name in results:
+                results[name] = {
+                    "bbox": bbox,
+                    "table_coords": (float(candidate["table_x"]), float(candidate["table_y"]))
+                }
+
+        return results
+
+    def image_boxes(self, candidates):
+
+        # Image bounding rectangle (x, y, w, h) of every candidate's canvas box
+        if len(candidates) == 0:
+            return []
+
+        # Canvas box corners -> image space, 4 per blob in one projection
+        x, y, w, h = (candidates[field].astype(np.float32) for field in ("x", "y", "w", "h"))
+        corners = np.stack([
+            np.stack([x, y], axis=1),
+            np.stack([x + w, y], axis=1),
+            np.stack([x + w, y + h], axis=1),
+            np.stack([x, y + h], axis=1)
+        ], axis=1)
+
+        image_corners = self.rectifier.to_image(corners.reshape(-1, 2)).reshape(-1, 4, 2)
+
+        return [cv2.boundingRect(box) for box in image_corners]
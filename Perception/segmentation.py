@@ -0,0 +1,450 @@
+import cv2
+import numpy as np
+
+from Perception.color_lut import load_color_lut
+from Perception.frame_buffers import FrameBuffers
+from Perception.geometry import points_in_polygon
+from State.object_registry import CONFIG_PATH, load_registry
+
+
+# Classes are packed as bits into 8-bit words, 8 classes per word
+CLASSES_PER_WORD = 8
+
+# find_components() result without any blob
+NO_COMPONENTS = {
+    field: np.zeros(0, np.int32)
+    for field in ("label", "x", "y", "w", "h", "area")
+}
+
+# One row per candidate blob, see select_candidates()
+CANDIDATE_DTYPE = np.dtype([
+    ("label", np.uint8),          # class label (names[label - 1])
+    ("rank", np.uint16),          # 0 = largest blob of its class
+    ("x", np.int32),
+    ("y", np.int32),
+    ("w", np.int32),
+    ("h", np.int32),
+    ("area", np.int32),
+    ("aspect_ratio", np.float32), # long side / short side
+    ("table_x", np.float32),      # contact point in table coordinates,
+    ("table_y", np.float32)       # NaN until projected
+])
+
+
+def load_color_classes(config_path=CONFIG_PATH):
+
+    # Returns the object classes of the procedure config.
+    # Each entry: name, hsv_lower, hsv_upper, min_area, shape,
+    # min_aspect_ratio, highlight
+    return load_registry(config_path).objects
+
+
+def build_engine(registry):
+
+    # Engine of a procedure, with its calibrated color LUT if it has one
+    color_lut = None
+    if registry.color_lut is not None:
+        color_lut = load_color_lut(registry.color_lut)
+
+    return SegmentationEngine(registry.objects, color_lut=color_lut)
+
+
+class SegmentationEngine:
+
+    def __init__(self, color_classes, kernel_size=5, color_lut=None):
+        """
+        Classifies every HSV pixel into a single label map.
+        color_classes = list of dicts with name, hsv_lower, hsv_upper.
+        Label 0 is background, label i + 1 is color_classes[i].
+        When ranges overlap, the class listed first wins.
+        color_lut = optional calibrated ColorLUT, the engine then
+        classifies raw BGR frames instead of HSV ones.
+        Every method takes an optional FrameBuffers; with one, all
+        working images are reused between calls.
+        """
+
+        if len(color_classes) > 255:
+            raise ValueError("At most 255 color classes are supported")
+
+        self.classes = list(color_classes)
+        self.names = [c["name"] for c in self.classes]
+
+        # Per-class filters indexed by label - 1
+        self.min_areas = np.array(
+            [c.get("min_area", 0) for c in self.classes], dtype=np.float64)
+        self.min_aspect_ratios = np.array(
+            [c.get("min_aspect_ratio", 0.0) for c in self.classes], dtype=np.float64)
+
+        self.kernel_size = kernel_size
+        self.kernel = np.ones((kernel_size, kernel_size), np.uint8)
+        self.kernel_radius = kernel_size // 2
+
+        # Engines for subsets of the classes, see subset()
+        self.subsets = {}
+
+        self.color_lut = None
+        if color_lut is not None:
+            self.set_color_lut(color_lut)
+
+        self.channel_luts = []
+        self.label_luts = []
+        self.build_luts()
+
+    def build_luts(self):
+
+        # For every word of 8 classes build:
+        # channel LUTs (H, S, V): bit k set if the value is inside
+        #     class k's range on that channel
+        # label LUT (256): bitmask -> label of the lowest set bit
+        values = np.arange(256)
+
+        for word_start in range(0, len(self.classes), CLASSES_PER_WORD):
+            word = self.classes[word_start:word_start + CLASSES_PER_WORD]
+
+            channel_lut = np.zeros((256, 3), np.uint8)
+
+            for bit, color_class in enumerate(word):
+                lower = color_class["hsv_lower"]
+                upper = color_class["hsv_upper"]
+
+                for channel in range(3):
+                    inside = (values >= lower[channel]) & (values <= upper[channel])
+                    channel_lut[inside, channel] |= np.uint8(1 << bit)
+
+            label_lut = np.zeros(256, np.uint8)
+            for mask in range(1, 256):
+                lowest_bit = (mask & -mask).bit_length() - 1
+                if lowest_bit < len(word):
+                    label_lut[mask] = word_start + lowest_bit + 1
+
+            # cv2.LUT expects shape (1, 256), one table per channel
+            self.channel_luts.append([
+                np.ascontiguousarray(channel_lut[:, channel]).reshape(1, 256)
+                for channel in range(3)
+            ])
+            self.label_luts.append(label_lut.reshape(1, 256))
+
+    def set_color_lut(self, color_lut):
+
+        missing = [name for name in self.names if name not in color_lut.names]
+        if missing:
+            raise ValueError(f"Color LUT has no class for: {', '.join(missing)}")
+
+        # Color LUT label -> label of this engine (0 for other classes)
+        remap = np.zeros(256, np.uint8)
+        for index, name in enumerate(color_lut.names):
+            if name in self.names:
+                remap[index + 1] = self.names.index(name) + 1
+
+        self.color_lut = color_lut
+        self.lut_remap = None
+        if not np.array_equal(remap[:len(color_lut.names) + 1],
+                              np.arange(len(color_lut.names) + 1)):
+            self.lut_remap = remap.reshape(1, 256)
+
+    def subset(self, names, kernel_size=None):
+        """
+        Engine segmenting only the given classes (kept in catalog
+        order), optionally with another opening kernel size.
+        Built once per set of names and kernel size.
+        """
+
+        if kernel_size is None:
+            kernel_size = self.kernel_size
+
+        names = tuple(name for name in self.names if name in names)
+
+        if len(names) == len(self.names) and kernel_size == self.kernel_size:
+            return self
+
+        key = (names, kernel_size)
+
+        if key not in self.subsets:
+            self.subsets[key] = SegmentationEngine(
+                [c for c in self.classes if c["name"] in names],
+                kernel_size,
+                self.color_lut)
+
+        return self.subsets[key]
+
+    # HSV image (BGR with a color LUT) -> label map (uint8, 0 = background)
+    def classify(self, image, buffers=None):
+
+        if self.color_lut is not None:
+            labels = self.color_lut.classify(image, buffers)
+
+            if self.lut_remap is not None:
+                cv2.LUT(labels, self.lut_remap, dst=labels)
+
+            return labels
+
+        return self.classify_hsv(image, buffers)
+
+    def classify_hsv(self, hsv, buffers=None):
+
+        if buffers is None:
+            buffers = FrameBuffers()
+
+        shape = hsv.shape[:2]
+        channels = [
+            cv2.extractChannel(hsv, channel, dst=buffers.get(f"hsv.{channel}", shape))
+            for channel in range(3)
+        ]
+
+        labels = buffers.get("labels", shape)
+        word_bits = buffers.get("word_bits", shape)
+        lookup = buffers.get("lookup", shape)
+        word_labels = buffers.get("word_labels", shape)
+        unlabelled = buffers.get("unlabelled", shape)
+
+        for word, (channel_luts, label_lut) in enumerate(zip(
+                self.channel_luts, self.label_luts)):
+
+            # One lookup per pixel gives the per-channel class bitmasks,
+            # a pixel belongs to a class if all three channels agree
+            h_lut, s_lut, v_lut = channel_luts
+            h, s, v = channels
+
+            cv2.LUT(h, h_lut, dst=word_bits)
+            cv2.bitwise_and(word_bits, cv2.LUT(s, s_lut, dst=lookup), dst=word_bits)
+            cv2.bitwise_and(word_bits, cv2.LUT(v, v_lut, dst=lookup), dst=word_bits)
+
+            # Earlier words have priority over later ones:
+            # only still-unlabelled pixels take this word's labels
+            if word == 0:
+                cv2.LUT(word_bits, label_lut, dst=labels)
+            else:
+                cv2.LUT(word_bits, label_lut, dst=word_labels)
+                cv2.compare(labels, 0, cv2.CMP_EQ, dst=unlabelled)
+                cv2.copyTo(word_labels, unlabelled, labels)
+
+        return labels
+
+    # Morphological opening of every class at once
+    def open_labels(self, labels, buffers=None):
+
+        if buffers is None:
+            buffers = FrameBuffers()
+
+        shape = labels.shape[:2]
+
+        # A pixel survives erosion of its class only if the whole
+        # kernel window has the same label (window min == window max)
+        window_min = cv2.erode(labels, self.kernel, dst=buffers.get("window_min", shape))
+        window_max = cv2.dilate(labels, self.kernel, dst=buffers.get("window_max", shape))
+
+        # uniform is 0 or 255, so min() keeps the label or clears it
+        uniform = cv2.compare(window_min, window_max, cv2.CMP_EQ, dst=window_min)
+        core = cv2.min(labels, uniform, dst=buffers.get("core", shape))
+
+        return core
+
+    def find_components(self, image, mask=None, buffers=None):
+        """
+        Segments all classes and labels all blobs in one pass.
+        image = HSV frame, or BGR frame when the engine has a color LUT
+        mask = optional uint8 image (0 / 255), pixels where mask is 0
+               are treated as background
+        Returns dict with per-component arrays:
+            label (class label), x, y, w, h, area
+        Boxes and areas are those of the opened mask.
+        """
+
+        if buffers is None:
+            buffers = FrameBuffers()
+
+        labels = self.classify(image, buffers)
+
+        if mask is not None:
+            cv2.min(labels, mask, dst=labels)
+
+        core = self.open_labels(labels, buffers)
+
+        # Eroded cores of different classes are always at least one
+        # kernel width apart, so a single labelling pass keeps classes
+        # separate. int32 ids: a textured 4K frame easily has more
+        # than 65535 blobs.
+        shape = labels.shape[:2]
+        count, components, stats, _ = cv2.connectedComponentsWithStats(
+            core,
+            labels=buffers.get("components", shape, np.int32),
+            connectivity=8,
+            ltype=cv2.CV_32S)
+
+        if count <= 1:
+            return dict(NO_COMPONENTS)
+
+        # dilate and calcHist take no int32 images, the ids are exact
+        # as float32 (fewer than 2**24 components in any frame)
+        component_ids = buffers.get("component_ids", shape, np.float32)
+        np.copyto(component_ids, components)
+
+        component_labels = self.component_labels(core, component_ids, count, buffers)
+
+        # Dilating the component ids completes the opening, a histogram
+        # of the dilated ids gives the opened area of each component
+        opened_ids = cv2.dilate(component_ids, self.kernel, dst=buffers.get("opened_ids", shape, np.float32))
+
+        areas = cv2.calcHist(
+            [opened_ids], [0], None, [count], [0, count],
+            hist=buffers.get("histogram", (count, 1), np.float32))
+        areas = np.round(areas[:, 0])
+
+        # Opened bbox = eroded bbox grown by the kernel radius
+        height, width = labels.shape[:2]
+        r = self.kernel_radius
+
+        x = stats[:, cv2.CC_STAT_LEFT]
+        y = stats[:, cv2.CC_STAT_TOP]
+        x1 = np.maximum(x - r, 0)
+        y1 = np.maximum(y - r, 0)
+        x2 = np.minimum(x + stats[:, cv2.CC_STAT_WIDTH] + r, width)
+        y2 = np.minimum(y + stats[:, cv2.CC_STAT_HEIGHT] + r, height)
+
+        # Drop background component 0
+        return {
+            "label": component_labels[1:].astype(np.int32),
+            "x": x1[1:].astype(np.int32),
+            "y": y1[1:].astype(np.int32),
+            "w": (x2 - x1)[1:].astype(np.int32),
+            "h": (y2 - y1)[1:].astype(np.int32),
+            "area": areas[1:].astype(np.int32)
+        }
+
+    def component_labels(self, core, component_ids, count, buffers):
+
+        # Class label of each component (all its pixels share one class):
+        # a histogram of the ids under each class's pixels marks that
+        # class's components, the last class takes the rest.
+        # Every pass is buffer-backed, masked histograms only visit the
+        # pixels of their class.
+        classes = len(self.names)
+
+        component_labels = buffers.get("component_labels", (count,), np.uint8)
+        component_labels.fill(classes)
+
+        class_mask = buffers.get("class_mask", core.shape[:2])
+        found = buffers.get("class_histogram", (count, 1), np.float32)
+
+        for label in range(1, classes):
+            cv2.compare(core, label, cv2.CMP_EQ, dst=class_mask)
+            cv2.calcHist([component_ids], [0], class_mask, [count], [0, count], hist=found)
+            component_labels[found[:, 0] > 0] = label
+
+        return component_labels
+
+    def candidates(self, image, mask=None, area_scale=1.0, polygon=None,
+                   offset=(0, 0), buffers=None):
+        """
+        Every valid blob of every class, ranked (see select_candidates).
+        area_scale = multiplies every min_area (scale**2 for a resized frame)
+        polygon, offset = see select_candidates
+        """
+
+        components = self.find_components(image, mask, buffers)
+        class_index = components["label"] - 1
+
+        return select_candidates(
+            components,
+            self.min_areas[class_index] * area_scale,
+            self.min_aspect_ratios[class_index],
+            polygon,
+            offset)
+
+    def best_bboxes(self, image, mask=None, area_scale=1.0, buffers=None,
+                    polygon=None, offset=(0, 0)):
+        """
+        Largest valid blob of every class.
+        Returns {name: (x, y, w, h) or None}
+        """
+
+        candidates = self.candidates(image, mask, area_scale, polygon, offset, buffers)
+
+        results = {name: None for name in self.names}
+
+        for best in candidates[candidates["rank"] == 0]:
+            results[self.names[best["label"] - 1]] = (
+                int(best["x"]),
+                int(best["y"]),
+                int(best["w"]),
+                int(best["h"])
+            )
+
+        return results
+
+
+def select_candidates(components, min_areas, min_aspect_ratios, polygon=None, offset=(0, 0)):
+    """
+    Filters and ranks components (see find_components) with array
+    operations only, however many components there are.
+    min_areas, min_aspect_ratios = threshold of every component
+        (area >= min_area, aspect ratio > min_aspect_ratio)
+    polygon = optional polygon (e.g. the table), a blob's bbox center
+        must lie inside it
+    offset = (x, y) added to every box first (window -> frame coordinates),
+        polygon is in the shifted coordinates
+    Returns a CANDIDATE_DTYPE array sorted by label, then by decreasing area.
+    """
+
+    labels = components["label"]
+    x = components["x"] + offset[0]
+    y = components["y"] + offset[1]
+    w = components["w"]
+    h = components["h"]
+    area = components["area"]
+
+    aspect_ratio = np.maximum(w, h) / (np.minimum(w, h) + 1e-5)
+
+    valid = area >= min_areas
+    valid &= aspect_ratio > min_aspect_ratios
+
+    if polygon is not None and np.any(valid):
+        centers = np.stack([x + w // 2, y + h // 2], axis=1)
+        valid[valid] = points_in_polygon(centers[valid], polygon)
+
+    selected = np.flatnonzero(valid)
+
+    # Sort by class, then by decreasing area
+    order = selected[np.lexsort((-area[selected], labels[selected]))]
+
+    candidates = np.zeros(len(order), CANDIDATE_DTYPE)
+    candidates["label"] = labels[order]
+    candidates["x"] = x[order]
+    candidates["y"] = y[order]
+    candidates["w"] = w[order]
+    candidates["h"] = h[order]
+    candidates["area"] = area[order]
+    candidates["aspect_ratio"] = aspect_ratio[order]
+    candidates["table_x"] = np.nan
+    candidates["table_y"] = np.nan
+
+    # Position within its class
+    if len(order):
+        _, first, group = np.unique(candidates["label"], return_index=True, return_inverse=True)
+        candidates["rank"] = np.arange(len(order)) - first[group]
+
+    return candidates
+
+
+def mask_candidates(mask, min_area=0, min_aspect_ratio=0.0, polygon=None):
+    """
+    Candidates (label 1) of a single binary mask, see select_candidates.
+    One native labelling pass instead of a contour loop.
+    """
+
+    # Grana's block-based labelling, int32 ids so any number of specks fits
+    count, _, stats, _ = cv2.connectedComponentsWithStatsWithAlgorithm(
+        mask, 8, cv2.CV_32S, cv2.CCL_GRANA)
+
+    # Drop background component 0
+    stats = stats[1:].astype(np.int32)
+    components = {
+        "label": np.ones(count - 1, np.int32),
+        "x": stats[:, cv2.CC_STAT_LEFT],
+        "y": stats[:, cv2.CC_STAT_TOP],
+        "w": stats[:, cv2.CC_STAT_WIDTH],
+        "h": stats[:, cv2.CC_STAT_HEIGHT],
+        "area": stats[:, cv2.CC_STAT_AREA]
+    }
+
+    return select_candidates(components, min_area, min_aspect_ratio, polygon)
@@ -1,11 +1,18 @@
 import cv2
 import numpy as np
 
+from Perception.frame_buffers import FrameBuffers
+from Perception.geometry import project
+from Runtime.profiler import profiler
+
 aruco = cv2.aruco
 
 # Use dictionary of predefined markers from arUco
 dictionary = aruco.getPredefinedDictionary(aruco.DICT_4X4_50)
 
+# Detector is built once and reused for every frame
+detector = aruco.ArucoDetector(dictionary, aruco.DetectorParameters())
+
 MARKER_TO_CORNER = {
     0: "TL", # Top-Left Marker
     1: "TR", # Top-Right Marker
@@ -13,55 +20,399 @@ MARKER_TO_CORNER = {
     3: "BL"  # Bottom-Left Marker
 }
 
+# Table corner order used for image_pts
+CORNER_ORDER = ("TL", "TR", "BR", "BL")
+
+# Normalized table coordinates
+# (0,0) = top-left, (1,1) = bottom-right
+TABLE_PTS = np.array(
+    [
+        [0.0, 0.0],
+        [1.0, 0.0],
+        [1.0, 1.0],
+        [0.0, 1.0]
+    ],
+    dtype=np.float32
+)
+
+
 def detect_table_and_homography(frame):
     # Convert frame to grayscale for marker detection
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    with profiler.timer("table_detection.gray"):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    with profiler.timer("table_detection.aruco"):
+        marker_corners = detect_marker_corners(gray)
+
+    with profiler.timer("table_detection.homography"):
+        return homography_from_marker_corners(marker_corners)
 
-    # Detect markers in the frame
-    corners, ids, _ = aruco.detectMarkers(gray, dictionary)
 
-    table_points = {}
+def detect_marker_corners(gray):
+
+    # Returns {"TL": 4x2 corner array, ...} for every table marker found
+    corners, ids, _ = detector.detectMarkers(gray)
+
+    marker_corners = {}
 
     if ids is None:
-        return None, None
+        return marker_corners
 
     # Iterate through detected marker IDs
     for i, marker_id in enumerate(ids.flatten()):
         if marker_id in MARKER_TO_CORNER:
-            center = corners[i][0].mean(axis=0)
-            table_points[MARKER_TO_CORNER[marker_id]] = center
+            marker_corners[MARKER_TO_CORNER[marker_id]] = corners[i][0]
+
+    return marker_corners
+
+
+def refine_marker_corners(gray, marker_corners, win_size=3):
 
-     # All 4 table corners must be detected
-    if len(table_points) != 4:
+    # Sub-pixel positions of all marker corners, one cornerSubPix call
+    if not marker_corners:
+        return marker_corners
+
+    names = list(marker_corners)
+    points = np.concatenate([marker_corners[name] for name in names]).astype(np.float32)
+
+    cv2.cornerSubPix(
+        gray,
+        points.reshape(-1, 1, 2),
+        (win_size, win_size),
+        (-1, -1),
+        (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_COUNT, 20, 0.01))
+
+    return {name: points[4 * i:4 * i + 4] for i, name in enumerate(names)}
+
+
+def homography_from_marker_corners(marker_corners):
+
+    # All 4 table corners must be detected
+    if len(marker_corners) != 4:
         return None, None
 
-    # Image-space coordinates of table corners
+    # Image-space coordinates of table corners (marker centers)
     # Ordered in: TL, TR, BR, BL
     image_pts = np.array(
-        [
-            table_points["TL"],
-            table_points["TR"],
-            table_points["BR"],
-            table_points["BL"]
-        ],
-        dtype=np.float32
-    )
-
-    # Normalized table coordinates
-    # (0,0) = top-left, (1,1) = bottom-right
-    table_pts = np.array(
-        [
-            [0.0, 0.0],
-            [1.0, 0.0],
-            [1.0, 1.0],
-            [0.0, 1.0]
-        ],
+        [marker_corners[corner].mean(axis=0) for corner in CORNER_ORDER],
         dtype=np.float32
     )
 
     # H is a 3x3 transformation matrix that maps 
     # points from the table coordinate system 
     # to the image pixel coordinate system
-    H, _ = cv2.findHomography(table_pts, image_pts)
+    H, _ = cv2.findHomography(TABLE_PTS, image_pts)
 
     return image_pts, H
+
+
+class HomographyStabilizer:
+
+    def __init__(self, threshold=1.0, ransac_threshold=3.0, layout_frames=30):
+        """
+        Fits the table homography to all 16 marker corners instead of
+        the 4 marker centers, and keeps publishing the same H while the
+        new fit moves no table corner by more than threshold pixels.
+        ransac_threshold = reprojection error (pixels) above which a
+                           corner is ignored by the fit
+        layout_frames = frames used to measure where each marker corner
+                        lies on the table (table units, from the center fit)
+        version = increases by one every time a new H is published,
+                  caches of anything derived from H can key on it
+        """
+
+        self.threshold = threshold
+        self.ransac_threshold = ransac_threshold
+        self.layout_frames = layout_frames
+
+        # Table coordinates of the 16 marker corners (TL, TR, BR, BL
+        # markers, 4 corners each), averaged over the first frames
+        self.layout = None
+        self.layout_count = 0
+
+        # Published homography and the marker corners it was fitted to
+        self.H = None
+        self.image_pts = None
+        self.marker_corners = None
+        self.version = 0
+
+        self.fits = 0
+        self.published = 0
+
+    def update(self, marker_corners):
+        """
+        marker_corners = {"TL": 4x2 corner array, ...}
+        Returns (image_pts, H) of the published homography,
+        (None, None) unless all 4 markers are given.
+        """
+
+        if len(marker_corners) != 4:
+            return None, None
+
+        corners = np.array([marker_corners[corner] for corner in CORNER_ORDER], dtype=np.float32)
+
+        self.learn_layout(corners)
+
+        H = None
+        if self.layout is not None:
+            H, _ = cv2.findHomography(
+                self.layout.reshape(-1, 2),
+                corners.reshape(-1, 2),
+                cv2.RANSAC,
+                self.ransac_threshold)
+
+        if H is None:
+            _, H = homography_from_marker_corners(marker_corners)
+
+        self.fits += 1
+        image_pts = project(TABLE_PTS, H)
+
+        # Jitter: keep the published H (and everything cached on it)
+        if self.H is not None:
+            change = np.linalg.norm(image_pts - self.image_pts, axis=1).max()
+
+            if change <= self.threshold:
+                return self.image_pts, self.H
+
+        self.H = H
+        self.image_pts = image_pts
+        self.marker_corners = corners
+        self.version += 1
+        self.published += 1
+
+        return self.image_pts, self.H
+
+    def restore(self, H, marker_corners=None, layout=None):
+        """
+        Publishes a saved homography (e.g. from before a restart)
+        without seeing the markers. layout = saved marker layout,
+        used as fully learned.
+        """
+
+        if layout is not None:
+            self.layout = np.asarray(layout, dtype=np.float64).reshape(4, 4, 2)
+            self.layout_count = self.layout_frames
+
+        self.H = np.asarray(H, dtype=np.float64).reshape(3, 3)
+        self.image_pts = project(TABLE_PTS, self.H)
+        self.marker_corners = None
+        if marker_corners is not None:
+            self.marker_corners = np.asarray(marker_corners, dtype=np.float32).reshape(4, 4, 2)
+
+        self.version += 1
+
+        return self.image_pts, self.H
+
+    def learn_layout(self, corners):
+
+        if self.layout_count >= self.layout_frames:
+            return
+
+        # Marker corners in table units through the 4-center homography
+        centers = corners.mean(axis=1)
+        H, _ = cv2.findHomography(TABLE_PTS, centers)
+
+        if H is None:
+            return
+
+        layout = project(corners.reshape(-1, 2), np.linalg.inv(H)).reshape(4, 4, 2)
+
+        # Running mean
+        self.layout_count += 1
+
+        if self.layout is None:
+            self.layout = layout
+        else:
+            self.layout += (layout - self.layout) / self.layout_count
+
+    def reset(self):
+
+        # Forget the published H, the next fit is published as is
+        # (the marker layout on the table stays valid)
+        self.H = None
+        self.image_pts = None
+        self.marker_corners = None
+
+
+class TableTracker:
+
+    def __init__(
+        self,
+        redetect_interval=30,
+        search_margin=24,
+        win_size=15,
+        max_fb_error=1.0,
+        max_area_change=0.3,
+        refine_corners=True
+    ):
+        """
+        Follows the 4 table markers between full ArUco detections.
+        redetect_interval = frames between forced full detections
+        search_margin = pixels around each marker searched by optical flow
+        win_size = Lucas-Kanade window size
+        max_fb_error = max forward-backward error (pixels) of a tracked corner
+        max_area_change = max relative change of a marker's area
+        refine_corners = refine detected marker corners to sub-pixel
+                         accuracy (tracked corners already are)
+        Tracking falls back to full detection as soon as one check fails.
+        """
+
+        self.redetect_interval = redetect_interval
+        self.search_margin = search_margin
+        self.win_size = (win_size, win_size)
+        self.max_fb_error = max_fb_error
+        self.max_area_change = max_area_change
+        self.refine_corners = refine_corners
+
+        # Last marker corners in image space and the
+        # grayscale search window around each marker
+        self.marker_corners = None
+        self.patches = {}
+        self.reference_areas = {}
+
+        self.frames_since_detection = 0
+
+        # "detected", "tracked" or "lost"
+        self.mode = None
+        self.detections = 0
+        self.tracked_frames = 0
+
+        # Grayscale frame of full detections, reused
+        self.buffers = FrameBuffers()
+
+    def update(self, frame):
+
+        # Follow markers with optical flow between full detections
+        if self.marker_corners is not None \
+                and self.frames_since_detection < self.redetect_interval:
+
+            with profiler.timer("table_detection.track"):
+                tracked = self.track(frame)
+
+            if tracked is not None:
+                self.frames_since_detection += 1
+                self.tracked_frames += 1
+                self.mode = "tracked"
+
+                with profiler.timer("table_detection.homography"):
+                    return homography_from_marker_corners(tracked)
+
+        # Full-frame ArUco detection
+        with profiler.timer("table_detection.gray"):
+            gray = cv2.cvtColor(
+                frame, cv2.COLOR_BGR2GRAY,
+                dst=self.buffers.get("gray", frame.shape[:2]))
+
+        with profiler.timer("table_detection.aruco"):
+            marker_corners = detect_marker_corners(gray)
+
+        self.detections += 1
+
+        if len(marker_corners) != 4:
+            self.reset()
+            self.mode = "lost"
+            return None, None
+
+        if self.refine_corners:
+            with profiler.timer("table_detection.subpixel"):
+                marker_corners = refine_marker_corners(gray, marker_corners)
+
+        self.marker_corners = marker_corners
+        self.reference_areas = {
+            corner: cv2.contourArea(points)
+            for corner, points in marker_corners.items()
+        }
+        self.store_patches(frame, gray)
+        self.frames_since_detection = 0
+        self.mode = "detected"
+
+        with profiler.timer("table_detection.homography"):
+            return homography_from_marker_corners(marker_corners)
+
+    def reset(self):
+
+        self.marker_corners = None
+        self.patches = {}
+        self.reference_areas = {}
+        self.frames_since_detection = 0
+
+    def search_window(self, points, frame_shape):
+
+        # Bounding rectangle of the marker grown by search_margin
+        frame_h, frame_w = frame_shape[:2]
+        x, y, w, h = cv2.boundingRect(points.astype(np.float32))
+
+        x1 = max(0, x - self.search_margin)
+        y1 = max(0, y - self.search_margin)
+        x2 = min(frame_w, x + w + self.search_margin)
+        y2 = min(frame_h, y + h + self.search_margin)
+
+        return x1, y1, x2, y2
+
+    def store_patches(self, frame, gray=None):
+
+        self.patches = {}
+
+        for corner, points in self.marker_corners.items():
+            x1, y1, x2, y2 = self.search_window(points, frame.shape)
+
+            if gray is not None:
+                patch = gray[y1:y2, x1:x2].copy()
+            else:
+                patch = cv2.cvtColor(frame[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY)
+
+            self.patches[corner] = ((x1, y1, x2, y2), patch)
+
+    # Returns tracked marker corners, or None if tracking is unreliable
+    def track(self, frame):
+
+        tracked = {}
+
+        for corner, points in self.marker_corners.items():
+            (x1, y1, x2, y2), prev_patch = self.patches[corner]
+
+            # Same window in the current frame
+            patch = cv2.cvtColor(frame[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY)
+
+            if patch.shape != prev_patch.shape or patch.size == 0:
+                return None
+
+            offset = np.array([x1, y1], np.float32)
+            p0 = (points - offset).reshape(-1, 1, 2).astype(np.float32)
+
+            p1, status, _ = cv2.calcOpticalFlowPyrLK(
+                prev_patch, patch, p0, None,
+                winSize=self.win_size, maxLevel=2)
+
+            if p1 is None or not status.all():
+                return None
+
+            # Track back to the previous frame to measure confidence
+            p0_back, status_back, _ = cv2.calcOpticalFlowPyrLK(
+                patch, prev_patch, p1, None,
+                winSize=self.win_size, maxLevel=2)
+
+            if p0_back is None or not status_back.all():
+                return None
+
+            if np.abs(p0_back - p0).max() > self.max_fb_error:
+                return None
+
+            new_points = p1.reshape(4, 2) + offset
+
+            # Marker must keep roughly the same size in the image
+            area = cv2.contourArea(new_points)
+            reference = self.reference_areas[corner]
+
+            if reference <= 0:
+                return None
+
+            if abs(area - reference) / reference > self.max_area_change:
+                return None
+
+            tracked[corner] = new_points
+
+        self.marker_corners = tracked
+        self.store_patches(frame)
+
+        return tracked
@@ -0,0 +1,246 @@
+import json
+import socket
+import struct
+import sys
+import time
+
+
+# Binary record stream (little endian), every record starts with
+#   type (uint8), frame index (uint32), timestamp (float64 seconds)
+# HEADER  (0): uint16 length + UTF-8 JSON {"objects": [names], "tasks": [task keys]}
+#              task key = object name, "object label" for objects with
+#              several tasks (e.g. "cup A"); JSON frame objects use these keys
+# FRAME   (1): flags (uint8, bit 0 = homography valid), uint16 object count,
+#              then per object: class index into "objects" (uint16), task
+#              index into "tasks" (uint16), bbox x, y, w, h (int32),
+#              table x, y (float32), track id (uint32, 0 = untracked)
+# STATE   (2): previous step (uint16), new step (uint16)
+#              step = index into "tasks", len(tasks) = complete
+RECORD_HEADER = 0
+RECORD_FRAME = 1
+RECORD_STATE = 2
+
+PREFIX = struct.Struct("<BId")
+FRAME_INFO = struct.Struct("<BH")
+OBJECT_ENTRY = struct.Struct("<HH4i2fI")
+STATE_INFO = struct.Struct("<HH")
+
+FORMATS = ("jsonl", "binary")
+
+
+def open_sink(spec):
+    """
+    Returns a binary write function for:
+        "-"                      stdout
+        "tcp://127.0.0.1:9000"   local TCP listener
+        "unix:///tmp/tgs.sock"   Unix domain socket
+        anything else            file path (appended)
+    and a close function.
+    """
+
+    if spec == "-":
+        stream = sys.stdout.buffer
+
+        def close():
+            stream.flush()
+
+        def write(data):
+            stream.write(data)
+            stream.flush()
+
+        return write, close
+
+    if spec.startswith("tcp://"):
+        host, port = spec[len("tcp://"):].rsplit(":", 1)
+        sock = socket.create_connection((host, int(port)))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock.sendall, sock.close
+
+    if spec.startswith("unix://"):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(spec[len("unix://"):])
+        return sock.sendall, sock.close
+
+    f = open(spec, "ab")
+
+    def write(data):
+        f.write(data)
+        f.flush()
+
+    return write, f.close
+
+
+def frame_event(index, timestamp, result):
+
+    # JSON-ready summary of one perception result
+    detected_objects = result["detected_objects"] or {}
+
+    return {
+        "type": "frame",
+        "frame": index,
+        "t": round(timestamp, 4),
+        "homography_valid": result["H"] is not None,
+        "objects": {
+            name: {
+                "bbox": [int(v) for v in data["bbox"]],
+                "table_coords": [round(float(v), 4) for v in data["table_coords"]],
+                "track_id": data.get("track_id")
+            }
+            for name, data in detected_objects.items()
+            if data is not None
+        }
+    }
+
+
+def state_summary(state):
+
+    # JSON-ready summary of a task state (snapshot)
+    return {
+        "state": state.current_state,
+        "current": state.get_current_object(),
+        "placed": dict(state.placed),
+        "verified": dict(state.verified)
+    }
+
+
+class EventWriter:
+
+    def __init__(self, sink, registry, tasks, fmt="jsonl", batch_size=32, flush_interval=0.25):
+        """
+        Encodes per-frame detections and task state transitions.
+        sink = "-", file path, "tcp://host:port" or "unix://path"
+        registry = ObjectRegistry (object names)
+        tasks = task keys in order (TaskStateManager.order), the keys
+                of the detections in every result
+        fmt = "jsonl" (one JSON object per line) or "binary"
+        Records are buffered and written once batch_size records are
+        queued or flush_interval seconds have passed.
+        """
+
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown event format: {fmt}")
+
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.write_fn, self.close_fn = open_sink(sink)
+
+        self.object_names = registry.names
+        self.class_index = {name: i for i, name in enumerate(self.object_names)}
+        self.task_order = list(tasks)
+        self.task_index = {key: i for i, key in enumerate(self.task_order)}
+
+        self.buffer = []
+        self.last_flush = time.perf_counter()
+        self.last_step = None
+        self.records = 0
+
+        self.emit_header()
+
+    def emit_header(self):
+
+        header = {
+            "objects": self.object_names,
+            "tasks": self.task_order
+        }
+
+        if self.fmt == "jsonl":
+            self.add(self.encode_json(dict(type="header", frame=0, t=0.0, **header)))
+        else:
+            payload = json.dumps(header).encode()
+            self.add(
+                PREFIX.pack(RECORD_HEADER, 0, 0.0)
+                + struct.pack("<H", len(payload))
+                + payload)
+
+    def frame(self, index, timestamp, result):
+        """
+        result = Station.process() output (H, detected_objects, state)
+        Writes one frame record, plus a state record when the task
+        state changed since the previous frame.
+        """
+
+        detected_objects = result["detected_objects"] or {}
+        state = result["state"]
+        homography_valid = result["H"] is not None
+
+        objects = {
+            name: data for name, data in detected_objects.items()
+            if data is not None
+        }
+
+        if self.fmt == "jsonl":
+            self.add(self.encode_json(frame_event(index, timestamp, result)))
+        else:
+            record = [
+                PREFIX.pack(RECORD_FRAME, index, timestamp),
+                FRAME_INFO.pack(1 if homography_valid else 0, len(objects))
+            ]
+
+            for key, data in objects.items():
+                x, y, w, h = data["bbox"]
+                tx, ty = data["table_coords"]
+                record.append(OBJECT_ENTRY.pack(
+                    self.class_index[state.object_of(key)],
+                    self.task_index[key],
+                    int(x), int(y), int(w), int(h),
+                    float(tx), float(ty),
+                    data.get("track_id") or 0))
+
+            self.add(b"".join(record))
+
+        # State transitions
+        if self.last_step is not None and state.step != self.last_step:
+            self.state_change(index, timestamp, self.last_step, state)
+
+        self.last_step = state.step
+
+        self.maybe_flush()
+
+    def state_change(self, index, timestamp, previous_step, state):
+
+        if self.fmt == "jsonl":
+            self.add(self.encode_json({
+                "type": "state",
+                "frame": index,
+                "t": round(timestamp, 4),
+                "from": state.state_name(previous_step),
+                "to": state.current_state,
+                "placed": state.placed
+            }))
+        else:
+            self.add(
+                PREFIX.pack(RECORD_STATE, index, timestamp)
+                + STATE_INFO.pack(previous_step, state.step))
+
+        # Transitions are written immediately
+        self.flush()
+
+    @staticmethod
+    def encode_json(event):
+        return (json.dumps(event, separators=(",", ":")) + "\n").encode()
+
+    def add(self, data):
+
+        self.buffer.append(data)
+        self.records += 1
+
+    def maybe_flush(self):
+
+        if len(self.buffer) >= self.batch_size \
+                or time.perf_counter() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+
+        if self.buffer:
+            self.write_fn(b"".join(self.buffer))
+            self.buffer = []
+
+        self.last_flush = time.perf_counter()
+
+    def close(self):
+
+        self.flush()
+        self.close_fn()
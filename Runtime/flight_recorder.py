@@ -0,0 +1,478 @@
+import json
+import math
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+from Runtime.event_stream import frame_event, state_summary
+from Runtime.frame_sources import FrameSource, Pacer
+
+
+# Flight recorder ring file:
+#   header page: magic, then JSON {"shape", "slots", "meta_size"}
+#   slot table: one SLOT_DTYPE entry per slot
+#   metadata: meta_size bytes per slot (JSON of the frame's result)
+#   frames: raw uint8 frames, one per slot
+# A slot with sequence 0 is empty or being written. The slot with the
+# highest sequence holds the newest frame.
+RING_MAGIC = b"TGSRING1"
+RING_EXTENSION = ".tgsring"
+PAGE_SIZE = 4096
+
+SLOT_DTYPE = np.dtype([
+    ("sequence", "<i8"),
+    ("frame_index", "<i8"),
+    ("timestamp", "<f8"),
+    ("meta_length", "<u4"),
+    ("reserved", "<u4")
+])
+
+
+def align(offset):
+    return (offset + PAGE_SIZE - 1) // PAGE_SIZE * PAGE_SIZE
+
+
+class FlightRing:
+
+    def __init__(self, path, shape=None, slots=None, meta_size=4096):
+        """
+        Memory maps of one ring file.
+        With shape and slots the file is created (or overwritten),
+        without them an existing ring (or a dump of one) is opened
+        read-only.
+        """
+
+        self.path = path
+        create = shape is not None
+
+        if create:
+            header = json.dumps({
+                "shape": list(shape),
+                "slots": slots,
+                "meta_size": meta_size
+            }).encode()
+
+            with open(path, "wb") as f:
+                f.write(RING_MAGIC + header.ljust(PAGE_SIZE - len(RING_MAGIC)))
+        else:
+            with open(path, "rb") as f:
+                page = f.read(PAGE_SIZE)
+
+            if not page.startswith(RING_MAGIC):
+                raise ValueError(f"{path} is not a flight recording")
+
+            header = json.loads(page[len(RING_MAGIC):].rstrip(b"\0 "))
+            shape = tuple(header["shape"])
+            slots = header["slots"]
+            meta_size = header["meta_size"]
+
+        self.shape = tuple(shape)
+        self.slots = slots
+        self.meta_size = meta_size
+
+        table_offset = PAGE_SIZE
+        meta_offset = align(table_offset + slots * SLOT_DTYPE.itemsize)
+        frame_offset = align(meta_offset + slots * meta_size)
+        size = frame_offset + slots * int(np.prod(shape))
+
+        mode = "r"
+        if create:
+            # Sparse file of the final size, pages are only
+            # allocated as the ring fills up
+            with open(path, "r+b") as f:
+                f.truncate(size)
+            mode = "r+"
+
+        self.table = np.memmap(path, SLOT_DTYPE, mode, table_offset, (slots,))
+        self.meta = np.memmap(path, np.uint8, mode, meta_offset, (slots, meta_size))
+        self.frames = np.memmap(path, np.uint8, mode, frame_offset, (slots,) + self.shape)
+
+    def ordered_slots(self):
+
+        # Filled slots, oldest first
+        sequence = np.asarray(self.table["sequence"])
+        filled = np.flatnonzero(sequence > 0)
+        return filled[np.argsort(sequence[filled])]
+
+    def metadata(self, slot):
+
+        length = int(self.table["meta_length"][slot])
+        if length == 0:
+            return None
+
+        return json.loads(self.meta[slot, :length].tobytes())
+
+    def close(self):
+
+        # Unmapping writes nothing extra: the pages are shared with the file
+        self.table = None
+        self.meta = None
+        self.frames = None
+
+
+class AnomalyDetector:
+
+    def __init__(self, lost_frames=30, latency_ms=250.0, warmup_frames=30):
+        """
+        Flags moments worth keeping:
+            "table_lost"      markers not found for lost_frames frames
+            "object_lost"     guided object missing for lost_frames frames
+            "placement_lost"  a placed object failed its verification
+            "latency"         a frame took more than latency_ms from capture
+                              to its perception result
+                              (not during the first warmup_frames frames)
+        """
+
+        self.lost_frames = lost_frames
+        self.latency_ms = latency_ms
+        self.warmup_frames = warmup_frames
+        self.frames = 0
+
+        self.table_missing = 0
+        self.object_missing = 0
+        self.verified = {}
+
+    def check(self, result, latency=None):
+
+        # Returns the anomaly of this frame or None
+        reason = None
+        self.frames += 1
+
+        if result.get("table_mode") == "lost":
+            self.table_missing += 1
+            if self.table_missing == self.lost_frames:
+                reason = "table_lost"
+        elif result.get("table_mode") is not None:
+            self.table_missing = 0
+
+        state = result["state"]
+        detected_objects = result["detected_objects"]
+        current = state.get_current_object()
+
+        if detected_objects is not None and current is not None:
+            if detected_objects.get(current) is None:
+                self.object_missing += 1
+                if self.object_missing == self.lost_frames:
+                    reason = reason or "object_lost"
+            else:
+                self.object_missing = 0
+
+        # Only a change from verified (or unchecked) to failed counts
+        for obj, verified in state.verified.items():
+            if verified is False and self.verified.get(obj) is not False:
+                reason = reason or "placement_lost"
+            self.verified[obj] = verified
+
+        if latency is not None and self.frames > self.warmup_frames \
+                and latency * 1000.0 > self.latency_ms:
+            reason = reason or "latency"
+
+        return reason
+
+
+class FlightRecorder:
+
+    def __init__(
+        self,
+        path,
+        seconds=10.0,
+        fps=30.0,
+        max_bytes=1 << 30,
+        dump_dir="flight_dumps",
+        meta_size=4096,
+        post_seconds=2.0,
+        cooldown=30.0,
+        anomaly_detector=None
+    ):
+        """
+        Always-on ring of the last seconds of raw frames and their
+        perception results, kept in a memory-mapped file (path) so it
+        survives a crash and never grows.
+        max_bytes = limit of the frames kept, fewer than seconds * fps
+                    frames are kept when large frames would exceed it
+        write_frame() runs on the capture thread (one copy into the
+        map, no encoding), record_result() adds the result of a frame.
+        A dump copies the filled slots, oldest first, into a new ring
+        file in dump_dir, on request or post_seconds after an anomaly
+        (at most one per cooldown seconds). Recording goes on during a
+        dump, only slots not copied yet are never overwritten.
+        """
+
+        self.path = path
+        self.max_slots = max(1, int(math.ceil(seconds * fps)))
+        self.max_bytes = max_bytes
+        self.meta_size = meta_size
+        self.dump_dir = dump_dir
+        self.post_seconds = post_seconds
+        self.cooldown = cooldown
+
+        if anomaly_detector is None:
+            anomaly_detector = AnomalyDetector()
+        self.anomaly_detector = anomaly_detector
+
+        # Created with the first frame, which fixes the frame size
+        # and the number of slots
+        self.ring = None
+        self.slots = None
+
+        self.lock = threading.Lock()
+        self.sequence = 0
+        self.frames_seen = 0
+        self.skipped = 0
+
+        # frame index -> slot, only for frames still in the ring
+        self.slot_of = {}
+
+        # Slots a running dump has not copied yet
+        self.frozen = set()
+
+        self.dumping = False
+        self.pending_dump = None
+        self.last_dump_time = None
+        self.dump_thread = None
+        self.dumps = []
+
+    def write_frame(self, frame, timestamp):
+        """
+        Copies a raw frame into the ring.
+        Returns the frame's index (0, 1, 2, ... in read order,
+        the same numbering as pipeline packets).
+        """
+
+        with self.lock:
+            index = self.frames_seen
+            self.frames_seen += 1
+
+            if self.ring is None:
+                frame_bytes = max(1, frame.nbytes)
+                self.slots = max(1, min(self.max_slots, self.max_bytes // frame_bytes))
+                self.ring = FlightRing(self.path, frame.shape, self.slots, self.meta_size)
+
+            slot = self.sequence % self.slots
+
+            # Oldest slot still waits for a running dump
+            if slot in self.frozen or frame.shape != self.ring.shape:
+                self.skipped += 1
+                return index
+
+            self.sequence += 1
+
+            # Slot is invalid until the copy has finished
+            old_index = int(self.ring.table["frame_index"][slot])
+            if self.slot_of.get(old_index) == slot:
+                del self.slot_of[old_index]
+
+            self.ring.table["sequence"][slot] = 0
+
+        np.copyto(self.ring.frames[slot], frame)
+
+        with self.lock:
+            table = self.ring.table
+            table["frame_index"][slot] = index
+            table["timestamp"][slot] = timestamp
+            table["meta_length"][slot] = 0
+            table["sequence"][slot] = self.sequence
+
+            self.slot_of[index] = slot
+
+        return index
+
+    def record_result(self, index, result, latency=None):
+        """
+        Stores the perception result of frame index next to the frame
+        and checks it for anomalies.
+        """
+
+        reason = self.anomaly_detector.check(result, latency)
+        if reason is not None:
+            self.request_dump(reason, delay=self.post_seconds)
+
+        event = frame_event(index, result.get("timestamp", 0.0), result)
+        event.update(state_summary(result["state"]))
+        event.update({
+            "table_mode": result.get("table_mode"),
+            "latency": None if latency is None else round(latency, 4)
+        })
+        if reason is not None:
+            event["anomaly"] = reason
+
+        payload = json.dumps(event, separators=(",", ":")).encode()
+
+        if len(payload) > self.meta_size:
+            payload = json.dumps({"frame": index, "truncated": True}).encode()
+
+        with self.lock:
+            slot = self.slot_of.get(index)
+
+            if slot is not None:
+                self.ring.meta[slot, :len(payload)] = np.frombuffer(payload, np.uint8)
+                self.ring.table["meta_length"][slot] = len(payload)
+
+        self.start_due_dump()
+
+    def request_dump(self, reason="manual", delay=0.0):
+
+        now = time.monotonic()
+
+        with self.lock:
+            if self.pending_dump is not None or self.dumping:
+                return False
+
+            # Manual dumps are always taken, anomalies are rate-limited
+            if reason != "manual" and self.last_dump_time is not None \
+                    and now - self.last_dump_time < self.cooldown:
+                return False
+
+            self.pending_dump = (reason, now + delay)
+
+        self.start_due_dump()
+        return True
+
+    def start_due_dump(self):
+
+        with self.lock:
+            if self.pending_dump is None or self.ring is None:
+                return
+
+            reason, due = self.pending_dump
+            if time.monotonic() < due:
+                return
+
+            self.pending_dump = None
+            self.dumping = True
+
+            # Filled slots at this moment, oldest first; the writer
+            # skips frames rather than overwrite one before it is copied
+            order = list(self.ring.ordered_slots())
+            self.frozen = set(order)
+
+        self.dump_thread = threading.Thread(
+            target=self.dump,
+            args=(reason, order),
+            name="flight-dump",
+            daemon=True)
+        self.dump_thread.start()
+
+    def dump(self, reason, order):
+
+        try:
+            os.makedirs(self.dump_dir, exist_ok=True)
+
+            name = f"flight_{time.strftime('%Y%m%d-%H%M%S')}_{reason}{RING_EXTENSION}"
+            path = os.path.join(self.dump_dir, name)
+
+            # A ring of exactly the copied frames, oldest in slot 0
+            ring = self.ring
+            dump = FlightRing(path, ring.shape, max(1, len(order)), self.meta_size)
+
+            for position, slot in enumerate(order):
+                np.copyto(dump.frames[position], ring.frames[slot])
+
+                # Metadata may still arrive for the newest frames,
+                # it is copied last, right before the slot is released
+                with self.lock:
+                    dump.table[position] = ring.table[slot]
+                    dump.meta[position] = ring.meta[slot]
+                    dump.table["sequence"][position] = position + 1
+                    self.frozen.discard(slot)
+
+            dump.frames.flush()
+            dump.meta.flush()
+            dump.table.flush()
+            dump.close()
+
+            self.dumps.append(path)
+
+            # stderr: stdout may carry the event stream
+            print(f"Flight recorder: {reason}, last {len(order)} frames saved to {path}", file=sys.stderr)
+
+        finally:
+            with self.lock:
+                self.frozen = set()
+                self.dumping = False
+                self.last_dump_time = time.monotonic()
+
+    def close(self):
+
+        if self.dump_thread is not None:
+            self.dump_thread.join()
+
+        with self.lock:
+            if self.ring is not None:
+                self.ring.close()
+                self.ring = None
+
+
+class FlightRecorderSource(FrameSource):
+
+    def __init__(self, source, recorder):
+        """
+        Wraps another source and copies every frame it delivers
+        into a FlightRecorder (on the thread that reads frames).
+        """
+
+        super().__init__()
+
+        self.source = source
+        self.live = source.live
+        self.recorder = recorder
+
+    def read(self):
+
+        success, frame = self.source.read()
+
+        if success:
+            self.frame_index = self.source.frame_index
+            self.timestamp = self.source.timestamp
+            self.recorder.write_frame(frame, self.timestamp)
+
+        return success, frame
+
+    def release(self):
+        self.source.release()
+        self.recorder.close()
+
+
+class FlightRecordingSource(FrameSource):
+
+    def __init__(self, path, realtime=False):
+        """
+        Replays a flight recorder ring or dump, oldest frame first.
+        metadata = stored result of the last frame read (or None)
+        """
+
+        super().__init__()
+
+        self.ring = FlightRing(path)
+        self.order = list(self.ring.ordered_slots())
+        self.position = 0
+        self.metadata = None
+
+        self.live = realtime
+        self.pacer = Pacer() if realtime else None
+
+    def read(self):
+
+        if self.position >= len(self.order):
+            return False, None
+
+        slot = self.order[self.position]
+        self.position += 1
+
+        # Copy: the map is read-only and frames get drawn on
+        frame = np.array(self.ring.frames[slot])
+
+        self.frame_index += 1
+        self.timestamp = float(self.ring.table["timestamp"][slot])
+        self.metadata = self.ring.metadata(slot)
+
+        if self.pacer is not None:
+            self.pacer.wait(self.timestamp)
+
+        return True, frame
+
+    def release(self):
+        self.ring.close()
@@ -0,0 +1,358 @@
+import os
+import struct
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from Runtime.pipeline import FrameQueue, BLOCK
+
+
+# Recorded session container:
+#   magic header, then one record per frame:
+#   timestamp (float64, seconds since recording start),
+#   payload size (uint32), encoded frame bytes (PNG or JPEG)
+SESSION_MAGIC = b"TGSREC1\n"
+SESSION_EXTENSION = ".tgsrec"
+RECORD_HEADER = struct.Struct("<dI")
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+
+
+class FrameSource:
+    """
+    Common interface of every frame source.
+    read() -> (success, frame), same as cv2.VideoCapture
+    live = True if frames arrive at camera speed and stale frames
+           may be dropped, False if every frame should be processed
+    timestamp = capture time (seconds) of the last frame read
+    """
+
+    live = False
+
+    def __init__(self):
+        self.timestamp = None
+        self.frame_index = -1
+
+    def read(self):
+        raise NotImplementedError
+
+    def release(self):
+        pass
+
+
+class Pacer:
+
+    def __init__(self):
+        """
+        Sleeps so that frames are delivered at their recorded timing.
+        """
+
+        self.start_wall = None
+        self.start_media = None
+
+    def wait(self, media_time):
+
+        now = time.perf_counter()
+
+        if self.start_wall is None:
+            self.start_wall = now
+            self.start_media = media_time
+            return
+
+        delay = (media_time - self.start_media) - (now - self.start_wall)
+
+        if delay > 0:
+            time.sleep(delay)
+
+
+class CameraSource(FrameSource):
+
+    live = True
+
+    def __init__(self, index=1, api=cv2.CAP_ANY):
+        super().__init__()
+
+        # Camera is connected to Iphone using Camo Camera (index 1)
+        self.cap = cv2.VideoCapture(index, api)
+        self.start_time = time.perf_counter()
+
+    def read(self):
+
+        success, frame = self.cap.read()
+
+        if success:
+            self.frame_index += 1
+            self.timestamp = time.perf_counter() - self.start_time
+
+        return success, frame
+
+    def release(self):
+        self.cap.release()
+
+
+class VideoFileSource(FrameSource):
+
+    def __init__(self, path, realtime=False):
+        """
+        realtime = False: deliver frames as fast as possible
+        realtime = True: deliver frames at the file's frame rate
+        """
+
+        super().__init__()
+
+        if not os.path.isfile(path):
+            raise FileNotFoundError(path)
+
+        self.cap = cv2.VideoCapture(path)
+        self.live = realtime
+        self.pacer = Pacer() if realtime else None
+
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.fps = fps if fps and fps > 0 else 30.0
+
+    def read(self):
+
+        success, frame = self.cap.read()
+
+        if not success:
+            return False, None
+
+        self.frame_index += 1
+        self.timestamp = self.frame_index / self.fps
+
+        if self.pacer is not None:
+            self.pacer.wait(self.timestamp)
+
+        return True, frame
+
+    def release(self):
+        self.cap.release()
+
+
+class ImageDirectorySource(FrameSource):
+
+    def __init__(self, path, fps=30.0, realtime=False, loop=False):
+        """
+        Plays the images of a directory in file name order.
+        fps = timing assigned to the images
+        """
+
+        super().__init__()
+
+        self.paths = sorted(
+            os.path.join(path, name)
+            for name in os.listdir(path)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+
+        if not self.paths:
+            raise FileNotFoundError(f"No images found in {path}")
+
+        self.fps = fps
+        self.loop = loop
+        self.live = realtime
+        self.pacer = Pacer() if realtime else None
+
+    def read(self):
+
+        next_index = self.frame_index + 1
+
+        if next_index >= len(self.paths) and not self.loop:
+            return False, None
+
+        frame = cv2.imread(self.paths[next_index % len(self.paths)])
+
+        if frame is None:
+            return False, None
+
+        self.frame_index = next_index
+        self.timestamp = next_index / self.fps
+
+        if self.pacer is not None:
+            self.pacer.wait(self.timestamp)
+
+        return True, frame
+
+
+class SessionSource(FrameSource):
+
+    def __init__(self, path, realtime=False):
+        """
+        Replays a session written by SessionRecorder.
+        realtime = False: deliver frames as fast as possible
+        realtime = True: deliver frames at their recorded timing
+        """
+
+        super().__init__()
+
+        self.file = open(path, "rb")
+
+        if self.file.read(len(SESSION_MAGIC)) != SESSION_MAGIC:
+            self.file.close()
+            raise ValueError(f"{path} is not a recorded session")
+
+        self.live = realtime
+        self.pacer = Pacer() if realtime else None
+
+    def read(self):
+
+        header = self.file.read(RECORD_HEADER.size)
+
+        if len(header) < RECORD_HEADER.size:
+            return False, None
+
+        timestamp, size = RECORD_HEADER.unpack(header)
+        payload = self.file.read(size)
+
+        if len(payload) < size:
+            return False, None
+
+        frame = cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_COLOR)
+
+        self.frame_index += 1
+        self.timestamp = timestamp
+
+        if self.pacer is not None:
+            self.pacer.wait(timestamp)
+
+        return True, frame
+
+    def release(self):
+        self.file.close()
+
+
+class SessionRecorder:
+
+    def __init__(self, path, encoding=".png", jpeg_quality=95, queue_size=64):
+        """
+        Writes frames and their timestamps to a session file.
+        encoding = ".png" (lossless) or ".jpg" (smaller)
+        Encoding runs on a background thread, write() only queues
+        the frame (it blocks if the writer falls queue_size frames behind,
+        so no frame is ever lost).
+        """
+
+        if encoding == ".png":
+            self.params = [cv2.IMWRITE_PNG_COMPRESSION, 1]
+        elif encoding == ".jpg":
+            self.params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        else:
+            raise ValueError(f"Unsupported encoding: {encoding}")
+
+        self.encoding = encoding
+        self.file = open(path, "wb")
+        self.file.write(SESSION_MAGIC)
+
+        self.frames_written = 0
+        self.error = None
+
+        self.queue = FrameQueue(queue_size, BLOCK)
+        self.writer = threading.Thread(
+            target=self.write_loop,
+            name="session-recorder",
+            daemon=True)
+        self.writer.start()
+
+    def write(self, frame, timestamp):
+        self.queue.put((timestamp, frame))
+
+    def write_loop(self):
+
+        try:
+            while True:
+                item = self.queue.get(timeout=0.1)
+
+                if item is None:
+                    if self.queue.is_finished():
+                        break
+                    continue
+
+                timestamp, frame = item
+                success, payload = cv2.imencode(self.encoding, frame, self.params)
+
+                if not success:
+                    raise RuntimeError("Could not encode frame")
+
+                self.file.write(RECORD_HEADER.pack(timestamp, len(payload)))
+                self.file.write(payload.tobytes())
+                self.frames_written += 1
+
+        except Exception as e:
+            self.error = e
+
+        finally:
+            # Unblocks write() if the writer stopped early
+            self.queue.close()
+
+    def close(self):
+
+        self.queue.close()
+        self.writer.join()
+        self.file.close()
+
+        if self.error is not None:
+            raise self.error
+
+
+class RecordingSource(FrameSource):
+
+    def __init__(self, source, path, **recorder_options):
+        """
+        Wraps another source and records every frame it delivers.
+        """
+
+        super().__init__()
+
+        self.source = source
+        self.live = source.live
+        self.recorder = SessionRecorder(path, **recorder_options)
+
+    def read(self):
+
+        success, frame = self.source.read()
+
+        if success:
+            self.frame_index = self.source.frame_index
+            self.timestamp = self.source.timestamp
+            self.recorder.write(frame, self.timestamp)
+
+        return success, frame
+
+    def release(self):
+        self.source.release()
+        self.recorder.close()
+
+
+def open_source(spec, realtime=False, record_path=None):
+    """
+    Builds a frame source from a command-line style spec:
+        "1"              camera index
+        "session.tgsrec" recorded session
+        "frames/"        directory of images
+        "clip.mp4"       video file
+        "dump.tgsring"   flight recorder ring or dump
+    record_path = optional session file to record the frames into
+    """
+
+    # Imported here, the flight recorder builds on FrameSource
+    from Runtime.flight_recorder import FlightRecordingSource, RING_EXTENSION
+
+    spec = str(spec)
+
+    if spec.isdigit():
+        source = CameraSource(int(spec))
+    elif os.path.isdir(spec):
+        source = ImageDirectorySource(spec, realtime=realtime)
+    elif spec.endswith(SESSION_EXTENSION):
+        source = SessionSource(spec, realtime=realtime)
+    elif spec.endswith(RING_EXTENSION):
+        source = FlightRecordingSource(spec, realtime=realtime)
+    else:
+        source = VideoFileSource(spec, realtime=realtime)
+
+    if record_path is not None:
+        source = RecordingSource(source, record_path)
+
+    return source
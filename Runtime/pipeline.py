@@ -0,0 +1,314 @@
+import threading
+import time
+from collections import deque
+
+from Runtime.profiler import profiler
+
+
+# Drop policies for a full queue
+DROP_OLDEST = "drop_oldest"   # Discard the oldest queued item (keep newest)
+DROP_NEWEST = "drop_newest"   # Discard the incoming item (keep queued)
+BLOCK = "block"               # Wait until the consumer makes room
+
+DROP_POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+
+class FrameQueue:
+
+    def __init__(self, maxsize=1, policy=DROP_OLDEST):
+        """
+        Bounded queue between two pipeline stages.
+        maxsize = number of items held before the drop policy applies
+        policy = DROP_OLDEST, DROP_NEWEST or BLOCK
+        """
+
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+
+        if policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy: {policy}")
+
+        self.maxsize = maxsize
+        self.policy = policy
+
+        self.items = deque()
+        self.dropped = 0
+        self.closed = False
+
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.not_full = threading.Condition(self.lock)
+
+    # Returns True if the item was queued
+    def put(self, item):
+
+        with self.lock:
+            if self.closed:
+                return False
+
+            if len(self.items) >= self.maxsize:
+
+                if self.policy == DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+
+                if self.policy == DROP_OLDEST:
+                    self.items.popleft()
+                    self.dropped += 1
+
+                else:
+                    while len(self.items) >= self.maxsize and not self.closed:
+                        self.not_full.wait()
+
+                    if self.closed:
+                        return False
+
+            self.items.append(item)
+            self.not_empty.notify()
+            return True
+
+    # Returns None on timeout or once the queue is closed and drained
+    def get(self, timeout=None):
+
+        with self.lock:
+            if not self.items and not self.closed:
+                self.not_empty.wait(timeout)
+
+            if not self.items:
+                return None
+
+            item = self.items.popleft()
+            self.not_full.notify()
+            return item
+
+    # Wake up every waiting producer/consumer so stages can exit
+    def close(self):
+
+        with self.lock:
+            self.closed = True
+            self.not_empty.notify_all()
+            self.not_full.notify_all()
+
+    def is_finished(self):
+
+        with self.lock:
+            return self.closed and not self.items
+
+    def depth(self):
+
+        with self.lock:
+            return len(self.items)
+
+
+class StageThread(threading.Thread):
+
+    def __init__(self, name, fn, in_queue, out_queue):
+        """
+        Worker thread that applies fn to every item of in_queue
+        and forwards the result to out_queue.
+        Results of None are not forwarded.
+        """
+
+        super().__init__(name=name, daemon=True)
+
+        self.fn = fn
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+
+        self.processed = 0
+        self.busy_time = 0.0
+        self.error = None
+
+    def run(self):
+
+        try:
+            while True:
+                item = self.in_queue.get(timeout=0.1)
+
+                if item is None:
+                    if self.in_queue.is_finished():
+                        break
+                    continue
+
+                start = time.perf_counter()
+                result = self.fn(item)
+                self.busy_time += time.perf_counter() - start
+                self.processed += 1
+
+                if result is not None:
+                    self.out_queue.put(result)
+
+        except Exception as e:
+            self.error = e
+
+        finally:
+            self.out_queue.close()
+
+
+class CaptureThread(threading.Thread):
+
+    def __init__(self, cap, out_queue):
+        """
+        Reads frames from cap as fast as the camera delivers them.
+        With a DROP_OLDEST queue of size 1 the perception stage
+        always receives the newest frame.
+        """
+
+        super().__init__(name="capture", daemon=True)
+
+        self.cap = cap
+        self.out_queue = out_queue
+
+        self.processed = 0
+        self.busy_time = 0.0
+        self.error = None
+
+        self.stop_event = threading.Event()
+
+    def run(self):
+
+        try:
+            frame_index = 0
+
+            while not self.stop_event.is_set():
+                start = time.perf_counter()
+                with profiler.timer("capture"):
+                    success, frame = self.cap.read()
+                self.busy_time += time.perf_counter() - start
+
+                if not success:
+                    break
+
+                self.processed += 1
+                self.out_queue.put({
+                    "index": frame_index,
+                    "timestamp": time.perf_counter(),
+                    "frame": frame
+                })
+                frame_index += 1
+
+        except Exception as e:
+            self.error = e
+
+        finally:
+            self.out_queue.close()
+
+    def stop(self):
+        self.stop_event.set()
+
+
+class Pipeline:
+
+    def __init__(
+        self,
+        cap,
+        process,
+        capture_queue_size=1,
+        capture_policy=DROP_OLDEST,
+        render_queue_size=1,
+        render_policy=DROP_OLDEST
+    ):
+        """
+        Three-stage runtime: capture thread -> perception worker -> render.
+        cap = object with read() -> (success, frame)
+        process = function(packet) -> packet, runs on the perception worker
+        The render stage runs on the caller's thread through results(),
+        because cv2.imshow must be called from the main thread.
+        """
+
+        self.capture_queue = FrameQueue(capture_queue_size, capture_policy)
+        self.render_queue = FrameQueue(render_queue_size, render_policy)
+
+        self.capture = CaptureThread(cap, self.capture_queue)
+        self.perception = StageThread(
+            "perception",
+            process,
+            self.capture_queue,
+            self.render_queue)
+
+        self.rendered = 0
+        self.start_time = None
+
+    def start(self):
+
+        self.start_time = time.perf_counter()
+        self.capture.start()
+        self.perception.start()
+
+    def stop(self):
+
+        self.capture.stop()
+        self.capture_queue.close()
+        self.render_queue.close()
+
+        self.capture.join(timeout=1.0)
+        self.perception.join(timeout=1.0)
+
+    # Yields processed packets until the source runs out
+    def results(self):
+
+        while True:
+            packet = self.render_queue.get(timeout=0.1)
+
+            if packet is None:
+                if self.render_queue.is_finished():
+                    break
+                continue
+
+            self.rendered += 1
+            packet["latency"] = time.perf_counter() - packet["timestamp"]
+            yield packet
+
+        # Surface errors from the worker threads to the caller
+        for stage in (self.capture, self.perception):
+            if stage.error is not None:
+                raise stage.error
+
+    def stats(self):
+
+        elapsed = 0.0
+        if self.start_time is not None:
+            elapsed = time.perf_counter() - self.start_time
+
+        def fps(count):
+            return count / elapsed if elapsed > 0 else 0.0
+
+        return {
+            "capture": {
+                "frames": self.capture.processed,
+                "fps": fps(self.capture.processed),
+                "queue_depth": self.capture_queue.depth(),
+                "dropped": self.capture_queue.dropped
+            },
+            "perception": {
+                "frames": self.perception.processed,
+                "fps": fps(self.perception.processed),
+                "busy_time": self.perception.busy_time,
+                "queue_depth": self.render_queue.depth(),
+                "dropped": self.render_queue.dropped
+            },
+            "render": {
+                "frames": self.rendered,
+                "fps": fps(self.rendered)
+            }
+        }
+
+
+def format_stats(stats):
+
+    # One line per stage, e.g.
+    # capture     frames=812  fps=29.9  queue=1  dropped=240
+    lines = []
+
+    for stage, values in stats.items():
+        parts = [f"{stage:<11}"]
+        parts.append(f"frames={values['frames']}")
+        parts.append(f"fps={values['fps']:.1f}")
+
+        if "queue_depth" in values:
+            parts.append(f"queue={values['queue_depth']}")
+            parts.append(f"dropped={values['dropped']}")
+
+        lines.append("  ".join(parts))
+
+    return "\n".join(lines)
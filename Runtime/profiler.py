@@ -0,0 +1,182 @@
+import json
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class _NullTimer:
+
+    # Shared do-nothing timer used while profiling is disabled
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+
+    __slots__ = ("samples", "start")
+
+    def __init__(self, samples):
+        self.samples = samples
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.samples.append(time.perf_counter() - self.start)
+        return False
+
+
+class Profiler:
+
+    def __init__(self, enabled=True, window=300):
+        """
+        Named stage timers with rolling histograms.
+        window = number of recent samples kept per stage
+        Usage:
+            with profiler.timer("object_detection"):
+                ...
+        When disabled, timer() returns a shared no-op context manager.
+        """
+
+        self.enabled = enabled
+        self.window = window
+
+        self.stages = {}
+        self.lock = threading.Lock()
+
+        # Timestamps of recent frames, for FPS
+        self.frame_times = deque(maxlen=window)
+        self.frames = 0
+
+        self.start_time = time.perf_counter()
+        self.last_summary = None
+        self.last_summary_time = 0.0
+
+    def timer(self, name):
+
+        if not self.enabled:
+            return _NULL_TIMER
+
+        samples = self.stages.get(name)
+
+        if samples is None:
+            with self.lock:
+                samples = self.stages.setdefault(name, deque(maxlen=self.window))
+
+        return _Timer(samples)
+
+    # Mark the end of a frame
+    def tick(self):
+
+        if not self.enabled:
+            return
+
+        self.frame_times.append(time.perf_counter())
+        self.frames += 1
+
+    def fps(self):
+
+        times = list(self.frame_times)
+
+        if len(times) < 2 or times[-1] <= times[0]:
+            return 0.0
+
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    def summary(self, refresh_interval=0.0):
+        """
+        Returns {stage: {count, mean, p50, p95, p99, max}} in milliseconds,
+        computed over the rolling window.
+        refresh_interval = reuse the previous summary if it is newer than
+                           this many seconds (keeps per-frame overlays cheap)
+        """
+
+        now = time.perf_counter()
+
+        if self.last_summary is not None \
+                and now - self.last_summary_time < refresh_interval:
+            return self.last_summary
+
+        with self.lock:
+            stages = list(self.stages.items())
+
+        summary = {}
+
+        for name, samples in stages:
+            values = np.array(samples, dtype=np.float64) * 1000.0
+
+            if len(values) == 0:
+                continue
+
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+
+            summary[name] = {
+                "count": int(len(values)),
+                "mean": float(values.mean()),
+                "p50": float(p50),
+                "p95": float(p95),
+                "p99": float(p99),
+                "max": float(values.max())
+            }
+
+        self.last_summary = summary
+        self.last_summary_time = now
+
+        return summary
+
+    # Stage with the highest p95 time.
+    # Enclosing timers ("object_detection" around "object_detection.clahe")
+    # are skipped so the innermost slow stage is reported.
+    def worst_stage(self, summary=None):
+
+        if summary is None:
+            summary = self.summary()
+
+        candidates = {
+            name: values for name, values in summary.items()
+            if not any(other.startswith(name + ".") for other in summary)
+        }
+
+        if not candidates:
+            return None, None
+
+        name = max(candidates, key=lambda n: candidates[n]["p95"])
+        return name, candidates[name]
+
+    def report(self):
+
+        return {
+            "enabled": self.enabled,
+            "uptime_s": time.perf_counter() - self.start_time,
+            "frames": self.frames,
+            "fps": self.fps(),
+            "window": self.window,
+            "stages_ms": self.summary()
+        }
+
+    def write_report(self, path):
+
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=4)
+
+
+# Process-wide profiler used by Perception, State and Visualization code.
+# Disabled until enable() is called, so library use stays overhead-free.
+profiler = Profiler(enabled=False)
+
+
+def enable():
+
+    profiler.enabled = True
+    return profiler
@@ -0,0 +1,175 @@
+import collections
+
+
+# Quality levels from best to cheapest:
+# (processing scale, table detection every Nth frame).
+# The table is skipped first, resolution is only lowered after that.
+DEFAULT_LEVELS = (
+    (1.0, 1),
+    (1.0, 2),
+    (1.0, 4),
+    (0.75, 4),
+    (0.5, 4),
+    (0.5, 8)
+)
+
+
+class LatencyScheduler:
+
+    def __init__(
+        self,
+        budget_ms=33.0,
+        levels=DEFAULT_LEVELS,
+        smoothing=0.2,
+        headroom=0.6,
+        downgrade_after=5,
+        upgrade_after=60
+    ):
+        """
+        Keeps the perception time of a frame within budget_ms by
+        choosing the processing scale and how often the table is
+        detected.
+        smoothing = weight of the newest frame in the moving average
+        headroom = average below budget_ms * headroom counts as spare time
+        downgrade_after = frames over budget before a cheaper level
+        upgrade_after = frames with spare time before a better level
+        """
+
+        self.budget_ms = budget_ms
+        self.levels = levels
+        self.smoothing = smoothing
+        self.headroom = headroom
+        self.downgrade_after = downgrade_after
+        self.upgrade_after = upgrade_after
+
+        self.level = 0
+        self.average_ms = None
+
+        self.over_budget = 0
+        self.under_budget = 0
+        self.frames_since_table = None
+
+        # Decision metrics
+        self.frames = 0
+        self.table_runs = 0
+        self.table_skips = 0
+        self.downgrades = 0
+        self.upgrades = 0
+        self.frames_per_level = collections.Counter()
+
+    @property
+    def scale(self):
+        return self.levels[self.level][0]
+
+    @property
+    def table_interval(self):
+        return self.levels[self.level][1]
+
+    def plan(self, force_table=False):
+        """
+        Decision for the next frame:
+        {"level", "scale", "table_interval", "run_table"}
+        force_table = run table detection regardless of the interval
+        (e.g. no homography yet)
+        """
+
+        run_table = (
+            force_table
+            or self.frames_since_table is None
+            or self.frames_since_table + 1 >= self.table_interval
+        )
+
+        if run_table:
+            self.frames_since_table = 0
+            self.table_runs += 1
+        else:
+            self.frames_since_table += 1
+            self.table_skips += 1
+
+        self.frames += 1
+        self.frames_per_level[self.level] += 1
+
+        return {
+            "level": self.level,
+            "scale": self.scale,
+            "table_interval": self.table_interval,
+            "run_table": run_table
+        }
+
+    def record(self, elapsed_ms):
+        """
+        Reports how long the planned frame took and moves one level
+        down (cheaper) or up (better) once the average has stayed over
+        budget or under the headroom for long enough.
+        """
+
+        if self.average_ms is None:
+            self.average_ms = elapsed_ms
+        else:
+            self.average_ms += self.smoothing * (elapsed_ms - self.average_ms)
+
+        if self.average_ms > self.budget_ms:
+            self.over_budget += 1
+            self.under_budget = 0
+        elif self.average_ms < self.budget_ms * self.headroom:
+            self.under_budget += 1
+            self.over_budget = 0
+        else:
+            self.over_budget = 0
+            self.under_budget = 0
+
+        if self.over_budget >= self.downgrade_after \
+                and self.level < len(self.levels) - 1:
+            self.set_level(self.level + 1)
+            self.downgrades += 1
+
+        elif self.under_budget >= self.upgrade_after and self.level > 0:
+            self.set_level(self.level - 1)
+            self.upgrades += 1
+
+    def set_level(self, level):
+
+        self.level = level
+        self.over_budget = 0
+        self.under_budget = 0
+
+        # The old level's timings say little about the new one
+        self.average_ms = None
+
+    def metrics(self):
+
+        return {
+            "budget_ms": self.budget_ms,
+            "average_ms": self.average_ms,
+            "level": self.level,
+            "scale": self.scale,
+            "table_interval": self.table_interval,
+            "frames": self.frames,
+            "table_runs": self.table_runs,
+            "table_skips": self.table_skips,
+            "downgrades": self.downgrades,
+            "upgrades": self.upgrades,
+            "frames_per_level": {
+                f"{scale}x/every {interval}": self.frames_per_level[level]
+                for level, (scale, interval) in enumerate(self.levels)
+            }
+        }
+
+
+def format_metrics(metrics):
+
+    average = metrics["average_ms"]
+    average = "-" if average is None else f"{average:.1f}"
+
+    lines = [
+        f"scheduler    budget={metrics['budget_ms']:.1f}ms  avg={average}ms  "
+        f"scale={metrics['scale']}  table every {metrics['table_interval']}  "
+        f"down={metrics['downgrades']}  up={metrics['upgrades']}  "
+        f"table runs={metrics['table_runs']}  skips={metrics['table_skips']}"
+    ]
+
+    for name, frames in metrics["frames_per_level"].items():
+        if frames:
+            lines.append(f"  {name:<16} frames={frames}")
+
+    return "\n".join(lines)
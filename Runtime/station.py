@@ -0,0 +1,492 @@
+import os
+import time
+from collections import Counter
+
+import cv2
+import numpy as np
+
+from Perception.table_detection import HomographyStabilizer, TableTracker
+from Perception.object_detection import ObjectDetector
+from Perception.frame_buffers import FrameBuffers
+from Perception.object_tracking import ObjectTracker
+from Perception.rectified_detection import RectifiedDetector
+from Perception.geometry import GeometryCache, scale_homography
+from Perception.segmentation import build_engine
+from State.object_registry import CONFIG_PATH, load_registry
+from State.targets import generate_random_targets
+from State.state_management import TaskStateManager
+from Runtime.profiler import profiler
+from Runtime.station_state import load_station_state, save_station_state
+
+
+class Station:
+
+    def __init__(
+        self,
+        name="station",
+        procedure_config=CONFIG_PATH,
+        redetect_interval=30,
+        scheduler=None,
+        lazy_detection=True,
+        pyramid_level=0,
+        homography_threshold=1.0,
+        rectified_size=None,
+        state_path=None,
+        verify_frames=60
+    ):
+        """
+        Perception and task state of one guidance station.
+        Every station owns its own tracker, color engine, homography
+        and TaskStateManager, so several stations can run side by side.
+        scheduler = optional LatencyScheduler choosing the processing
+        scale and how often the table is detected
+        lazy_detection = only look for the objects the task state asks
+        for (guided object every frame, placed objects now and then)
+        instead of every object in the procedure
+        pyramid_level = find objects at 1/2 (1) or 1/4 (2) size first,
+        then refine them at full resolution (0 = off)
+        homography_threshold = pixels a table corner has to move before
+        a new homography replaces the current one
+        rectified_size = (width, height) to detect objects on a top-down
+        canvas of the table of this size instead of in the camera image
+        (fixed cost for any camera, min_table_area thresholds)
+        state_path = file the station state (homography, targets, task
+        progress, color calibration) is saved to on every change and
+        resumed from at startup, so guidance shows on the first frame
+        verify_frames = frames a resumed homography is used before the
+        markers have confirmed it (it is dropped afterwards)
+        """
+
+        self.name = name
+
+        # Object classes and tasks of this station's procedure
+        self.registry = load_registry(procedure_config)
+
+        saved = None
+        if state_path is not None:
+            saved = load_station_state(state_path)
+
+        # Calibrated colors of the last run if the config has none
+        if saved is not None and self.registry.color_lut is None \
+                and saved.get("color_lut") and os.path.exists(saved["color_lut"]):
+            self.registry.color_lut = saved["color_lut"]
+
+        self.engine = build_engine(self.registry)
+
+        # Owns the CLAHE and all working images of object detection
+        self.detector = ObjectDetector(self.engine)
+
+        self.rectified_detector = None
+        if rectified_size is not None:
+            self.rectified_detector = RectifiedDetector(self.engine, rectified_size)
+
+        # Randomly generates one target per task once at startup
+        targets = generate_random_targets(len(self.registry.tasks))
+        self.state_manager = TaskStateManager(targets, self.registry.tasks)
+
+        # Objects with several tasks (e.g. two cups): every item of
+        # them is detected, not only the largest one
+        counts = Counter(task["object"] for task in self.registry.tasks)
+        self.instance_objects = [name for name, count in counts.items() if count > 1]
+
+        # Follows the ArUco markers between periodic full detections
+        self.table_tracker = TableTracker(redetect_interval=redetect_interval)
+
+        # Fits H to all marker corners and ignores jitter, so H (and
+        # everything cached on it) stays the same while the camera is still
+        self.stabilizer = HomographyStabilizer(threshold=homography_threshold)
+
+        # Predicts each object's position so only a small window
+        # around it is searched (full search when a track is lost)
+        self.object_tracker = ObjectTracker()
+
+        # Stores the most recent valid homography matrix, H
+        # H maps table coordinate space to image pixel space
+        self.last_valid_H = None
+
+        # Stores the most recent valid detected table corner points
+        # image_pts: 4 table corner points in image pixel coordinates
+        self.last_valid_image_pts = None
+
+        # H inverse, table polygon and projections of the current H
+        self.geometry_cache = GeometryCache()
+
+        # Same for the resized frame objects are detected in
+        self.scaled_geometry_cache = GeometryCache()
+
+        self.scheduler = scheduler
+        self.table_scale = 1.0
+
+        # Resized frame, reused while the scale stays the same
+        self.buffers = FrameBuffers()
+
+        self.lazy_detection = lazy_detection
+        self.pyramid_level = pyramid_level
+
+        # Warm start: None (cold), "verifying" (resumed H not seen yet),
+        # "confirmed", "replaced" (markers moved) or "expired"
+        self.state_path = state_path
+        self.verify_frames = verify_frames
+        self.warm_start = None
+        self.warm_version = None
+        self.unverified_frames = 0
+        self.frame_size = None
+        self.saved_key = None
+
+        if saved is not None:
+            self.restore_state(saved)
+
+    def process(self, frame):
+        """
+        Runs table detection, object detection and the state update.
+        Returns dict with H, image_pts, geometry and detected_objects
+        ({task: data or None} of the tasks looked for, see
+        TaskStateManager.update; None until the table has been seen
+        once), the scheduler's plan for this frame and an independent
+        copy of the state.
+        """
+
+        start = time.perf_counter()
+
+        frame_size = (frame.shape[1], frame.shape[0])
+
+        # A resumed homography only fits the same camera resolution
+        if self.warm_start == "verifying" and frame_size != self.frame_size:
+            self.expire_warm_start()
+
+        self.frame_size = frame_size
+
+        # Markers are searched every frame until a resumed H is confirmed
+        force_table = self.last_valid_H is None or self.warm_start == "verifying"
+
+        if self.scheduler is not None:
+            plan = self.scheduler.plan(force_table=force_table)
+        else:
+            plan = {"scale": 1.0, "run_table": True}
+
+        scale = plan["scale"]
+
+        # Resize once, shared by table and object detection
+        small = frame
+        if scale != 1.0:
+            with profiler.timer("resize"):
+                frame_h, frame_w = frame.shape[:2]
+                size = (int(round(frame_w * scale)), int(round(frame_h * scale)))
+                small = cv2.resize(
+                    frame, size,
+                    dst=self.buffers.get("small", (size[1], size[0]) + frame.shape[2:]),
+                    interpolation=cv2.INTER_AREA)
+
+        # Detect (or track) ArUco markers and compute homography
+        if plan["run_table"]:
+            with profiler.timer("table_detection"):
+                image_pts, H = self.detect_table(small, scale)
+
+            # Update homography
+            if H is not None:
+                self.last_valid_H = H
+                self.last_valid_image_pts = image_pts
+
+            if self.warm_start == "verifying":
+                self.verify_warm_start(H is not None)
+
+        detected_objects = None
+        geometry = self.geometry_cache.get(
+            self.last_valid_H,
+            self.last_valid_image_pts,
+            self.stabilizer.version)
+
+        # if markers are briefly covered
+        # keep using previous homography 
+        if self.last_valid_H is not None:
+            with profiler.timer("object_detection"):
+                request = None
+                if self.lazy_detection:
+                    request = self.state_manager.detection_request()
+
+                # Tracks are kept per task, so two cups never share one;
+                # a task's window is searched for its object
+                # (task key = object name for objects with one task)
+                search_windows = self.object_tracker.search_windows(
+                    frame.shape, self.state_manager.request_keys(request))
+
+                instance_names = self.instance_names(request)
+                instances = None
+
+                if self.rectified_detector is not None:
+                    # One canvas of the whole table at a fixed size
+                    # (the processing scale does not apply), table
+                    # coordinates come from the canvas
+                    candidates = self.rectified_detector.candidates(
+                        frame, self.last_valid_H, self.stabilizer.version, request)
+
+                    detected_objects, instances = self.split_candidates(
+                        candidates,
+                        self.rectified_detector.image_boxes(candidates),
+                        request,
+                        instance_names)
+
+                elif instance_names:
+                    # Every item of a repeated object is needed: one
+                    # segmentation of the whole table gives both the
+                    # items and the other requested objects
+                    candidates, bboxes = self.detect_candidates(small, scale, request)
+
+                    detected_objects, instances = self.split_candidates(
+                        candidates, bboxes, request, instance_names)
+
+                else:
+                    detected_objects = self.detect_objects(
+                        small, scale, geometry, search_windows, request)
+
+            # Update task state, which picks each task's detection
+            with profiler.timer("state_update"):
+                detected_objects = self.state_manager.update(detected_objects, instances)
+
+            with profiler.timer("object_tracking"):
+                detected_objects = self.object_tracker.update(
+                    detected_objects,
+                    geometry if self.rectified_detector is None else None)
+
+        if self.state_path is not None:
+            with profiler.timer("state_save"):
+                self.save_state()
+
+        if self.scheduler is not None:
+            self.scheduler.record((time.perf_counter() - start) * 1000.0)
+
+        return {
+            "H": self.last_valid_H,
+            "image_pts": self.last_valid_image_pts,
+            "detected_objects": detected_objects,
+            "geometry": geometry,
+            "schedule": plan,
+
+            # "detected", "tracked" or "lost" (None on skipped frames)
+            "table_mode": self.table_tracker.mode if plan["run_table"] else None,
+
+            # Increases whenever H changes (0 = no table seen yet)
+            "homography_version": self.stabilizer.version,
+
+            # Resumed state: None, "verifying", "confirmed", "replaced" or "expired"
+            "warm_start": self.warm_start,
+
+            # Render stage gets its own copy of the task state
+            "state": self.state_manager.snapshot()
+        }
+
+    def verify_warm_start(self, markers_found):
+
+        # The markers confirm the resumed H when the stabilizer keeps it
+        if markers_found:
+            if self.stabilizer.version == self.warm_version:
+                self.warm_start = "confirmed"
+            else:
+                self.warm_start = "replaced"
+            return
+
+        self.unverified_frames += 1
+        if self.unverified_frames >= self.verify_frames:
+            self.expire_warm_start()
+
+    def expire_warm_start(self):
+
+        # Never confirmed: the camera may have moved, show nothing
+        # rather than guidance on a stale table
+        self.last_valid_H = None
+        self.last_valid_image_pts = None
+        self.stabilizer.reset()
+        self.warm_start = "expired"
+
+    def restore_state(self, saved):
+
+        tasks = [[task["object"], task["label"]] for task in self.registry.tasks]
+
+        # Targets and progress only belong to the same procedure
+        if saved.get("tasks") == tasks and len(saved.get("targets", [])) == len(tasks):
+            self.state_manager = TaskStateManager(
+                [tuple(target) for target in saved["targets"]],
+                self.registry.tasks)
+
+            try:
+                self.state_manager.restore_progress(saved["progress"])
+            except (KeyError, TypeError, ValueError):
+                pass
+
+        homography = saved.get("homography")
+
+        if homography is not None and saved.get("frame_size") is not None:
+            image_pts, H = self.stabilizer.restore(
+                homography["H"],
+                homography.get("marker_corners"),
+                homography.get("layout"))
+
+            self.last_valid_H = H
+            self.last_valid_image_pts = image_pts
+            self.frame_size = tuple(saved["frame_size"])
+
+            self.warm_start = "verifying"
+            self.warm_version = self.stabilizer.version
+
+        self.saved_key = self.state_key()
+
+    def state_key(self):
+
+        # Changes whenever something worth saving changes
+        return (
+            self.stabilizer.version if self.last_valid_H is not None else None,
+            self.state_manager.step,
+            tuple(self.state_manager.placed.values())
+        )
+
+    def save_state(self):
+
+        key = self.state_key()
+        if key == self.saved_key:
+            return
+
+        homography = None
+        if self.last_valid_H is not None:
+            stabilizer = self.stabilizer
+            homography = {
+                "H": np.asarray(self.last_valid_H).tolist(),
+                "marker_corners": None if stabilizer.marker_corners is None
+                else np.asarray(stabilizer.marker_corners).tolist(),
+                "layout": None if stabilizer.layout is None else stabilizer.layout.tolist()
+            }
+
+        save_station_state(self.state_path, {
+            "station": self.name,
+            "saved_at": time.time(),
+            "tasks": [[task["object"], task["label"]] for task in self.registry.tasks],
+            "targets": [list(map(float, target)) for target in self.state_manager.targets.values()],
+            "progress": self.state_manager.progress(),
+            "color_lut": self.registry.color_lut,
+            "frame_size": list(self.frame_size) if self.frame_size is not None else None,
+            "homography": homography
+        })
+
+        self.saved_key = key
+
+    def detect_table(self, small, scale):
+
+        # Tracked marker patches only match frames of the same size
+        if scale != self.table_scale:
+            self.table_tracker.reset()
+            self.table_scale = scale
+
+        image_pts, H = self.table_tracker.update(small)
+
+        if H is None:
+            return image_pts, H
+
+        # All 16 marker corners, back in full-frame pixels
+        marker_corners = {
+            corner: points / scale
+            for corner, points in self.table_tracker.marker_corners.items()
+        }
+
+        return self.stabilizer.update(marker_corners)
+
+    # Objects with several tasks that were asked for this frame
+    def instance_names(self, request):
+        return [
+            name for name in self.instance_objects
+            if request is None or name in request
+        ]
+
+    def detect_candidates(self, small, scale, request):
+
+        # Every blob of the requested objects on the whole table:
+        # (CANDIDATE_DTYPE array, its boxes in full-frame pixels)
+        H = self.last_valid_H
+        image_pts = self.last_valid_image_pts
+        geometry_cache = self.geometry_cache
+
+        # Table coordinates are the same in the resized frame
+        if scale != 1.0:
+            H = scale_homography(H, scale)
+            image_pts = (image_pts * scale).astype(np.float32)
+            geometry_cache = self.scaled_geometry_cache
+
+        candidates = self.detector.detect_instances(
+            small,
+            H,
+            image_pts,
+            geometry=geometry_cache.get(H, image_pts, (self.stabilizer.version, scale)),
+            area_scale=scale * scale,
+            request=request)
+
+        bboxes = [
+            tuple(int(round(float(v) / scale)) for v in (c["x"], c["y"], c["w"], c["h"]))
+            for c in candidates
+        ]
+
+        return candidates, bboxes
+
+    def split_candidates(self, candidates, bboxes, request, instance_names):
+        """
+        Candidates and their full-frame bboxes -> (detected_objects,
+        instances): the largest blob of every requested object, and
+        {object: [data, ...]} of every blob of instance_names
+        """
+
+        names = [
+            name for name in self.engine.names
+            if request is None or name in request
+        ]
+
+        groups = {name: [] for name in names}
+
+        for candidate, bbox in zip(candidates, bboxes):
+            name = self.engine.names[candidate["label"] - 1]
+            if name in groups:
+                groups[name].append({
+                    "bbox": tuple(bbox),
+                    "table_coords": (float(candidate["table_x"]), float(candidate["table_y"]))
+                })
+
+        # Blobs of a class come largest first (rank 0)
+        detected_objects = {name: group[0] if group else None for name, group in groups.items()}
+        instances = {name: groups[name] for name in instance_names}
+
+        return detected_objects, instances
+
+    def detect_objects(self, small, scale, geometry, search_windows, request):
+
+        if scale == 1.0:
+            return self.detector.detect(
+                small,
+                self.last_valid_H,
+                self.last_valid_image_pts,
+                search_windows=search_windows,
+                geometry=geometry,
+                request=request,
+                pyramid_level=self.pyramid_level)
+
+        # Search the resized frame with min areas scaled to match
+        scaled_pts = (self.last_valid_image_pts * scale).astype(np.float32)
+        scaled_H = scale_homography(self.last_valid_H, scale)
+
+        detected_objects = self.detector.detect(
+            small,
+            scaled_H,
+            scaled_pts,
+            search_windows={
+                name: tuple(int(round(v * scale)) for v in window)
+                for name, window in search_windows.items()
+            },
+            geometry=self.scaled_geometry_cache.get(
+                scaled_H, scaled_pts, (self.stabilizer.version, scale)),
+            area_scale=scale * scale,
+            request=request,
+            pyramid_level=self.pyramid_level)
+
+        # Bboxes back to full-frame pixels
+        # (the object tracker re-projects them with the full-size H)
+        for name, obj_data in detected_objects.items():
+            if obj_data is not None:
+                obj_data["bbox"] = tuple(
+                    int(round(v / scale)) for v in obj_data["bbox"])
+
+        return detected_objects
@@ -0,0 +1,51 @@
+import json
+import os
+import tempfile
+
+
+# Station state file: one compact JSON object with
+#   format, station, tasks [[object, label], ...], targets [[tx, ty], ...],
+#   progress {step, placed, verified}, color_lut (path or null),
+#   frame_size [w, h], homography {H, marker_corners, layout} or null
+# Written by Station whenever the homography or the task progress
+# changes, read at startup to resume where the station stopped.
+STATE_FORMAT = 1
+
+
+def save_station_state(path, state):
+    """
+    Writes state atomically: a temporary file next to path is written,
+    flushed to disk and renamed over path, so after a crash the file
+    holds either the previous or the new state, never a partial one.
+    """
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=".station_state-", suffix=".tmp", dir=directory)
+
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(dict(state, format=STATE_FORMAT), f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(temp_path, path)
+
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def load_station_state(path):
+
+    # Saved state, None if there is none or it cannot be used
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(state, dict) or state.get("format") != STATE_FORMAT:
+        return None
+
+    return state
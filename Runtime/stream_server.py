@@ -0,0 +1,501 @@
+import asyncio
+import base64
+import hashlib
+import json
+import struct
+import threading
+import time
+import urllib.parse
+from collections import deque
+
+import cv2
+
+from Runtime.event_stream import frame_event, state_summary
+from Runtime.pipeline import DROP_NEWEST, DROP_OLDEST
+
+
+# Viewers never block the guidance loop, so BLOCK is not offered
+VIEWER_POLICIES = (DROP_OLDEST, DROP_NEWEST)
+
+BOUNDARY = b"tgsframe"
+WEBSOCKET_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# WebSocket opcodes
+WS_BINARY = 0x2
+WS_CLOSE = 0x8
+WS_PING = 0x9
+WS_PONG = 0xA
+
+# Largest message accepted from a viewer (viewers only send control frames)
+WS_MAX_PAYLOAD = 65536
+
+INDEX_PAGE = b"""<!DOCTYPE html>
+<html>
+<head><title>Task Guidance System</title></head>
+<body style="margin:0;background:#111;color:#ddd;font-family:monospace">
+<img src="/stream.mjpg" style="max-width:100%">
+<pre id="state"></pre>
+<script>
+setInterval(async () => {
+    const response = await fetch("/state");
+    document.getElementById("state").textContent = JSON.stringify(await response.json(), null, 2);
+}, 500);
+</script>
+</body>
+</html>
+"""
+
+
+class ViewerQueue:
+
+    def __init__(self, maxsize=1, policy=DROP_OLDEST):
+        """
+        Encoded frames waiting for one viewer (event loop thread only).
+        maxsize = frames held before the policy applies
+        policy = DROP_OLDEST (always show the newest frame) or
+                 DROP_NEWEST (keep queued frames, skip new ones)
+        A slow viewer only ever drops its own frames.
+        """
+
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+
+        if policy not in VIEWER_POLICIES:
+            raise ValueError(f"Unknown viewer policy: {policy}")
+
+        self.maxsize = maxsize
+        self.policy = policy
+
+        self.items = deque()
+        self.ready = asyncio.Event()
+        self.closed = False
+
+        self.sent = 0
+        self.dropped = 0
+
+    def put(self, item):
+
+        if len(self.items) >= self.maxsize:
+            self.dropped += 1
+
+            if self.policy == DROP_NEWEST:
+                return
+
+            self.items.popleft()
+
+        self.items.append(item)
+        self.ready.set()
+
+    # Returns None once the queue is closed
+    async def get(self):
+
+        while not self.items:
+            if self.closed:
+                return None
+
+            self.ready.clear()
+            await self.ready.wait()
+
+        return self.items.popleft()
+
+    def close(self):
+        self.closed = True
+        self.ready.set()
+
+
+class StreamServer:
+
+    def __init__(self, host="127.0.0.1", port=8080, quality=80, max_fps=15.0):
+        """
+        Serves the annotated frames to remote viewers:
+            /             viewer page
+            /stream.mjpg  MJPEG stream
+            /ws           WebSocket, one binary JPEG message per frame
+            /snapshot.jpg newest frame
+            /state        current task state and detections (JSON)
+            /stats        encoder and viewer counters (JSON)
+        Streams take ?policy=drop_oldest|drop_newest&queue=N.
+        The asyncio server runs on its own thread. Every published frame
+        is JPEG-encoded once on an encoder thread and the same bytes are
+        queued for every viewer.
+        max_fps = most frames per second handed to the encoder
+        """
+
+        self.host = host
+        self.port = port
+        self.quality = quality
+        self.interval = 1.0 / max_fps if max_fps else 0.0
+
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.encoder = None
+
+        # Newest frame waiting for the encoder, older ones are replaced
+        self.frame_ready = threading.Condition()
+        self.pending = None
+        self.stopping = False
+        self.last_publish = 0.0
+
+        self.state = {}
+        self.latest = None
+
+        self.viewers = set()
+        self.connections = set()
+
+        self.published = 0
+        self.replaced = 0
+        self.encoded = 0
+        self.encode_time = 0.0
+        self.finished_sent = 0
+        self.finished_dropped = 0
+
+    def start(self):
+
+        # Binding here raises in the caller if the port is taken
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(
+            asyncio.start_server(self.handle, self.host, self.port))
+        self.port = self.server.sockets[0].getsockname()[1]
+
+        self.thread = threading.Thread(target=self.loop.run_forever, name="stream-server", daemon=True)
+        self.encoder = threading.Thread(target=self.encode_loop, name="stream-encoder", daemon=True)
+        self.thread.start()
+        self.encoder.start()
+
+    def url(self):
+        return f"http://{self.host}:{self.port}/"
+
+    # True if a frame published now would reach a viewer, so frames
+    # are only drawn while someone is watching
+    def wants_frame(self):
+
+        if not self.viewers:
+            return False
+
+        return time.perf_counter() - self.last_publish >= self.interval
+
+    def publish(self, index, frame):
+        """
+        Hands an annotated frame to the encoder, never blocks.
+        The frame must not be drawn on afterwards.
+        """
+
+        self.last_publish = time.perf_counter()
+
+        with self.frame_ready:
+            if self.pending is not None:
+                self.replaced += 1
+
+            self.pending = (index, frame)
+            self.published += 1
+            self.frame_ready.notify()
+
+    def update_state(self, index, result, latency=None):
+
+        # Replaced as a whole, so request handlers never see a partial update
+        state = frame_event(index, result.get("timestamp", 0.0), result)
+        state.update(state_summary(result["state"]))
+        state["latency"] = None if latency is None else round(latency, 4)
+
+        self.state = state
+
+    def encode_loop(self):
+
+        while True:
+            with self.frame_ready:
+                while self.pending is None and not self.stopping:
+                    self.frame_ready.wait()
+
+                if self.stopping:
+                    return
+
+                index, frame = self.pending
+                self.pending = None
+
+            start = time.perf_counter()
+            success, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            self.encode_time += time.perf_counter() - start
+
+            if not success:
+                continue
+
+            self.encoded += 1
+            self.loop.call_soon_threadsafe(self.broadcast, index, jpeg.tobytes())
+
+    def broadcast(self, index, jpeg):
+
+        # Event loop thread: one shared bytes object for every viewer
+        self.latest = (index, jpeg)
+
+        for viewer in self.viewers:
+            viewer.put(self.latest)
+
+    async def handle(self, reader, writer):
+
+        self.connections.add(asyncio.current_task())
+
+        try:
+            try:
+                request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 10.0)
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+                return
+
+            lines = request.decode("latin-1").split("\r\n")
+            parts = lines[0].split(" ")
+
+            if len(parts) != 3 or parts[0] != "GET":
+                await self.respond(writer, 405, "text/plain", b"Only GET is supported\n")
+                return
+
+            headers = {}
+            for line in lines[1:]:
+                if ":" in line:
+                    key, value = line.split(":", 1)
+                    headers[key.strip().lower()] = value.strip()
+
+            path, _, query = parts[1].partition("?")
+            options = urllib.parse.parse_qs(query)
+
+            if path == "/":
+                await self.respond(writer, 200, "text/html", INDEX_PAGE)
+
+            elif path == "/state":
+                await self.respond(writer, 200, "application/json", json.dumps(self.state).encode())
+
+            elif path == "/stats":
+                await self.respond(writer, 200, "application/json", json.dumps(self.stats()).encode())
+
+            elif path == "/snapshot.jpg":
+                if self.latest is None:
+                    await self.respond(writer, 503, "text/plain", b"No frame yet\n")
+                else:
+                    await self.respond(writer, 200, "image/jpeg", self.latest[1])
+
+            elif path in ("/stream.mjpg", "/ws"):
+                try:
+                    viewer = ViewerQueue(
+                        int(options.get("queue", ["1"])[0]),
+                        options.get("policy", [DROP_OLDEST])[0])
+                except ValueError as e:
+                    await self.respond(writer, 400, "text/plain", f"{e}\n".encode())
+                    return
+
+                if path == "/ws":
+                    await self.stream_websocket(reader, writer, headers, viewer)
+                else:
+                    await self.stream_mjpeg(writer, viewer)
+
+            else:
+                await self.respond(writer, 404, "text/plain", b"Not found\n")
+
+        except ConnectionError:
+            pass
+
+        finally:
+            self.connections.discard(asyncio.current_task())
+            writer.close()
+
+    async def respond(self, writer, status, content_type, body):
+
+        reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 503: "Service Unavailable"}
+
+        writer.write(
+            f"HTTP/1.1 {status} {reasons[status]}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Cache-Control: no-cache\r\n"
+            "Connection: close\r\n\r\n".encode())
+        writer.write(body)
+        await writer.drain()
+
+    def add_viewer(self, viewer, writer):
+
+        # Small socket buffer: a stalled viewer starts dropping after
+        # a frame or two instead of queueing seconds of video
+        writer.transport.set_write_buffer_limits(high=256 * 1024)
+
+        self.viewers.add(viewer)
+
+        if self.latest is not None:
+            viewer.put(self.latest)
+
+    def remove_viewer(self, viewer):
+
+        self.viewers.discard(viewer)
+        self.finished_sent += viewer.sent
+        self.finished_dropped += viewer.dropped
+
+    async def stream_mjpeg(self, writer, viewer):
+
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: multipart/x-mixed-replace; boundary=" + BOUNDARY + b"\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"Connection: close\r\n\r\n")
+
+        self.add_viewer(viewer, writer)
+
+        try:
+            while True:
+                item = await viewer.get()
+                if item is None:
+                    break
+
+                jpeg = item[1]
+                writer.write(
+                    b"--" + BOUNDARY + b"\r\n"
+                    b"Content-Type: image/jpeg\r\n"
+                    b"Content-Length: %d\r\n\r\n" % len(jpeg))
+                writer.write(jpeg)
+                writer.write(b"\r\n")
+
+                # Only this viewer waits here, frames meanwhile go
+                # to its queue and are dropped by its policy
+                await writer.drain()
+                viewer.sent += 1
+
+        finally:
+            self.remove_viewer(viewer)
+
+    async def stream_websocket(self, reader, writer, headers, viewer):
+
+        key = headers.get("sec-websocket-key")
+
+        if headers.get("upgrade", "").lower() != "websocket" or key is None:
+            await self.respond(writer, 400, "text/plain", b"WebSocket upgrade expected\n")
+            return
+
+        accept = base64.b64encode(hashlib.sha1(key.encode() + WEBSOCKET_GUID).digest())
+
+        writer.write(
+            b"HTTP/1.1 101 Switching Protocols\r\n"
+            b"Upgrade: websocket\r\n"
+            b"Connection: Upgrade\r\n"
+            b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+
+        self.add_viewer(viewer, writer)
+
+        # Reads the viewer's control frames, closes the queue when it leaves
+        receiver = asyncio.ensure_future(self.receive_websocket(reader, writer, viewer))
+
+        try:
+            while True:
+                item = await viewer.get()
+                if item is None:
+                    break
+
+                jpeg = item[1]
+                writer.write(websocket_header(WS_BINARY, len(jpeg)))
+                writer.write(jpeg)
+
+                await writer.drain()
+                viewer.sent += 1
+
+        finally:
+            receiver.cancel()
+            self.remove_viewer(viewer)
+
+    async def receive_websocket(self, reader, writer, viewer):
+
+        try:
+            while True:
+                opcode, payload = await read_websocket_message(reader)
+
+                if opcode == WS_CLOSE:
+                    writer.write(websocket_header(WS_CLOSE, len(payload[:2])) + payload[:2])
+                    break
+
+                if opcode == WS_PING:
+                    writer.write(websocket_header(WS_PONG, len(payload)) + payload)
+
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+
+        finally:
+            viewer.close()
+
+    def stats(self):
+
+        viewers = list(self.viewers)
+        encoded = max(1, self.encoded)
+
+        return {
+            "viewers": len(viewers),
+            "published": self.published,
+            "replaced": self.replaced,
+            "encoded": self.encoded,
+            "encode_ms": round(self.encode_time / encoded * 1000.0, 2),
+            "sent": self.finished_sent + sum(viewer.sent for viewer in viewers),
+            "dropped": self.finished_dropped + sum(viewer.dropped for viewer in viewers)
+        }
+
+    async def shutdown(self):
+
+        self.server.close()
+
+        for viewer in list(self.viewers):
+            viewer.close()
+
+        if self.connections:
+            await asyncio.wait(list(self.connections), timeout=1.0)
+
+        for task in list(self.connections):
+            task.cancel()
+
+    def stop(self):
+
+        with self.frame_ready:
+            self.stopping = True
+            self.frame_ready.notify()
+
+        if self.loop is None:
+            return
+
+        self.encoder.join()
+
+        asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result(timeout=5.0)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+def websocket_header(opcode, length):
+
+    # Single unmasked frame (server -> viewer)
+    if length < 126:
+        return struct.pack("!BB", 0x80 | opcode, length)
+
+    if length < 65536:
+        return struct.pack("!BBH", 0x80 | opcode, 126, length)
+
+    return struct.pack("!BBQ", 0x80 | opcode, 127, length)
+
+
+async def read_websocket_message(reader):
+
+    # One masked frame from a viewer -> (opcode, payload)
+    first, second = await reader.readexactly(2)
+
+    opcode = first & 0x0F
+    length = second & 0x7F
+
+    if length == 126:
+        length = struct.unpack("!H", await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", await reader.readexactly(8))[0]
+
+    if length > WS_MAX_PAYLOAD:
+        raise ValueError("WebSocket message too large")
+
+    mask = await reader.readexactly(4) if second & 0x80 else b"\0\0\0\0"
+    payload = await reader.readexactly(length)
+
+    return opcode, bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+
+def format_stream_stats(stats):
+
+    return (
+        f"stream       encoded={stats['encoded']}  encode={stats['encode_ms']:.1f}ms  "
+        f"sent={stats['sent']}  dropped={stats['dropped']}")
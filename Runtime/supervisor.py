@@ -0,0 +1,389 @@
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from collections import deque
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from State.object_registry import CONFIG_PATH, load_registry
+from Runtime.frame_sources import open_source
+from Visualization.static_overlay import StaticOverlay
+
+
+class SharedFrameRing:
+
+    def __init__(self, shape, slots=4, name=None):
+        """
+        Fixed number of frame slots in one shared memory block.
+        shape = (height, width, 3) of every frame
+        name = None creates a new block, otherwise attaches to it
+        Frames are copied into a slot once and read in place by the
+        worker process, only the slot index crosses the process boundary.
+        """
+
+        self.shape = tuple(shape)
+        self.slots = slots
+        self.slot_bytes = int(np.prod(self.shape))
+        self.owner = name is None
+
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(
+                create=True,
+                size=self.slot_bytes * slots)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+        self.frames = np.ndarray(
+            (slots,) + self.shape,
+            dtype=np.uint8,
+            buffer=self.shm.buf)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def slot(self, index):
+        return self.frames[index]
+
+    def close(self):
+
+        # Views into the buffer must be released before closing
+        self.frames = None
+        self.shm.close()
+
+        if self.owner:
+            self.shm.unlink()
+
+
+def station_worker(name, procedure_config, ring_name, ring_shape, ring_slots,
+                   in_queue, out_queue, cv_threads, budget_ms=None, state_path=None):
+
+    # Runs in the station's own process.
+    # Receives (slot, meta) messages, processes the frame in place and
+    # sends back the (small) perception result. None stops the worker.
+    from Runtime.station import Station
+    from Runtime.scheduler import LatencyScheduler
+
+    cv2.setNumThreads(cv_threads)
+
+    scheduler = None
+    if budget_ms is not None:
+        scheduler = LatencyScheduler(budget_ms)
+
+    ring = SharedFrameRing(ring_shape, ring_slots, name=ring_name)
+    station = Station(name, procedure_config, scheduler=scheduler, state_path=state_path)
+
+    try:
+        while True:
+            message = in_queue.get()
+
+            if message is None:
+                break
+
+            slot, meta = message
+
+            start = time.perf_counter()
+            result = station.process(ring.slot(slot))
+            result["perception_time"] = time.perf_counter() - start
+
+            result.update(meta)
+            result["slot"] = slot
+            out_queue.put(result)
+
+    finally:
+        ring.close()
+
+
+class StationRunner:
+
+    def __init__(self, context, name, source, procedure_config=CONFIG_PATH,
+                 slots=4, realtime=False, cv_threads=1, budget_ms=None, state_path=None):
+        """
+        Supervisor-side handle of one station:
+        capture thread -> shared frame ring -> worker process -> results.
+        source = camera index or file spec (see open_source)
+        budget_ms = per-frame perception budget (None = always full quality)
+        state_path = station state file to resume from and save to
+        """
+
+        self.name = name
+        self.source = open_source(source, realtime=realtime)
+
+        # Highlight styles and cached static layer for drawing
+        # this station's results
+        self.registry = load_registry(procedure_config)
+        self.static_overlay = StaticOverlay()
+
+        # The first frame fixes the ring's frame size
+        success, frame = self.source.read()
+        if not success:
+            raise RuntimeError(f"Station {name}: could not read from source {source}")
+
+        self.ring = SharedFrameRing(frame.shape, slots)
+        self.first_frame = frame
+
+        # Slots are owned by the supervisor until handed to the worker
+        self.free_slots = queue.Queue()
+        for slot in range(slots):
+            self.free_slots.put(slot)
+
+        self.in_queue = context.Queue()
+        self.out_queue = context.Queue()
+
+        self.process = context.Process(
+            target=station_worker,
+            name=f"station-{name}",
+            args=(
+                name,
+                procedure_config,
+                self.ring.name,
+                self.ring.shape,
+                slots,
+                self.in_queue,
+                self.out_queue,
+                cv_threads,
+                budget_ms,
+                state_path),
+            daemon=True)
+
+        self.capture_thread = threading.Thread(
+            target=self.capture_loop,
+            name=f"capture-{name}",
+            daemon=True)
+
+        self.stop_event = threading.Event()
+        self.source_finished = False
+
+        # Metrics
+        self.captured = 0
+        self.sent = 0
+        self.processed = 0
+        self.dropped = 0
+        self.last_result_time = None
+        self.result_times = deque(maxlen=60)
+        self.perception_times = deque(maxlen=60)
+        self.last_state = None
+        self.last_scale = 1.0
+
+    def start(self):
+
+        self.process.start()
+        self.capture_thread.start()
+
+    def capture_loop(self):
+
+        frame = self.first_frame
+        self.first_frame = None
+        self.captured += 1
+
+        while not self.stop_event.is_set():
+
+            if frame is None:
+                success, frame = self.source.read()
+                if not success:
+                    break
+
+                self.captured += 1
+
+            try:
+                # Live sources drop frames while every slot is busy,
+                # offline sources wait so that no frame is skipped
+                slot = self.free_slots.get(block=not self.source.live, timeout=0.5)
+            except queue.Empty:
+                if self.source.live:
+                    self.dropped += 1
+                    frame = None
+                continue
+
+            if frame.shape != self.ring.shape:
+                self.dropped += 1
+                self.free_slots.put(slot)
+                frame = None
+                continue
+
+            np.copyto(self.ring.slot(slot), frame)
+
+            self.sent += 1
+            self.in_queue.put((slot, {
+                "index": self.source.frame_index,
+                "timestamp": time.perf_counter()
+            }))
+
+            frame = None
+
+        self.source_finished = True
+
+    def poll(self):
+
+        # Returns every result currently available (non-blocking)
+        results = []
+
+        while True:
+            try:
+                result = self.out_queue.get_nowait()
+            except queue.Empty:
+                break
+
+            now = time.perf_counter()
+
+            self.processed += 1
+            self.last_result_time = now
+            self.result_times.append(now)
+            self.perception_times.append(result["perception_time"])
+            self.last_state = result["state"].current_state
+            self.last_scale = result["schedule"]["scale"]
+
+            result["latency"] = now - result["timestamp"]
+            results.append(result)
+
+        return results
+
+    def release(self, slot):
+        self.free_slots.put(slot)
+
+    def is_finished(self):
+        # sent is only written by the capture thread and processed only
+        # by the supervisor thread, so no lock is needed
+        return self.source_finished and self.processed >= self.sent
+
+    def health(self):
+
+        now = time.perf_counter()
+
+        if not self.process.is_alive():
+            status = "finished" if self.is_finished() else "dead"
+        elif self.is_finished():
+            status = "finished"
+        elif self.last_result_time is None:
+            status = "starting"
+        elif now - self.last_result_time > 2.0:
+            status = "stalled"
+        else:
+            status = "ok"
+
+        times = list(self.result_times)
+        fps = 0.0
+        if len(times) >= 2 and times[-1] > times[0]:
+            fps = (len(times) - 1) / (times[-1] - times[0])
+
+        perception_ms = 0.0
+        if self.perception_times:
+            perception_ms = 1000.0 * sum(self.perception_times) / len(self.perception_times)
+
+        return {
+            "status": status,
+            "fps": fps,
+            "captured": self.captured,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "perception_ms": perception_ms,
+            "scale": self.last_scale,
+            "state": self.last_state
+        }
+
+    def stop(self):
+
+        self.stop_event.set()
+        self.capture_thread.join(timeout=1.0)
+
+        self.in_queue.put(None)
+        self.process.join(timeout=2.0)
+
+        if self.process.is_alive():
+            self.process.terminate()
+
+        self.source.release()
+        self.ring.close()
+
+
+class Supervisor:
+
+    def __init__(self, stations, slots=4, realtime=False):
+        """
+        Runs every station's perception in its own worker process.
+        stations = list of dicts with name, source and optional
+                   procedure_config (path), budget_ms and state (path)
+        Worker processes share the CPU cores evenly.
+        """
+
+        # Spawned workers do not inherit the capture threads
+        context = mp.get_context("spawn")
+
+        cv_threads = max(1, (os.cpu_count() or 1) // max(1, len(stations)))
+
+        self.runners = [
+            StationRunner(
+                context,
+                station["name"],
+                station["source"],
+                station.get("procedure_config", CONFIG_PATH),
+                slots=slots,
+                realtime=realtime,
+                cv_threads=cv_threads,
+                budget_ms=station.get("budget_ms"),
+                state_path=station.get("state"))
+            for station in stations
+        ]
+
+    def start(self):
+
+        for runner in self.runners:
+            runner.start()
+
+    def stop(self):
+
+        for runner in self.runners:
+            runner.stop()
+
+    def results(self, poll_interval=0.002):
+        """
+        Yields (runner, frame, result) for every processed frame until all
+        sources are finished. frame is a view into shared memory that stays
+        valid until the generator is resumed.
+        """
+
+        while True:
+            got_result = False
+
+            for runner in self.runners:
+                for result in runner.poll():
+                    got_result = True
+                    slot = result["slot"]
+
+                    try:
+                        yield runner, runner.ring.slot(slot), result
+                    finally:
+                        runner.release(slot)
+
+            if all(runner.is_finished() or not runner.process.is_alive()
+                   for runner in self.runners):
+                break
+
+            if not got_result:
+                time.sleep(poll_interval)
+
+    def health(self):
+        return {runner.name: runner.health() for runner in self.runners}
+
+
+def format_health(health):
+
+    # One line per station, e.g.
+    # station-1  ok  fps=29.7  perception=18.2ms  scale=1.0  dropped=4  state=PLACE_CUP
+    lines = []
+
+    for name, values in health.items():
+        lines.append(
+            f"{name:<12} {values['status']:<9}"
+            f"fps={values['fps']:.1f}  "
+            f"perception={values['perception_ms']:.1f}ms  "
+            f"scale={values['scale']}  "
+            f"processed={values['processed']}  "
+            f"dropped={values['dropped']}  "
+            f"state={values['state']}")
+
+    return "\n".join(lines)
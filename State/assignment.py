@@ -0,0 +1,165 @@
+import numpy as np
+
+# Cost of an impossible pairing, far above any sum of table distances
+IMPOSSIBLE = 1e6
+
+
+class ZoneAssigner:
+
+    def __init__(self, centers, kinds, radius=0.12):
+        """
+        Matches detections to target zones, all of them at once.
+        centers = (M, 2) zone centers in table coordinates
+        kinds = M object names, a zone only takes detections of its kind;
+                zones of the same kind are interchangeable
+        radius = distance (table units, scalar or one per zone) within
+                 which a detection is inside a zone
+        A detection fills at most one zone and a zone holds at most one
+        detection. The assignment fills as many zones as possible, then
+        minimizes the total distance.
+        """
+
+        self.centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+        self.kinds = list(kinds)
+        self.radius = np.broadcast_to(np.asarray(radius, dtype=np.float64), (len(self.kinds),))
+        self.radius_squared = (self.radius ** 2)[:, None]
+
+        # Kinds as integers, so compatibility is one array comparison
+        self.kind_ids = {kind: index for index, kind in enumerate(dict.fromkeys(self.kinds))}
+        self.zone_kinds = np.array([self.kind_ids[kind] for kind in self.kinds], dtype=np.int64)
+
+    # Object names -> kind ids, -1 for kinds no zone takes (never matched)
+    def kind_indices(self, kinds):
+        return np.array([self.kind_ids.get(kind, -1) for kind in kinds], dtype=np.int64)
+
+    def assign(self, points, kinds):
+        """
+        points = (N, 2) detections in table coordinates
+        kinds = N object names, or their kind_indices()
+        Returns (M,) int array: detection index of every zone, -1 = empty
+        """
+
+        zone_detection = np.full(len(self.kinds), -1, dtype=np.int64)
+
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if len(points) == 0 or len(self.kinds) == 0:
+            return zone_detection
+
+        detection_kinds = kinds
+        if not isinstance(kinds, np.ndarray):
+            detection_kinds = self.kind_indices(kinds)
+
+        # (M, N) squared distances and which pairs are possible at all
+        dx = self.centers[:, 0:1] - points[:, 0]
+        dy = self.centers[:, 1:2] - points[:, 1]
+        squared = dx * dx + dy * dy
+
+        valid = squared < self.radius_squared
+        valid &= self.zone_kinds[:, None] == detection_kinds[None, :]
+
+        # Fast path: zone and detection that only see each other
+        zone_degree = np.count_nonzero(valid, axis=1)
+        detection_degree = np.count_nonzero(valid, axis=0)
+
+        zones = np.flatnonzero(zone_degree == 1)
+        partners = np.argmax(valid[zones], axis=1)
+        alone = detection_degree[partners] == 1
+        zone_detection[zones[alone]] = partners[alone]
+
+        # Everything else (contested zones / detections) is solved optimally
+        contested_zones = np.flatnonzero(zone_degree > 0)
+        contested_zones = contested_zones[zone_detection[contested_zones] < 0]
+
+        if len(contested_zones) == 0:
+            return zone_detection
+
+        contested_detections = np.flatnonzero(valid[contested_zones].any(axis=0))
+
+        sub_valid = valid[np.ix_(contested_zones, contested_detections)]
+        distances = np.sqrt(squared[np.ix_(contested_zones, contested_detections)])
+        cost = np.where(sub_valid, distances, IMPOSSIBLE)
+
+        rows, cols = min_cost_assignment(cost)
+        possible = sub_valid[rows, cols]
+        zone_detection[contested_zones[rows[possible]]] = contested_detections[cols[possible]]
+
+        return zone_detection
+
+
+def min_cost_assignment(cost):
+    """
+    Optimal one-to-one assignment of a rectangular cost matrix
+    (Hungarian algorithm with potentials, O(n^2 m), inner loops
+    vectorized over the columns).
+    Returns (rows, cols): row rows[k] is assigned column cols[k],
+    every row of the smaller dimension gets a partner.
+    """
+
+    cost = np.asarray(cost, dtype=np.float64)
+
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+
+    n, m = cost.shape
+
+    # Every row's cheapest column is different: nothing to trade
+    cheapest = np.argmin(cost, axis=1)
+    if len(np.unique(cheapest)) == n:
+        rows = np.arange(n)
+        return (cheapest, rows) if transposed else (rows, cheapest)
+
+    # 1-based as in the classic formulation, index 0 is a virtual column
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    row_of = np.zeros(m + 1, dtype=np.int64)
+    way = np.zeros(m + 1, dtype=np.int64)
+
+    for row in range(1, n + 1):
+        row_of[0] = row
+        column = 0
+
+        min_slack = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+
+        # Grow an alternating path until it reaches a free column
+        while True:
+            used[column] = True
+            current = row_of[column]
+
+            free = ~used[1:]
+            slack = cost[current - 1] - u[current] - v[1:]
+
+            better = free & (slack < min_slack[1:])
+            min_slack[1:][better] = slack[better]
+            way[1:][better] = column
+
+            masked = np.where(free, min_slack[1:], np.inf)
+            next_column = int(np.argmin(masked)) + 1
+            delta = masked[next_column - 1]
+
+            used_columns = np.flatnonzero(used)
+            u[row_of[used_columns]] += delta
+            v[used_columns] -= delta
+            min_slack[1:][free] -= delta
+
+            column = next_column
+            if row_of[column] == 0:
+                break
+
+        # Flip the path
+        while column != 0:
+            previous = way[column]
+            row_of[column] = row_of[previous]
+            column = previous
+
+    cols = np.flatnonzero(row_of[1:])
+    rows = row_of[1:][cols] - 1
+
+    order = np.argsort(rows)
+    rows, cols = rows[order], cols[order]
+
+    if transposed:
+        return cols, rows
+
+    return rows, cols
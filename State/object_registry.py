@@ -0,0 +1,113 @@
+import json
+import os
+
+
+# Procedure config lists the tasks and every object class
+CONFIG_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "procedure_config.json")
+
+SHAPES = ("blob", "thin")
+
+# Long side / short side required by the "thin" shape filter
+DEFAULT_MIN_ASPECT_RATIO = 2.5
+
+DEFAULT_HIGHLIGHT_COLOR = (0, 255, 255)
+
+# Smallest blob (share of the table area) of the rectified detection mode
+DEFAULT_MIN_TABLE_AREA = 0.001
+
+
+class ObjectRegistry:
+
+    def __init__(self, config):
+        """
+        Object classes and tasks of one procedure.
+        config = parsed procedure config with:
+            "objects": name, hsv_lower, hsv_upper, min_area, shape,
+                       optional min_aspect_ratio, min_table_area and
+                       highlight {text, color (BGR), padding}
+            "tasks": ordered list of {object, label}
+            optional "color_lut": calibrated color table (.npy) path
+        Detection, task state and drawing all iterate over this registry
+        instead of hard-coding object names.
+        """
+
+        self.objects = []
+        self.by_name = {}
+
+        for entry in config["objects"]:
+            obj = self.normalize(entry)
+
+            if obj["name"] in self.by_name:
+                raise ValueError(f"Duplicate object name: {obj['name']}")
+
+            self.objects.append(obj)
+            self.by_name[obj["name"]] = obj
+
+        self.tasks = list(config.get("tasks", []))
+
+        for task in self.tasks:
+            if task["object"] not in self.by_name:
+                raise ValueError(f"Task refers to unknown object: {task['object']}")
+
+        # Object of every task, in order
+        self.task_order = [task["object"] for task in self.tasks]
+
+        # Calibrated BGR -> object table (see calibrate_colors.py)
+        self.color_lut = config.get("color_lut")
+
+    @staticmethod
+    def normalize(entry):
+
+        obj = dict(entry)
+
+        shape = obj.get("shape", "blob")
+        if shape not in SHAPES:
+            raise ValueError(f"Unknown shape filter for {obj['name']}: {shape}")
+
+        obj["shape"] = shape
+
+        # Blobs accept any aspect ratio
+        if shape == "thin":
+            obj.setdefault("min_aspect_ratio", DEFAULT_MIN_ASPECT_RATIO)
+        else:
+            obj.setdefault("min_aspect_ratio", 0.0)
+
+        obj.setdefault("min_table_area", DEFAULT_MIN_TABLE_AREA)
+
+        highlight = dict(obj.get("highlight", {}))
+        highlight.setdefault("text", obj["name"].capitalize())
+        highlight["color"] = tuple(highlight.get("color", DEFAULT_HIGHLIGHT_COLOR))
+        highlight.setdefault("padding", 0)
+        obj["highlight"] = highlight
+
+        return obj
+
+    @property
+    def names(self):
+        return [obj["name"] for obj in self.objects]
+
+    def __len__(self):
+        return len(self.objects)
+
+    def __getitem__(self, name):
+        return self.by_name[name]
+
+    def highlight_style(self, name):
+        return self.by_name[name]["highlight"]
+
+
+def load_registry(config_path=CONFIG_PATH):
+
+    with open(config_path) as f:
+        config = json.load(f)
+
+    registry = ObjectRegistry(config)
+
+    # Color LUT paths are relative to the config file
+    if registry.color_lut is not None:
+        registry.color_lut = os.path.join(
+            os.path.dirname(os.path.abspath(config_path)), registry.color_lut)
+
+    return registry
@@ -1,56 +1,216 @@
+import copy
 import math
+from collections import Counter
+
+import numpy as np
+
+from State.assignment import ZoneAssigner
+
+# Procedure used when no task list is given
+DEFAULT_TASKS = [
+    {"object": "cup", "label": "A"},
+    {"object": "bottle", "label": "B"},
+    {"object": "pencil", "label": "C"}
+]
 
 class TaskStateManager:
 
-    def __init__(self, targets):
+    def __init__(self, targets, tasks=None, verify_interval=15, target_radius=0.12):
         """
-        targets = list of 3 table coordinates (tx, ty)
+        targets = list of table coordinates (tx, ty), one per task
+        tasks = ordered list of {"object", "label"} (default: cup, bottle, pencil);
+                an object may appear in several tasks, its items are then
+                interchangeable (any cup fills any cup zone)
+        verify_interval = frames between checks that a placed object
+                          is still in its target
+        target_radius = distance (table units) within which an object
+                        is in its target
         """
 
-        self.targets = {
-            "cup": targets[0],
-            "bottle": targets[1],
-            "pencil": targets[2]
-        }
+        if tasks is None:
+            tasks = DEFAULT_TASKS
 
-        self.current_state = "PLACE_CUP"
+        if len(targets) < len(tasks):
+            raise ValueError(f"{len(tasks)} tasks need {len(tasks)} targets, got {len(targets)}")
 
-        self.placed = {
-            "cup": False,
-            "bottle": False,
-            "pencil": False
-        }
+        # Tasks in the order they have to be placed, keyed by object name
+        # ("cup A", "cup B", ... for objects with several tasks)
+        counts = Counter(task["object"] for task in tasks)
+        self.order = [
+            task["object"] if counts[task["object"]] == 1 else f"{task['object']} {task['label']}"
+            for task in tasks
+        ]
+
+        # Object (detector class) and target zone label (A, B, C, ...) of each task
+        self.objects = {key: task["object"] for key, task in zip(self.order, tasks)}
+        self.labels = {key: task["label"] for key, task in zip(self.order, tasks)}
+
+        self.targets = dict(zip(self.order, targets))
+
+        # All detections are matched to all target zones at once
+        self.target_radius = target_radius
+        self.assigner = ZoneAssigner(
+            [self.targets[key] for key in self.order],
+            [self.objects[key] for key in self.order],
+            target_radius)
+
+        # Index of the task being guided
+        self.step = 0
+        self.current_state = self.state_name(self.step)
+
+        self.placed = {obj: False for obj in self.order}
+
+        # Result of the last check of each placed object
+        # (None = not checked yet)
+        self.verify_interval = verify_interval
+        self.verified = {obj: None for obj in self.order}
+        self.frame_count = 0
+
+    # "PLACE_CUP", "PLACE_BOTTLE", ..., "COMPLETE"
+    def state_name(self, step):
+
+        if step >= len(self.order):
+            return "COMPLETE"
+
+        return f"PLACE_{self.objects[self.order[step]].upper()}"
+
+    # Set of objects the detector has to look for this frame:
+    # the guided object (every frame) and placed objects
+    # (every verify_interval frames).
+    # Placed objects are checked on different frames.
+    def detection_request(self):
+
+        request = set()
+
+        current = self.get_current_object()
+        if current is not None:
+            request.add(self.objects[current])
+
+        for index, key in enumerate(self.order):
+            if self.placed[key] \
+                    and (self.frame_count + index) % self.verify_interval == 0:
+                request.add(self.objects[key])
+
+        self.frame_count += 1
+
+        return request
+
+    # Tasks whose object is in request (None = all tasks)
+    def request_keys(self, request):
+        return [
+            key for key in self.order
+            if request is None or self.objects[key] in request
+        ]
+
+    # Update state every frame.
+    # detected_objects = {object: data or None} of the objects looked for
+    # instances = optional {object: [data, ...]} of every item of an
+    #     object with several tasks (e.g. from detect_object_instances),
+    #     used instead of that object's single detection
+    # Returns {task: data or None} for the tasks of the objects looked
+    # for: the item in a task's zone, and for the guided task the item
+    # nearest its zone that fills no other zone (so guidance never
+    # points at an item that is already placed)
+    def update(self, detected_objects, instances=None):
+
+        if instances is None:
+            instances = {}
+
+        detections, points, kinds = self.detection_points(detected_objects, instances)
+
+        # Detection index in every target zone, -1 = empty
+        zone_detection = self.assigner.assign(points, kinds)
+        filled = zone_detection >= 0
+
+        # Placed objects that were looked for this frame
+        for index, key in enumerate(self.order):
+            if self.placed[key] and self.objects[key] in detected_objects:
+                self.verified[key] = bool(filled[index])
+
+        current = self.get_current_object()
 
-    # Update state every frame
-    def update(self, detected_objects):
+        if current is not None and filled[self.step]:
+            self.placed[current] = True
+            self.step += 1
+            self.current_state = self.state_name(self.step)
 
-        if self.current_state == "PLACE_CUP":
-            if self.is_in_target("cup", detected_objects):
-                self.placed["cup"] = True
-                self.current_state = "PLACE_BOTTLE"
+        task_detections = {}
 
-        elif self.current_state == "PLACE_BOTTLE":
-            if self.is_in_target("bottle", detected_objects):
-                self.placed["bottle"] = True
-                self.current_state = "PLACE_PENCIL"
+        for index, key in enumerate(self.order):
+            name = self.objects[key]
 
-        elif self.current_state == "PLACE_PENCIL":
-            if self.is_in_target("pencil", detected_objects):
-                self.placed["pencil"] = True
-                self.current_state = "COMPLETE"
+            if name not in detected_objects:
+                continue
 
-    # Check if object is close enough to its target
-    def is_in_target(self, obj_name, detected_objects):
+            if name not in instances:
+                task_detections[key] = detected_objects[name]
+            elif filled[index]:
+                task_detections[key] = detections[zone_detection[index]]
+            else:
+                task_detections[key] = None
 
-        obj_data = detected_objects.get(obj_name)
+        current = self.get_current_object()
+
+        if current is not None and self.objects[current] in instances \
+                and task_detections.get(current) is None:
+            task_detections[current] = self.nearest_free_detection(
+                current, detections, points, kinds, zone_detection[filled])
+
+        return task_detections
+
+    # All detections (data dicts), as (N, 2) table coordinates and their kind ids
+    def detection_points(self, detected_objects, instances=None):
+
+        if instances is None:
+            instances = {}
+
+        groups = [
+            (name, [obj_data])
+            for name, obj_data in detected_objects.items()
+            if obj_data is not None and name not in instances
+        ]
+        groups += list(instances.items())
+
+        detections = [obj_data for _, group in groups for obj_data in group]
+
+        if not detections:
+            return detections, np.zeros((0, 2)), np.zeros(0, dtype=np.int64)
+
+        points = np.array([obj_data["table_coords"] for obj_data in detections], dtype=np.float64)
+        kinds = np.repeat(
+            self.assigner.kind_indices([name for name, _ in groups]),
+            [len(group) for _, group in groups])
+
+        return detections, points, kinds
+
+    def nearest_free_detection(self, key, detections, points, kinds, taken):
+
+        # Detection of key's object nearest key's target, not counting
+        # the detections (indices) in taken
+        free = kinds == self.assigner.kind_indices([self.objects[key]])[0]
+        free[taken] = False
+
+        if not free.any():
+            return None
+
+        candidates = np.flatnonzero(free)
+        distances = np.hypot(*(points[candidates] - self.targets[key]).T)
+
+        return detections[candidates[np.argmin(distances)]]
+
+    # Check if a task's object is close enough to its target
+    # (single detection, without the matching of update())
+    def is_in_target(self, key, detected_objects):
+
+        obj_data = detected_objects.get(self.objects[key])
 
         if obj_data is None:
             return False
 
         tx_obj, ty_obj = obj_data["table_coords"]
-        tx_target, ty_target = self.targets[obj_name]
+        tx_target, ty_target = self.targets[key]
 
-        threshold = 0.12  # 12% of table width
+        threshold = self.target_radius  # share of table width
 
         distance = math.sqrt(
         (tx_obj - tx_target)**2 +
@@ -62,16 +222,14 @@ class TaskStateManager:
     # Which object should be guided right now?
     def get_current_object(self):
 
-        if self.current_state == "PLACE_CUP":
-            return "cup"
-
-        if self.current_state == "PLACE_BOTTLE":
-            return "bottle"
+        if self.step >= len(self.order):
+            return None
 
-        if self.current_state == "PLACE_PENCIL":
-            return "pencil"
+        return self.order[self.step]
 
-        return None
+    # Detector class of a task (None for None)
+    def object_of(self, key):
+        return self.objects.get(key)
 
     def is_complete(self):
         return self.current_state == "COMPLETE"
@@ -81,3 +239,30 @@ class TaskStateManager:
         if obj is None:
             return None
         return self.targets[obj]
+
+    # Progress of the procedure as plain lists in task order,
+    # e.g. to resume it after a restart (see restore_progress)
+    def progress(self):
+        return {
+            "step": self.step,
+            "placed": [self.placed[key] for key in self.order],
+            "verified": [self.verified[key] for key in self.order]
+        }
+
+    def restore_progress(self, progress):
+
+        placed = progress["placed"]
+        verified = progress["verified"]
+
+        if len(placed) != len(self.order) or len(verified) != len(self.order):
+            raise ValueError(f"Progress of {len(placed)} tasks, procedure has {len(self.order)}")
+
+        self.step = min(int(progress["step"]), len(self.order))
+        self.current_state = self.state_name(self.step)
+        self.placed = dict(zip(self.order, (bool(value) for value in placed)))
+        self.verified = dict(zip(self.order, verified))
+
+    # Independent copy for the render stage, so drawing never
+    # reads state while the perception worker is updating it
+    def snapshot(self):
+        return copy.deepcopy(self)
@@ -0,0 +1,326 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import cv2
+import numpy as np
+
+# Allow running as "python Testing/benchmark.py" from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from Perception.object_detection import detect_objects, largest_thin_contour_bbox, largest_valid_contour_bbox
+from Perception.table_detection import detect_table_and_homography
+from Runtime.profiler import profiler
+from Runtime.station import Station
+from State.state_management import TaskStateManager
+from synthetic_scene import OBJECT_SIZES, SceneGenerator, parse_resolution
+
+# Times every perception stage on synthetic scenes at several resolutions
+# and compares the medians with a stored baseline. Exits with status 1
+# if a stage got slower than the threshold allows or objects are found
+# in fewer frames than before.
+# Example:
+#   python Testing/benchmark.py --save-baseline     (once per machine)
+#   python Testing/benchmark.py                     (after every change)
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+STAGES = ("table_detection", "object_detection", "contours", "state_update", "frame_loop")
+
+# A detection counts if its bbox overlaps the true footprint this much
+MIN_IOU = 0.5
+
+
+def machine_info():
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__
+    }
+
+
+def bbox_iou(a, b):
+
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+
+    overlap_w = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    overlap_h = max(0, min(ay + ah, by + bh) - max(ay, by))
+    overlap = overlap_w * overlap_h
+
+    union = aw * ah + bw * bh - overlap
+    return overlap / union if union > 0 else 0.0
+
+
+def time_calls(fn, items, repeats, reset=None):
+
+    # Per-call milliseconds of the fastest pass over the items.
+    # Passes slowed down by other work on the machine are discarded,
+    # which keeps the numbers comparable between runs.
+    # reset: optional function called (untimed) before every pass,
+    #     so stateful calls do the same work in each one
+    if reset is not None:
+        reset()
+
+    for item in items[:3]:
+        fn(item)
+
+    passes = []
+    for _ in range(repeats):
+        if reset is not None:
+            reset()
+
+        samples = []
+        for item in items:
+            start = time.perf_counter()
+            fn(item)
+            samples.append((time.perf_counter() - start) * 1000.0)
+
+        passes.append(samples)
+
+    best = min(passes, key=np.median)
+
+    return {
+        "median_ms": round(float(np.median(best)), 4),
+        "p95_ms": round(float(np.percentile(best, 95)), 4)
+    }
+
+
+def object_mask(truth, shape, rng, specks=200):
+
+    # Binary mask of every object footprint plus noise specks,
+    # input of the contour helpers
+    mask = np.zeros(shape[:2], np.uint8)
+
+    for name, data in truth["objects"].items():
+        w, h = OBJECT_SIZES[name]
+        footprint = np.array([[-w, -h], [w, -h], [w, h], [-w, h]], np.float32) / 2 + data["table_coords"]
+        projected = cv2.perspectiveTransform(footprint[None], truth["H"])[0]
+        cv2.fillPoly(mask, [np.round(projected).astype(np.int32)], 255)
+
+    ys = rng.integers(0, shape[0], specks)
+    xs = rng.integers(0, shape[1], specks)
+    mask[ys, xs] = 255
+
+    return mask
+
+
+def run_resolution(resolution, frames, repeats, seed):
+
+    generator = SceneGenerator(resolution, seed=seed, brightness=0.9, gradient=0.15, noise=4.0)
+    scenes = list(generator.sequence(frames))
+    rng = np.random.default_rng(seed)
+
+    # Accuracy of this resolution, also the inputs of the later stages
+    tables = []
+    found = {name: 0 for name in OBJECT_SIZES}
+
+    for frame, truth in scenes:
+        image_pts, H = detect_table_and_homography(frame)
+
+        if H is None:
+            continue
+
+        detected = detect_objects(frame, H, image_pts)
+        tables.append((frame, H, image_pts, detected))
+
+        for name, data in truth["objects"].items():
+            if detected.get(name) is not None and bbox_iou(detected[name]["bbox"], data["bbox"]) >= MIN_IOU:
+                found[name] += 1
+
+    if not tables:
+        raise SystemExit(f"{resolution[0]}x{resolution[1]}: table never detected")
+
+    stages = {}
+
+    stages["table_detection"] = time_calls(
+        lambda scene: detect_table_and_homography(scene[0]),
+        scenes,
+        repeats)
+
+    stages["object_detection"] = time_calls(
+        lambda table: detect_objects(table[0], table[1], table[2]),
+        tables,
+        repeats)
+
+    masks = [object_mask(truth, frame.shape, rng) for frame, truth in scenes]
+    stages["contours"] = time_calls(
+        lambda mask: (largest_valid_contour_bbox(mask), largest_thin_contour_bbox(mask)),
+        masks,
+        repeats)
+
+    # Same task procedure and targets for every run, every pass
+    # starts from the first task
+    state_manager = TaskStateManager([(0.2, 0.2), (0.5, 0.5), (0.8, 0.8)])
+    initial_progress = state_manager.progress()
+    stages["state_update"] = time_calls(
+        lambda table: state_manager.update(table[3]),
+        tables,
+        repeats,
+        reset=lambda: state_manager.restore_progress(initial_progress))
+
+    # Whole per-frame work of a station, table tracking included
+    np.random.seed(seed)
+    station = Station()
+    stages["frame_loop"] = time_calls(
+        lambda scene: station.process(scene[0]),
+        scenes,
+        repeats)
+
+    return {
+        "stages": stages,
+        "table_rate": round(len(tables) / len(scenes), 3),
+        "detection_rate": {name: round(count / len(scenes), 3) for name, count in found.items()}
+    }
+
+
+def compare(results, baseline, threshold, min_delta_ms, max_rate_drop):
+
+    # Returns the list of regressions (empty = pass)
+    regressions = []
+
+    for label, result in results.items():
+        reference = baseline.get(label)
+        if reference is None:
+            continue
+
+        for stage, timing in result["stages"].items():
+            before = reference["stages"].get(stage)
+            if before is None:
+                continue
+
+            limit = max(before["median_ms"] * (1 + threshold), before["median_ms"] + min_delta_ms)
+
+            if timing["median_ms"] > limit:
+                regressions.append(
+                    f"{label} {stage}: {timing['median_ms']:.3f}ms, baseline {before['median_ms']:.3f}ms")
+
+        rates = dict(result["detection_rate"], table=result["table_rate"])
+        reference_rates = dict(reference["detection_rate"], table=reference["table_rate"])
+
+        for name, rate in rates.items():
+            before = reference_rates.get(name)
+
+            if before is not None and rate < before - max_rate_drop:
+                regressions.append(f"{label} {name} found in {rate:.0%} of frames, baseline {before:.0%}")
+
+    return regressions
+
+
+def format_results(results, baseline):
+
+    lines = [f"{'resolution':<11} {'stage':<17} {'median':>9} {'p95':>9} {'baseline':>9} {'change':>8}"]
+
+    for label, result in results.items():
+        reference = baseline.get(label, {}).get("stages", {})
+
+        for stage in STAGES:
+            timing = result["stages"][stage]
+            before = reference.get(stage)
+
+            line = f"{label:<11} {stage:<17} {timing['median_ms']:>7.3f}ms {timing['p95_ms']:>7.3f}ms"
+
+            if before is not None:
+                change = timing["median_ms"] / before["median_ms"] - 1 if before["median_ms"] > 0 else 0.0
+                line += f" {before['median_ms']:>7.3f}ms {change:>+8.1%}"
+
+            lines.append(line)
+
+        rates = "  ".join(f"{name}={rate:.0%}" for name, rate in result["detection_rate"].items())
+        lines.append(f"{label:<11} found: table={result['table_rate']:.0%}  {rates}")
+
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Perception benchmark with regression check")
+    parser.add_argument(
+        "--resolutions",
+        default="640x360,1280x720,1920x1080",
+        help="comma-separated list of WIDTHxHEIGHT")
+    parser.add_argument("--frames", type=int, default=30, help="synthetic frames per resolution")
+    parser.add_argument("--repeats", type=int, default=5, help="timed passes over the frames, the fastest counts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="store this run as the new baseline instead of comparing")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="allowed relative slowdown of a stage's median")
+    parser.add_argument(
+        "--min-delta-ms",
+        type=float,
+        default=0.1,
+        help="slowdowns below this many milliseconds are ignored")
+    parser.add_argument(
+        "--max-rate-drop",
+        type=float,
+        default=0.1,
+        help="allowed drop of the share of frames an object is found in")
+    parser.add_argument("--no-profile", action="store_true", help="time without the stage timers")
+    args = parser.parse_args()
+
+    profiler.enabled = not args.no_profile
+
+    # One thread, like a station sharing its machine
+    cv2.setNumThreads(1)
+
+    results = {}
+    for text in args.resolutions.split(","):
+        resolution = parse_resolution(text)
+        label = f"{resolution[0]}x{resolution[1]}"
+
+        print(f"Benchmarking {label} ...", flush=True)
+        results[label] = run_resolution(resolution, args.frames, args.repeats, args.seed)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "machine": machine_info(),
+                "settings": {"frames": args.frames, "repeats": args.repeats, "seed": args.seed},
+                "results": results
+            }, f, indent=4)
+
+        print(format_results(results, {}))
+        print(f"Baseline written to {args.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print(format_results(results, {}))
+        print(f"No baseline at {args.baseline}, run with --save-baseline first")
+        sys.exit(0)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    print(format_results(results, baseline["results"]))
+
+    if baseline.get("machine") != machine_info():
+        print("Warning: baseline was recorded on another machine or library version")
+
+    regressions = compare(
+        results,
+        baseline["results"],
+        args.threshold,
+        args.min_delta_ms,
+        args.max_rate_drop)
+
+    if regressions:
+        print("Regressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+
+    print("No regressions")
@@ -0,0 +1,61 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# Allow running as "python Testing/replay_session.py" from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Runtime.frame_sources import open_source
+from Runtime.station import Station
+
+# Runs perception and task state over a recorded session, video file or
+# image directory without opening any window.
+# Example:
+#   python Testing/replay_session.py --source session.tgsrec
+#   python Testing/replay_session.py --source session.tgsrec --realtime
+
+parser = argparse.ArgumentParser(description="Headless replay")
+parser.add_argument("--source", required=True)
+parser.add_argument("--realtime", action="store_true")
+parser.add_argument("--seed", type=int, default=0, help="seed for the random targets")
+args = parser.parse_args()
+
+# Fixed seed so every replay uses the same targets
+np.random.seed(args.seed)
+station = Station()
+state_manager = station.state_manager
+
+source = open_source(args.source, realtime=args.realtime)
+
+frames = 0
+frames_with_table = 0
+start = time.perf_counter()
+
+while True:
+    success, frame = source.read()
+    if not success:
+        break
+
+    frames += 1
+
+    previous_state = state_manager.current_state
+    result = station.process(frame)
+
+    if result["detected_objects"] is not None:
+        frames_with_table += 1
+
+    # Print every state transition with its frame index and timestamp
+    if state_manager.current_state != previous_state:
+        print(
+            f"frame {source.frame_index} t={source.timestamp:.3f}s: "
+            f"{previous_state} -> {state_manager.current_state}")
+
+elapsed = time.perf_counter() - start
+source.release()
+
+print(f"Frames: {frames} ({frames_with_table} with table)")
+print(f"Elapsed: {elapsed:.2f}s ({frames / elapsed if elapsed > 0 else 0:.1f} FPS)")
+print(f"Final state: {state_manager.current_state}")
@@ -0,0 +1,297 @@
+import argparse
+import os
+import sys
+
+import cv2
+import numpy as np
+
+# Allow running as "python Testing/synthetic_scene.py" from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Perception.table_detection import MARKER_TO_CORNER, TABLE_PTS
+from Runtime.frame_sources import SessionRecorder
+
+# Renders synthetic camera frames of the table: the four ArUco markers
+# of ArUco_Markers/ at the table corners under a random homography,
+# with the cup, bottle and pencil on the table, plus lighting and noise.
+# Every frame comes with its ground truth (table corners, object
+# positions in table coordinates and image bounding boxes).
+# Example:
+#   python Testing/synthetic_scene.py --output synthetic.tgsrec --frames 300
+#   python main.py --source synthetic.tgsrec
+
+MARKER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "ArUco_Markers")
+
+# Colors (BGR) inside the HSV ranges of procedure_config.json
+TABLE_COLOR = (200, 200, 200)
+OBJECT_COLORS = {
+    "cup": (160, 40, 140),     # purple
+    "bottle": (120, 40, 10),   # dark blue
+    "pencil": (0, 220, 230)    # yellow
+}
+
+# Object footprints in table units (table = 1 x 1)
+OBJECT_SIZES = {
+    "cup": (0.09, 0.12),
+    "bottle": (0.08, 0.16),
+    "pencil": (0.02, 0.2)
+}
+
+# Table units -> canvas pixels of the top-down drawing
+MARKER_SIZE = 0.08
+CANVAS_MARGIN = 0.1
+
+
+def load_markers():
+
+    # {corner: marker image}, e.g. {"TL": aruco_0.png}
+    markers = {}
+
+    for marker_id, corner in MARKER_TO_CORNER.items():
+        path = os.path.join(MARKER_DIR, f"aruco_{marker_id}.png")
+        image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+
+        if image is None:
+            raise FileNotFoundError(path)
+
+        markers[corner] = image
+
+    return markers
+
+
+def random_table_corners(rng, resolution, coverage=0.6, tilt=0.1):
+    """
+    Image positions of the 4 table corners (TL, TR, BR, BL):
+    a centered rectangle covering `coverage` of the frame width,
+    each corner moved randomly by up to `tilt` of the table size.
+    """
+
+    width, height = resolution
+
+    table_w = width * coverage
+    table_h = min(height * 0.65, table_w / 1.5)
+
+    corners = np.array([
+        [-0.5, -0.5],
+        [0.5, -0.5],
+        [0.5, 0.5],
+        [-0.5, 0.5]
+    ]) * [table_w, table_h] + [width / 2, height / 2]
+
+    corners += rng.uniform(-tilt, tilt, (4, 2)) * [table_w, table_h]
+
+    return corners.astype(np.float32)
+
+
+def random_object_positions(rng, names, min_distance=0.22):
+
+    # Table coordinates of every object, away from the markers and each other
+    positions = {}
+
+    while len(positions) < len(names):
+        candidate = rng.uniform(0.2, 0.8, 2)
+
+        if all(np.hypot(*(candidate - p)) >= min_distance for p in positions.values()):
+            positions[names[len(positions)]] = candidate
+
+    return {name: (float(x), float(y)) for name, (x, y) in positions.items()}
+
+
+class SceneGenerator:
+
+    def __init__(self, resolution=(1280, 720), seed=0, brightness=1.0, gradient=0.0, noise=0.0):
+        """
+        resolution = (width, height) of the frames
+        brightness = global light level (1.0 = as drawn)
+        gradient = light falloff across the frame (0.3 = +-30 %)
+        noise = standard deviation of the Gaussian sensor noise (0-255 scale)
+        """
+
+        self.resolution = tuple(resolution)
+        self.rng = np.random.default_rng(seed)
+        self.brightness = brightness
+        self.gradient = gradient
+        self.noise = noise
+
+        self.markers = load_markers()
+
+        # Top-down drawing of the table, about as wide as the frame
+        self.canvas_scale = max(400, resolution[0] // 2)
+        self.canvas_size = int(round((1 + 2 * CANVAS_MARGIN) * self.canvas_scale))
+
+        # Light falloff, same for every frame
+        width, height = self.resolution
+        ramp = np.linspace(1.0 - gradient, 1.0 + gradient, width, dtype=np.float32)
+        self.light = np.tile(ramp * brightness, (height, 1))[..., None]
+
+    def to_canvas(self, point):
+
+        # Table coordinates -> canvas pixels
+        return (np.asarray(point) + CANVAS_MARGIN) * self.canvas_scale
+
+    def draw_canvas(self, positions):
+
+        size = self.canvas_size
+        canvas = np.full((size, size, 3), 90, np.uint8)
+
+        # Table surface between the marker centers
+        table = self.to_canvas(TABLE_PTS).astype(np.int32)
+        cv2.fillPoly(canvas, [table], TABLE_COLOR)
+
+        # Markers centered on the table corners, with a white quiet zone
+        marker_px = int(round(MARKER_SIZE * self.canvas_scale))
+
+        for corner, center in zip(("TL", "TR", "BR", "BL"), table):
+            quiet = marker_px * 3 // 4
+            cv2.rectangle(
+                canvas,
+                tuple(int(v) for v in center - quiet),
+                tuple(int(v) for v in center + quiet),
+                (255, 255, 255),
+                -1)
+
+            marker = cv2.resize(self.markers[corner], (marker_px, marker_px), interpolation=cv2.INTER_NEAREST)
+            x, y = (center - marker_px // 2).astype(int)
+            canvas[y:y + marker_px, x:x + marker_px] = marker[..., None]
+
+        for name, position in positions.items():
+            w, h = np.asarray(OBJECT_SIZES[name]) * self.canvas_scale
+            cx, cy = self.to_canvas(position)
+            color = OBJECT_COLORS[name]
+
+            if name == "cup":
+                cv2.ellipse(canvas, (int(cx), int(cy)), (int(w / 2), int(h / 2)), 0, 0, 360, color, -1)
+            else:
+                cv2.rectangle(canvas, (int(cx - w / 2), int(cy - h / 2)), (int(cx + w / 2), int(cy + h / 2)), color, -1)
+
+        return canvas
+
+    def render(self, corners=None, positions=None):
+        """
+        Returns (frame, truth):
+            truth["image_pts"] = image positions of the table corners
+            truth["H"] = table -> image homography
+            truth["objects"] = {name: {"table_coords", "bbox"}}
+        Corners and object positions are random unless given.
+        """
+
+        if corners is None:
+            corners = random_table_corners(self.rng, self.resolution)
+
+        if positions is None:
+            positions = random_object_positions(self.rng, list(OBJECT_COLORS))
+
+        H, _ = cv2.findHomography(TABLE_PTS, corners)
+
+        # Canvas pixels -> table coordinates -> image
+        canvas_to_table = np.array([
+            [1 / self.canvas_scale, 0, -CANVAS_MARGIN],
+            [0, 1 / self.canvas_scale, -CANVAS_MARGIN],
+            [0, 0, 1]
+        ])
+
+        canvas = self.draw_canvas(positions)
+        width, height = self.resolution
+
+        frame = np.full((height, width, 3), 60, np.uint8)
+        cv2.warpPerspective(
+            canvas,
+            H @ canvas_to_table,
+            (width, height),
+            dst=frame,
+            flags=cv2.INTER_LINEAR,
+            borderMode=cv2.BORDER_TRANSPARENT)
+
+        frame = self.apply_lighting(frame)
+
+        objects = {}
+        for name, position in positions.items():
+            w, h = OBJECT_SIZES[name]
+            footprint = np.array([[-w, -h], [w, -h], [w, h], [-w, h]], np.float32) / 2 + position
+            projected = cv2.perspectiveTransform(footprint[None], H)[0]
+
+            objects[name] = {
+                "table_coords": position,
+                "bbox": cv2.boundingRect(projected.astype(np.float32))
+            }
+
+        truth = {"image_pts": corners, "H": H, "objects": objects}
+        return frame, truth
+
+    def apply_lighting(self, frame):
+
+        if self.brightness == 1.0 and self.gradient == 0.0 and self.noise == 0.0:
+            return frame
+
+        lit = frame.astype(np.float32) * self.light
+
+        if self.noise > 0:
+            lit += self.rng.normal(0.0, self.noise, lit.shape).astype(np.float32)
+
+        return np.clip(lit, 0, 255).astype(np.uint8)
+
+    def sequence(self, count, shake=2.0):
+        """
+        Yields (frame, truth) for `count` frames of one scene:
+        the camera shakes by up to `shake` pixels and every object
+        slides in a straight line across the table.
+        """
+
+        corners = random_table_corners(self.rng, self.resolution)
+        start = random_object_positions(self.rng, list(OBJECT_COLORS))
+        end = random_object_positions(self.rng, list(OBJECT_COLORS))
+
+        for i in range(count):
+            t = i / max(1, count - 1)
+            positions = {
+                name: tuple((1 - t) * np.asarray(start[name]) + t * np.asarray(end[name]))
+                for name in start
+            }
+
+            shaken = corners + self.rng.uniform(-shake, shake, corners.shape).astype(np.float32)
+            yield self.render(shaken, positions)
+
+
+def parse_resolution(text):
+
+    # "1280x720" -> (1280, 720)
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Render a synthetic table session")
+    parser.add_argument("--output", required=True, help=".tgsrec session or image directory")
+    parser.add_argument("--frames", type=int, default=150)
+    parser.add_argument("--resolution", type=parse_resolution, default=(1280, 720), help="e.g. 1920x1080")
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--brightness", type=float, default=1.0)
+    parser.add_argument("--gradient", type=float, default=0.0)
+    parser.add_argument("--noise", type=float, default=0.0)
+    args = parser.parse_args()
+
+    generator = SceneGenerator(
+        args.resolution,
+        seed=args.seed,
+        brightness=args.brightness,
+        gradient=args.gradient,
+        noise=args.noise)
+
+    recorder = None
+    if args.output.endswith(".tgsrec"):
+        recorder = SessionRecorder(args.output)
+    else:
+        os.makedirs(args.output, exist_ok=True)
+
+    for i, (frame, _) in enumerate(generator.sequence(args.frames)):
+        if recorder is not None:
+            recorder.write(frame, i / args.fps)
+        else:
+            cv2.imwrite(os.path.join(args.output, f"{i:05d}.png"), frame)
+
+    if recorder is not None:
+        recorder.close()
+
+    print(f"{args.frames} frames written to {args.output}")
@@ -2,36 +2,46 @@ import cv2
 import numpy as np
 
 
-def draw_guidance_arrow(frame, H, detected_objects, state_manager):
+def draw_guidance_arrow(frame, H, detected_objects, state_manager, geometry=None):
+
+    # geometry (TableGeometry, optional): supplies target centers already
+    # projected into image space for the current homography
 
     current_obj = state_manager.get_current_object()
 
     if current_obj is None:
         return
 
+    # Detection of the current task (for a repeated object the item
+    # that is not placed yet, see TaskStateManager.update)
     obj_data = detected_objects.get(current_obj)
 
     if obj_data is None:
         return
 
-    # Object position in image space
-    x1, y1, x2, y2 = obj_data["bbox"]
+    # Object position in image space (x, y, width, height)
+    x, y, w, h = obj_data["bbox"]
 
-     # Compute center of bounding box
+    # Compute center of bounding box
     # This represents the object's current position in pixel space
-    obj_center = (int((x1+x2)/2), int((y1+y2)/2))
+    obj_center = (int(x + w/2), int(y + h/2))
+
+    if geometry is not None:
+        # Every target projected once per homography
+        target_center = geometry.target_image_points(state_manager.targets)[current_obj]
 
-    # Target is stored in normalized table coordinates (0 to 1)
-    tx, ty = state_manager.targets[current_obj]
+    else:
+        # Target is stored in normalized table coordinates (0 to 1)
+        tx, ty = state_manager.targets[current_obj]
 
-    # Format the target point for homography transformation
-    table_pt = np.array([[[tx, ty]]], dtype=np.float32)
+        # Format the target point for homography transformation
+        table_pt = np.array([[[tx, ty]]], dtype=np.float32)
 
-    # Project target from table coordinate system → image pixel system
-    img_pt = cv2.perspectiveTransform(table_pt, H)
-    
-    # Extract pixel coordinates
-    target_center = tuple(img_pt[0][0].astype(int))
+        # Project target from table coordinate system → image pixel system
+        img_pt = cv2.perspectiveTransform(table_pt, H)
+        
+        # Extract pixel coordinates
+        target_center = tuple(img_pt[0][0].astype(int))
 
     # Draw arrow from object to target 
     cv2.arrowedLine(frame,
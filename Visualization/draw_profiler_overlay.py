@@ -0,0 +1,40 @@
+import cv2
+
+
+def draw_profiler_overlay(frame, profiler):
+
+    # Parameters:
+    #     frame (np.ndarray): Current camera image.
+    #     profiler (Profiler): Profiler collecting the stage timings.
+
+    if not profiler.enabled:
+        return
+
+    # Percentiles are recomputed at most twice per second
+    summary = profiler.summary(refresh_interval=0.5)
+
+    fps_text = f"FPS: {profiler.fps():.1f}"
+
+    cv2.putText(frame,
+                fps_text,
+                (20,100),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                0.6,
+                (0,255,0),
+                2)
+
+    # Slowest stage by p95 time
+    name, stats = profiler.worst_stage(summary)
+
+    if name is None:
+        return
+
+    worst_text = f"Slowest: {name} p95 {stats['p95']:.1f} ms (max {stats['max']:.1f})"
+
+    cv2.putText(frame,
+                worst_text,
+                (20,125),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                0.6,
+                (0,255,0),
+                2)
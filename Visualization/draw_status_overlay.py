@@ -3,7 +3,8 @@ import numpy as np
 
 def draw_status_overlay(frame, state_manager, detected_objects):
 
-    current = state_manager.get_current_object()
+    current_task = state_manager.get_current_object()
+    current = state_manager.object_of(current_task)
 
     if current is None:
         text = "All tasks complete!"
@@ -19,7 +20,7 @@ def draw_status_overlay(frame, state_manager, detected_objects):
                 2)
 
     # Debug info
-    detected = detected_objects.get(current) is not None
+    detected = detected_objects.get(current_task) is not None
     debug_text = f"Target Detected: {'Yes' if detected else 'No'}"
 
     cv2.putText(frame,
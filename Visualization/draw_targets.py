@@ -1,27 +1,45 @@
 import cv2
 import numpy as np
 
+# Corner offsets of a target square, scaled by the zone size
+SQUARE_OFFSETS = np.array([
+    [-1, -1],
+    [ 1, -1],
+    [ 1,  1],
+    [-1,  1]
+], dtype=np.float32)
+
 def draw_targets(frame, H, targets_dict, state_manager):
 
     size = 0.08  # zone width in table units
 
-    # Draw a target for each object 
-    for obj_name, (tx, ty) in targets_dict.items():
+    if not targets_dict:
+        return
+
+    names = list(targets_dict.keys())
+    centers = np.array(list(targets_dict.values()), dtype=np.float32)
+
+    # Create squares in table space
+    # Each square is centered at (tx, ty) in normalized space.
+    # Rows per target: 4 square corners followed by the center.
+    squares = centers[:, None, :] + size * SQUARE_OFFSETS[None, :, :]
+    points = np.concatenate([squares, centers[:, None, :]], axis=1)
 
-        # Create square in table space
-        # The square is centered at (tx, ty) in normalized space
-        square = np.array([
-            [tx - size, ty - size],
-            [tx + size, ty - size],
-            [tx + size, ty + size],
-            [tx - size, ty + size]
-        ], dtype=np.float32).reshape(-1,1,2)
+    # Project every square and center from table space → image space
+    # in one call. Makes targets align with real table perspective.
+    projected = cv2.perspectiveTransform(points.reshape(-1, 1, 2), H)
+    projected = projected.reshape(len(names), 5, 2)
 
-        # Project square from table space → image space
-        # Makes target align with real table perspective
-        warped = cv2.perspectiveTransform(square, H).astype(int)
+    # Label (A, B, C, ...) of each zone
+    label_map = state_manager.labels
 
-        # Determine color for target 
+    # Draw a target for each object
+    for obj_name, target_pts in zip(names, projected):
+
+        warped = target_pts[:4].astype(int).reshape(-1, 1, 2)
+        cx, cy = target_pts[4]
+
+        # Determine color for target
         if state_manager.placed[obj_name]:
             color = (0,255,0)   # green
         else:
@@ -30,21 +48,7 @@ def draw_targets(frame, H, targets_dict, state_manager):
         # Draw the projected square target
         cv2.polylines(frame, [warped], True, color, 2)
 
-        # Draw label (A, B, C)
-        # Each object corresponds to a zone
-        label_map = {
-            "cup": "A",
-            "bottle": "B",
-            "pencil": "C"
-        }
-
-        # Project the target zone center (normalized table coordinates)
-        # into image pixel coordinates for drawing the label
-        center = np.array([[[tx, ty]]], dtype=np.float32)
-        img_center = cv2.perspectiveTransform(center, H)
-        cx, cy = img_center[0][0]
-
-        # Add label (A, B, C) above target zone 
+        # Add label (A, B, C, ...) above target zone
         cv2.putText(frame,
                     label_map[obj_name],
                     (int(cx)-10, int(cy)-10),
@@ -52,4 +56,3 @@ def draw_targets(frame, H, targets_dict, state_manager):
                     0.6,
                     color,
                     2)
-
@@ -43,6 +43,12 @@ def pad_bottle_bbox(bbox, padding=20):
 
     return (x, y, w, h)
 
+# Style comes from the object registry: text, color (BGR), padding
+def highlight_registered_object(frame, bbox, style):
+    padded_bbox = pad_bottle_bbox(bbox, style["padding"]) if style["padding"] else bbox
+    highlight_object(frame, padded_bbox, style["text"], style["color"])
+
+
 # Wrappers
 def highlight_cup(frame, bbox):
     highlight_object(frame, bbox, "Cup", (0, 0, 255))  # Red
@@ -0,0 +1,55 @@
+from Runtime.profiler import profiler
+
+from Visualization.draw_table_boundary import draw_table_boundary
+from Visualization.draw_targets import draw_targets
+from Visualization.draw_guidance_arrow import draw_guidance_arrow
+from Visualization.draw_status_overlay import draw_status_overlay
+from Visualization.highlight_objects import highlight_registered_object
+
+
+def render_frame(frame, H, image_pts, detected_objects, state, registry,
+                 static_overlay=None, geometry=None, homography_version=None):
+
+    # Draws every guidance overlay for one perception result.
+    # registry: ObjectRegistry giving each object's highlight style.
+    # static_overlay: optional StaticOverlay caching the table boundary
+    #     and target zones between homography / placement changes.
+    # geometry: optional TableGeometry of H with cached projections.
+    # homography_version: optional key of H (see Station.process),
+    #     lets static_overlay skip comparing the matrix.
+    # Nothing is drawn until the table has been detected once.
+    if detected_objects is None:
+        return frame
+
+    if static_overlay is not None:
+        with profiler.timer("draw.static_overlay"):
+            static_overlay.apply(frame, H, image_pts, state, homography_version)
+
+    else:
+        # Draw boundary zone from ArUco markers
+        with profiler.timer("draw.table_boundary"):
+            draw_table_boundary(frame, image_pts)
+        
+        # Draw warped targets in boundary zone (A, B, C, ...)
+        with profiler.timer("draw.targets"):
+            draw_targets(frame, H, state.targets, state)
+
+    # Draw guidance arrow to current target
+    with profiler.timer("draw.guidance_arrow"):
+        draw_guidance_arrow(frame, H, detected_objects, state, geometry)
+
+    # Add textual feedback regarding the current step
+    with profiler.timer("draw.status_overlay"):
+        draw_status_overlay(frame, state, detected_objects)
+
+    current_task = state.get_current_object()
+
+    with profiler.timer("draw.highlight"):
+        if current_task is not None:
+            obj_data = detected_objects.get(current_task)
+            highlight_registered_object(
+                frame,
+                obj_data["bbox"] if obj_data else None,
+                registry.highlight_style(state.object_of(current_task)))
+
+    return frame
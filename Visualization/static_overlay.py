@@ -0,0 +1,84 @@
+import cv2
+import numpy as np
+
+from Visualization.draw_table_boundary import draw_table_boundary
+from Visualization.draw_targets import draw_targets
+
+
+class StaticOverlay:
+
+    def __init__(self):
+        """
+        Cached layer holding the table boundary and the target zones.
+        Both only change when the homography, the table corners or a
+        target's placed flag change, so they are drawn once into a
+        buffer and composited onto every frame with one masked copy.
+        """
+
+        self.key = None
+
+        # Drawn pixels, cropped to their bounding rectangle
+        self.layer = None
+        self.mask = None
+        self.rect = None
+
+        self.renders = 0
+        self.hits = 0
+
+    # version: optional key of H (e.g. HomographyStabilizer.version)
+    # used instead of the matrix bytes
+    def apply(self, frame, H, image_pts, state_manager, version=None):
+
+        homography_key = version
+        if version is None:
+            homography_key = (H.tobytes(), image_pts.tobytes())
+
+        key = (
+            frame.shape,
+            homography_key,
+            tuple(state_manager.placed.values()),
+            tuple(state_manager.targets.values())
+        )
+
+        if key != self.key:
+            self.render(frame.shape, H, image_pts, state_manager)
+            self.key = key
+        else:
+            self.hits += 1
+
+        if self.rect is None:
+            return frame
+
+        x, y, w, h = self.rect
+        cv2.copyTo(self.layer, self.mask, frame[y:y + h, x:x + w])
+
+        return frame
+
+    def render(self, shape, H, image_pts, state_manager):
+
+        layer = np.zeros(shape, np.uint8)
+
+        # Draw boundary zone from ArUco markers
+        draw_table_boundary(layer, image_pts)
+
+        # Draw warped targets in boundary zone (A, B, C, ...)
+        draw_targets(layer, H, state_manager.targets, state_manager)
+
+        mask = np.any(layer != 0, axis=2).astype(np.uint8) * 255
+
+        self.renders += 1
+
+        if not mask.any():
+            self.layer = None
+            self.mask = None
+            self.rect = None
+            return
+
+        x, y, w, h = cv2.boundingRect(mask)
+
+        self.layer = layer[y:y + h, x:x + w].copy()
+        self.mask = mask[y:y + h, x:x + w].copy()
+        self.rect = (x, y, w, h)
+
+    def invalidate(self):
+        self.key = None
@@ -0,0 +1,155 @@
+import argparse
+import os
+
+import cv2
+import numpy as np
+
+from Perception.color_lut import ColorLUTBuilder, DEFAULT_BINS
+from Perception.object_detection import preprocess_hsv
+from Perception.segmentation import SegmentationEngine
+from Perception.table_detection import detect_table_and_homography
+from Runtime.frame_sources import open_source
+from State.object_registry import CONFIG_PATH, load_registry
+
+# Builds the calibrated BGR -> object table from sample frames of the
+# real objects under the station's lighting.
+# Every sample frame is labelled by the HSV ranges of the procedure
+# config (with the usual lighting normalization), and the table learns
+# which raw camera colors ended up as which object.
+# Example:
+#   python main.py --record samples.tgsrec      (move every object around the table)
+#   python calibrate_colors.py --source samples.tgsrec
+# then add "color_lut": "color_lut.npy" to procedure_config.json
+
+
+def label_sample(frame, engine):
+
+    # Teacher labels of one frame: (labels, valid) or None without a table.
+    # Only the opened core of every blob counts as the object, pixels
+    # removed by the opening are left out as uncertain.
+    image_pts, H = detect_table_and_homography(frame)
+
+    if H is None:
+        return None
+
+    table_mask = np.zeros(frame.shape[:2], np.uint8)
+    cv2.fillPoly(table_mask, [np.round(image_pts).astype(np.int32)], 255)
+
+    labels = engine.classify_hsv(preprocess_hsv(frame))
+    labels = cv2.min(labels, table_mask)
+
+    core = engine.open_labels(labels)
+
+    background = cv2.bitwise_and(
+        cv2.compare(labels, 0, cv2.CMP_EQ), table_mask)
+    valid = cv2.bitwise_or(background, cv2.compare(core, 0, cv2.CMP_GT))
+
+    return core, valid
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Calibrate the color lookup table")
+    parser.add_argument(
+        "--source",
+        required=True,
+        help="camera index, video file, image directory or .tgsrec session")
+    parser.add_argument(
+        "--config",
+        default=CONFIG_PATH,
+        help="procedure config whose objects are calibrated")
+    parser.add_argument(
+        "--output",
+        help="table to write (default color_lut.npy next to the config)")
+    parser.add_argument(
+        "--bins",
+        type=int,
+        default=DEFAULT_BINS,
+        help="bins per color channel (power of two)")
+    parser.add_argument(
+        "--every",
+        type=int,
+        default=5,
+        help="use every Nth frame")
+    parser.add_argument(
+        "--max-frames",
+        type=int,
+        default=300,
+        help="stop after this many sample frames")
+    parser.add_argument(
+        "--smoothing",
+        type=int,
+        default=1,
+        help="neighbouring bins pooled with every bin")
+    parser.add_argument(
+        "--min-samples",
+        type=int,
+        default=3,
+        help="pooled samples a bin needs to be assigned to an object")
+    args = parser.parse_args()
+
+    output = args.output
+    if output is None:
+        output = os.path.join(os.path.dirname(os.path.abspath(args.config)), "color_lut.npy")
+
+    registry = load_registry(args.config)
+    engine = SegmentationEngine(registry.objects)
+
+    builder = ColorLUTBuilder(
+        registry.names,
+        bins=args.bins,
+        smoothing=args.smoothing,
+        min_samples=args.min_samples)
+
+    source = open_source(args.source)
+    frames = 0
+    skipped = 0
+
+    try:
+        while builder.frames < args.max_frames:
+            success, frame = source.read()
+            if not success:
+                break
+
+            frames += 1
+            if (frames - 1) % args.every != 0:
+                continue
+
+            sample = label_sample(frame, engine)
+
+            if sample is None:
+                skipped += 1
+                continue
+
+            labels, valid = sample
+            builder.add(frame, labels, valid)
+
+    finally:
+        source.release()
+
+    if builder.frames == 0:
+        raise SystemExit("No sample frame showed the table markers")
+
+    color_lut = builder.build()
+    color_lut.save(output)
+
+    # Share of every label's samples the table reproduces
+    counts = builder.counts
+    table = np.asarray(color_lut.table).reshape(-1)
+    agreeing = counts[np.arange(len(table)), table.astype(np.int64)]
+    totals = counts.sum(axis=0)
+
+    print(f"{builder.frames} sample frames ({skipped} without table)")
+
+    for label, name in enumerate(["background"] + registry.names):
+        matched = counts[table == label, label].sum()
+        share = matched / totals[label] if totals[label] else 0.0
+        bins = int(np.count_nonzero(table == label))
+        print(f"{name:<12} samples={totals[label]:<10} bins={bins:<7} agreement={share:.1%}")
+
+        if label > 0 and bins == 0:
+            print(f"  warning: {name} never appeared, it will not be detected with this table")
+
+    print(f"Overall agreement {agreeing.sum() / max(1, totals.sum()):.1%}")
+    print(f"Color LUT written to {output}")
+    print(f'Add "color_lut": "{os.path.basename(output)}" to {os.path.basename(args.config)} to use it')
@@ -1,97 +1,321 @@
+import argparse
+import signal
+import sys
+import time
+
 import cv2
 
-# Perception
-from Perception.table_detection import detect_table_and_homography
-from Perception.object_detection import detect_objects
+# Visualization
+from Visualization.render_frame import render_frame
+from Visualization.draw_profiler_overlay import draw_profiler_overlay
+from Visualization.static_overlay import StaticOverlay
+
+# Runtime
+from Runtime.pipeline import Pipeline, DROP_OLDEST, BLOCK, format_stats
+from Runtime.frame_sources import open_source
+from Runtime.station import Station
+from Runtime.event_stream import EventWriter, FORMATS
+from Runtime.scheduler import LatencyScheduler, format_metrics
+from Runtime.flight_recorder import FlightRecorder, FlightRecorderSource
+from Runtime.stream_server import StreamServer, format_stream_stats
+from Runtime import profiler as profiling
 
-# State
-from State.targets import generate_random_targets
-from State.state_management import TaskStateManager
+parser = argparse.ArgumentParser(description="Task Guidance System")
+parser.add_argument(
+    "--source",
+    default="1",
+    help="camera index, video file, image directory or .tgsrec session")
+parser.add_argument(
+    "--realtime",
+    action="store_true",
+    help="replay files at their recorded timing instead of as fast as possible")
+parser.add_argument(
+    "--record",
+    metavar="PATH",
+    help="record the raw frames of this run into a .tgsrec session")
+parser.add_argument(
+    "--no-profile",
+    action="store_true",
+    help="disable the per-stage timers")
+parser.add_argument(
+    "--profile-report",
+    default="profile_report.json",
+    metavar="PATH",
+    help="where the stage timing report is written on exit")
+parser.add_argument(
+    "--budget-ms",
+    type=float,
+    metavar="MS",
+    help="per-frame perception budget: lower the processing resolution "
+         "and detect the table less often while over budget")
+parser.add_argument(
+    "--detect-all",
+    action="store_true",
+    help="look for every object on every frame, not only the ones the "
+         "current step needs")
+parser.add_argument(
+    "--pyramid",
+    type=int,
+    choices=(0, 1, 2),
+    default=0,
+    help="find objects at 1/2 (1) or 1/4 (2) resolution, then refine "
+         "them at full resolution; for 4K cameras")
+parser.add_argument(
+    "--rectified",
+    nargs="?",
+    const="640x400",
+    metavar="WxH",
+    help="detect objects on a top-down WxH canvas of the table "
+         "(default 640x400): same cost for any camera, sizes in table units")
+parser.add_argument(
+    "--homography-threshold",
+    type=float,
+    default=1.0,
+    metavar="PX",
+    help="pixels a table corner has to move before the homography "
+         "is updated (smaller movements are treated as jitter)")
+parser.add_argument(
+    "--headless",
+    action="store_true",
+    help="no window and no overlays, only the event stream")
+parser.add_argument(
+    "--events",
+    metavar="SINK",
+    help="write detections and state transitions to -, a file, "
+         "tcp://host:port or unix://path (default - when headless)")
+parser.add_argument(
+    "--event-format",
+    choices=FORMATS,
+    default="jsonl",
+    help="newline-delimited JSON or binary records")
+parser.add_argument(
+    "--state",
+    metavar="PATH",
+    help="save homography, targets and task progress to this file and "
+         "resume from it at startup (guidance shows on the first frame)")
+parser.add_argument(
+    "--flight-recorder",
+    metavar="PATH",
+    help="keep the last seconds of raw frames and results in this ring "
+         "file (.tgsring); press d to save a copy")
+parser.add_argument(
+    "--flight-seconds",
+    type=float,
+    default=10.0,
+    help="seconds kept by the flight recorder")
+parser.add_argument(
+    "--flight-mb",
+    type=int,
+    default=1024,
+    metavar="MB",
+    help="size limit of the flight recorder's frames, fewer seconds "
+         "are kept for large frames (1024 MB = 5.7 s at 1080p30)")
+parser.add_argument(
+    "--flight-dumps",
+    default="flight_dumps",
+    metavar="DIR",
+    help="where flight recorder copies are saved")
+parser.add_argument(
+    "--serve",
+    metavar="[HOST:]PORT",
+    help="serve the annotated frames (MJPEG / WebSocket) and the task "
+         "state over HTTP, e.g. --serve 8080 or --serve 0.0.0.0:8080")
+parser.add_argument(
+    "--stream-fps",
+    type=float,
+    default=15.0,
+    help="most frames per second encoded for stream viewers")
+args = parser.parse_args()
 
-# Visualization
-from Visualization.draw_table_boundary import draw_table_boundary
-from Visualization.draw_targets import draw_targets
-from Visualization.draw_guidance_arrow import draw_guidance_arrow
-from Visualization.draw_status_overlay import draw_status_overlay
-from Visualization.highlight_objects import (
-    highlight_cup,
-    highlight_bottle,
-    highlight_pencil
-)
-
-# Randomly generates 3 targets once at startup
-targets = generate_random_targets(3)
-
-# Initialize TaskStateManager with 3 targets (A, B, C)
-state_manager = TaskStateManager(targets)
-
-# Camera is connected to Iphone using Camo Camera
-cap = cv2.VideoCapture(1)
-
-# Stores the most recent valid homography matrix, H
-# H maps table coordinate space to image pixel space
-last_valid_H = None
-
-# Stores the most recent valid detected table corner points
-# image_pts: 4 table corner points in image pixel coordinates
-last_valid_image_pts = None
-
-while True:
-    success, frame = cap.read()
-    if not success:
-        break
-    
-    # Detect ArUco markers and compute homography
-    image_pts, H = detect_table_and_homography(frame)
-
-    # Update homography 
-    if H is not None:
-        last_valid_H = H
-        last_valid_image_pts = image_pts
-
-    # if markers are briefly covered
-    # keep using previous homography 
-    if last_valid_H is not None:
-        detected_objects = detect_objects(
-            frame,
-            last_valid_H,
-            last_valid_image_pts)
-        
-        # Update task state 
-        state_manager.update(detected_objects)
-
-        # Draw boundary zone from ArUco markers
-        draw_table_boundary(frame, last_valid_image_pts)
-        
-        # Draw warped targets in boundary zone (A, B, C)
-        draw_targets(frame, last_valid_H, state_manager.targets, state_manager)
-
-        # Draw guidance arrow to current target
-        draw_guidance_arrow(frame, last_valid_H, detected_objects, state_manager)
-
-        # Add textual feedback regarding the current step
-        draw_status_overlay(frame, state_manager, detected_objects)
-
-        current_obj = state_manager.get_current_object()
-
-        if current_obj == "cup":
-            obj_data = detected_objects["cup"]
-            highlight_cup(frame, obj_data["bbox"] if obj_data else None)
-
-        elif current_obj == "bottle":
-            obj_data = detected_objects["bottle"]
-            highlight_bottle(frame, obj_data["bbox"] if obj_data else None)
-
-        elif current_obj == "pencil":
-            obj_data = detected_objects["pencil"]
-            highlight_pencil(frame, obj_data["bbox"] if obj_data else None)
-
-    # Show frame
-    cv2.imshow("Task Guidance System", frame)
-
-    # Press q to exit program
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
-
-cap.release() # Closes Webcam
-cv2.destroyAllWindows() # Closes any OpenCV-created windows
+if args.headless and args.events is None:
+    args.events = "-"
+
+# Keep stdout clean for the event stream
+log = sys.stderr if args.events == "-" else sys.stdout
+
+# Per-stage timers (press p to show FPS and the slowest stage)
+profiler = profiling.profiler
+if not args.no_profile:
+    profiling.enable()
+
+show_profiler_overlay = False
+
+# Picks processing scale and table detection rate to hold the budget
+scheduler = None
+if args.budget_ms is not None:
+    scheduler = LatencyScheduler(args.budget_ms)
+
+# Top-down table canvas size, e.g. "640x400" -> (640, 400)
+rectified_size = None
+if args.rectified is not None:
+    rectified_size = tuple(int(v) for v in args.rectified.lower().split("x"))
+
+# Table tracking, object detection and task state (targets A, B, C)
+station = Station(
+    scheduler=scheduler,
+    lazy_detection=not args.detect_all,
+    pyramid_level=args.pyramid,
+    homography_threshold=args.homography_threshold,
+    rectified_size=rectified_size,
+    state_path=args.state)
+
+if station.warm_start is not None:
+    state_manager = station.state_manager
+    print(f"Resumed {args.state}: step {state_manager.step + 1} of {len(state_manager.order)}, "
+          f"verifying the saved table position", file=log)
+
+# Table boundary and target zones, redrawn only when they change
+static_overlay = StaticOverlay()
+
+# Camera is connected to Iphone using Camo Camera (index 1),
+# or replay a video file, image directory or recorded session
+source = open_source(args.source, realtime=args.realtime, record_path=args.record)
+
+# Last seconds of raw frames and results, saved on d, SIGUSR1
+# or automatically shortly after an anomaly
+flight_recorder = None
+if args.flight_recorder is not None:
+    flight_recorder = FlightRecorder(
+        args.flight_recorder,
+        seconds=args.flight_seconds,
+        max_bytes=args.flight_mb << 20,
+        dump_dir=args.flight_dumps)
+    source = FlightRecorderSource(source, flight_recorder)
+
+    signal.signal(signal.SIGUSR1, lambda signum, frame: flight_recorder.request_dump())
+
+# Per-frame detections and task state transitions for other services
+events = None
+if args.events is not None:
+    events = EventWriter(
+        args.events,
+        station.registry,
+        station.state_manager.order,
+        fmt=args.event_format)
+
+
+# Perception stage (runs on the perception worker thread)
+def perceive(packet):
+
+    packet.update(station.process(packet["frame"]))
+
+    # Every processed frame is logged here: the render queue drops
+    # frames whenever drawing falls behind
+    latency = time.perf_counter() - packet["timestamp"]
+
+    if events is not None:
+        events.frame(packet["index"], packet["timestamp"], packet)
+
+    if flight_recorder is not None:
+        flight_recorder.record_result(packet["index"], packet, latency)
+
+    return packet
+
+
+# Render stage (runs on the main thread)
+def render(packet):
+
+    return render_frame(
+        packet["frame"],
+        packet["H"],
+        packet["image_pts"],
+        packet["detected_objects"],
+        packet["state"],
+        station.registry,
+        static_overlay,
+        packet["geometry"],
+        packet["homography_version"])
+
+
+# Remote viewers, frames are only drawn and encoded while someone watches
+server = None
+if args.serve is not None:
+    host, _, port = args.serve.rpartition(":")
+    server = StreamServer(host or "127.0.0.1", int(port), max_fps=args.stream_fps)
+    server.start()
+    print(f"Streaming at {server.url()}", file=log)
+
+
+# Capture -> perception -> render run concurrently.
+# With a live source, capture always keeps only the newest frame, so a
+# slow perception stage skips stale frames instead of letting camera
+# lag build up. Offline replays process every frame.
+pipeline = Pipeline(
+    source,
+    perceive,
+    capture_queue_size=1,
+    capture_policy=DROP_OLDEST if source.live else BLOCK,
+    render_queue_size=1,
+    render_policy=DROP_OLDEST)
+
+pipeline.start()
+
+try:
+    for packet in pipeline.results():
+        if server is not None:
+            server.update_state(packet["index"], packet, packet["latency"])
+
+        # Headless: no window and no waitKey, stop with Ctrl+C
+        if args.headless:
+            if server is not None and server.wants_frame():
+                server.publish(packet["index"], render(packet))
+
+            profiler.tick()
+            continue
+
+        frame = render(packet)
+
+        if show_profiler_overlay:
+            draw_profiler_overlay(frame, profiler)
+
+        if server is not None and server.wants_frame():
+            server.publish(packet["index"], frame)
+
+        # Show frame
+        with profiler.timer("imshow"):
+            cv2.imshow("Task Guidance System", frame)
+
+        with profiler.timer("waitKey"):
+            key = cv2.waitKey(1) & 0xFF
+
+        profiler.tick()
+
+        # Press q to exit program
+        if key == ord('q'):
+            break
+
+        # Press p to toggle the timing overlay
+        if key == ord('p'):
+            show_profiler_overlay = not show_profiler_overlay
+
+        # Press d to save the flight recorder's last seconds
+        if key == ord('d') and flight_recorder is not None:
+            flight_recorder.request_dump()
+
+except KeyboardInterrupt:
+    pass
+
+finally:
+    pipeline.stop()
+
+    if events is not None:
+        events.close()
+
+    if server is not None:
+        server.stop()
+        print(format_stream_stats(server.stats()), file=log)
+
+    # Per-stage frame rate, queue depth and dropped frames
+    print(format_stats(pipeline.stats()), file=log)
+
+    # Scale and table rate the scheduler chose
+    if scheduler is not None:
+        print(format_metrics(scheduler.metrics()), file=log)
+
+    # p50/p95/p99/max of every timed stage
+    if profiler.enabled:
+        profiler.write_report(args.profile_report)
+        print(f"Profile report written to {args.profile_report}", file=log)
+
+    source.release() # Closes Webcam / replay file
+    cv2.destroyAllWindows() # Closes any OpenCV-created windows
@@ -0,0 +1,71 @@
+import argparse
+import json
+import time
+
+import cv2
+
+from Visualization.render_frame import render_frame
+from Runtime.supervisor import Supervisor, format_health
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Run several guidance stations")
+    parser.add_argument(
+        "--stations",
+        default="stations.json",
+        help="JSON file listing each station's name, source and procedure_config")
+    parser.add_argument(
+        "--display",
+        action="store_true",
+        help="show one annotated window per station")
+    parser.add_argument(
+        "--realtime",
+        action="store_true",
+        help="replay file sources at their recorded timing")
+    parser.add_argument(
+        "--health-interval",
+        type=float,
+        default=5.0,
+        help="seconds between health reports")
+    args = parser.parse_args()
+
+    with open(args.stations) as f:
+        stations = json.load(f)["stations"]
+
+    supervisor = Supervisor(stations, realtime=args.realtime)
+    supervisor.start()
+
+    last_report = time.perf_counter()
+
+    try:
+        for runner, frame, result in supervisor.results():
+
+            if args.display:
+                render_frame(
+                    frame,
+                    result["H"],
+                    result["image_pts"],
+                    result["detected_objects"],
+                    result["state"],
+                    runner.registry,
+                    runner.static_overlay,
+                    result["geometry"],
+                    result["homography_version"])
+
+                cv2.imshow(runner.name, frame)
+
+                # Press q in any window to stop every station
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+
+            # Periodic per-station health and FPS
+            now = time.perf_counter()
+            if now - last_report >= args.health_interval:
+                print(format_health(supervisor.health()))
+                last_report = now
+
+    finally:
+        print(format_health(supervisor.health()))
+        supervisor.stop()
+        cv2.destroyAllWindows()